@@ -2,19 +2,188 @@ import threading
 import time
 from dataclasses import dataclass, field
 
-from typing import Callable, List
+from typing import Callable, List, Optional
 import sys
 
-import mmap
 import struct
 import time
 import json
+import math
+
+import numpy as np
+
+import metrics
+from telemetry_source import TelemetrySource, default_telemetry_source
 
 
 POLLING_INTERVAL = 0.2	# seconds
+FAST_POLLING_INTERVAL = 0.05	# seconds, used while a PTT source is held or a radio control was just changed
+SLOW_POLLING_INTERVAL = 1.0	# seconds, used while the game is not writing new frames (paused, in menus)
+ACTIVE_HOLD_TIME = 3.0	# seconds to keep fast polling after the last radio control change
+IDLE_HOLD_TIME = 2.0	# seconds without a new frame before slowing down
+TELEMETRY_HISTORY_SIZE = 4096	# frames kept in telemetry history (several minutes at normal polling rate)
 
 MAC_PLATFORM = sys.platform == "darwin"
 
+# Values that change continuously in flight, no change callbacks are sent for them
+TELEMETRY_VARIABLES = frozenset(["AircraftTrueHeading", "AircraftLongitude", "AircraftLatitude", "AircraftAltitude", "AircraftGroundSpeed", "AircraftHeight"])
+
+def radiant_to_heading(r):
+	heading = 90 - math.degrees(r)
+	return heading % 360
+
+
+@dataclass(frozen=True, slots=True)
+class TelemetrySnapshot:
+	"""Aircraft telemetry of a single frame. Published as a whole, so all values always come from the same frame."""
+	timestamp: float = 0.0	# RadioPanel.clock() (time.monotonic() unless replaying) when the frame was decoded
+	sim_time: float = 0.0	# frame timestamp written by the DLL (accumulated sim time), in seconds
+	latitude: float = 0.0	# degrees
+	longitude: float = 0.0	# degrees
+	heading: float = 0.0	# true heading in degrees, 0-360
+	ground_speed: float = 0.0	# m/s
+	altitude: float = 0.0	# meters MSL
+	height: float = 0.0	# meters above ground
+	on_ground: float = -1.0
+	on_runway: float = -1.0
+
+	@property
+	def has_position(self) -> bool:
+		return self.latitude != 0.0 or self.longitude != 0.0
+
+	@classmethod
+	def from_panel(cls, panel, timestamp: float, sim_time: float):
+		return cls(
+			timestamp=timestamp,
+			sim_time=sim_time,
+			latitude=math.degrees(panel.AircraftLatitude),
+			longitude=math.degrees(panel.AircraftLongitude),
+			heading=radiant_to_heading(panel.AircraftTrueHeading),
+			ground_speed=panel.AircraftGroundSpeed,
+			altitude=panel.AircraftAltitude,
+			height=panel.AircraftHeight,
+			on_ground=panel.AircraftOnGround,
+			on_runway=panel.AircraftOnRunway,
+		)
+
+
+class TelemetryHistory:
+	"""Fixed-size ring buffer of telemetry frames, one NumPy column per value.
+	Appending is O(1) and memory stays constant no matter how long the flight is.
+	Timestamps are sim time, so rates are not distorted by pauses or by replaying at a different speed.
+	They never decrease: when sim time goes back (the DLL was reloaded, a new flight) the history starts over.
+	Derived rates are computed over a time window with vectorized least-squares fits."""
+
+	TIMESTAMP, LATITUDE, LONGITUDE, HEADING, GROUND_SPEED, ALTITUDE, HEIGHT = range(7)
+
+	def __init__(self, size: int = TELEMETRY_HISTORY_SIZE):
+		self.size = size
+		self._data = np.zeros((7, size))
+		self._count = 0	# total number of appended frames
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return min(self._count, self.size)
+
+	def _last_time(self) -> float:
+		return self._data[self.TIMESTAMP, (self._count - 1) % self.size]
+
+	def append(self, snapshot: TelemetrySnapshot):
+		with self._lock:
+			if self._count and snapshot.sim_time < self._last_time():
+				self._count = 0
+			self._data[:, self._count % self.size] = (snapshot.sim_time, snapshot.latitude, snapshot.longitude, snapshot.heading, snapshot.ground_speed, snapshot.altitude, snapshot.height)
+			self._count += 1
+
+	def append_unchanged(self, sim_time: float):
+		"""Record a frame that has the same values as the previous one."""
+		with self._lock:
+			if self._count == 0:
+				return
+			previous = self._data[:, (self._count - 1) % self.size].copy()
+			if sim_time < previous[self.TIMESTAMP]:
+				self._count = 0
+			column = self._count % self.size
+			self._data[:, column] = previous
+			self._data[self.TIMESTAMP, column] = sim_time
+			self._count += 1
+
+	def clear(self):
+		with self._lock:
+			self._count = 0
+
+	def window(self, seconds: float) -> np.ndarray:
+		"""Return a copy of the frames from the last `seconds`, oldest first, shape (7, n).
+		Only the window is copied: its start is found by binary search in the ordered timestamps, back from the head."""
+		with self._lock:
+			if self._count == 0:
+				return self._data[:, :0].copy()
+			timestamps = self._data[self.TIMESTAMP]
+			threshold = self._last_time() - seconds
+			head = self._count % self.size	# next column to write
+			if self._count <= self.size:
+				head = self._count
+			# Columns [0, head) are the newest frames; once the buffer has wrapped, [head, size) are the older ones
+			start = int(np.searchsorted(timestamps[:head], threshold))
+			if start > 0 or self._count <= self.size:
+				return self._data[:, start:head].copy()
+			start = head + int(np.searchsorted(timestamps[head:], threshold))
+			return np.concatenate((self._data[:, start:], self._data[:, :head]), axis=1)
+
+	@staticmethod
+	def _slope(t: np.ndarray, values: np.ndarray) -> Optional[float]:
+		# Least-squares slope, robust to uneven polling intervals
+		if len(t) < 2:
+			return None
+		t = t - t.mean()
+		denominator = np.dot(t, t)
+		if denominator == 0.0:
+			return None
+		return float(np.dot(t, values - values.mean()) / denominator)
+
+	def vertical_speed(self, seconds: float = 5.0) -> Optional[float]:
+		"""Vertical speed in m/s, positive when climbing."""
+		data = self.window(seconds)
+		return self._slope(data[self.TIMESTAMP], data[self.ALTITUDE])
+
+	def turn_rate(self, seconds: float = 5.0) -> Optional[float]:
+		"""Turn rate in degrees per second, positive when turning right."""
+		data = self.window(seconds)
+		heading = np.degrees(np.unwrap(np.radians(data[self.HEADING])))
+		return self._slope(data[self.TIMESTAMP], heading)
+
+	def acceleration(self, seconds: float = 5.0) -> Optional[float]:
+		"""Change of ground speed in m/s^2."""
+		data = self.window(seconds)
+		return self._slope(data[self.TIMESTAMP], data[self.GROUND_SPEED])
+
+	def smoothed_ground_speed(self, seconds: float = 5.0) -> Optional[float]:
+		"""Time-weighted mean ground speed in m/s."""
+		data = self.window(seconds)
+		if data.shape[1] == 0:
+			return None
+		if data.shape[1] == 1:
+			return float(data[self.GROUND_SPEED, 0])
+		t = data[self.TIMESTAMP]
+		speed = data[self.GROUND_SPEED]
+		duration = t[-1] - t[0]
+		if duration <= 0.0:
+			return float(speed.mean())
+		return float(np.dot(np.diff(t), (speed[1:] + speed[:-1]) / 2) / duration)
+
+	def ground_track(self, seconds: float = 5.0) -> Optional[float]:
+		"""Track over ground in degrees (0-360), from the positions at the start and end of the window."""
+		data = self.window(seconds)
+		if data.shape[1] < 2:
+			return None
+		lat = np.radians(data[self.LATITUDE, [0, -1]])
+		lon = np.radians(data[self.LONGITUDE, [0, -1]])
+		dlon = lon[1] - lon[0]
+		y = np.sin(dlon) * np.cos(lat[1])
+		x = np.cos(lat[0]) * np.sin(lat[1]) - np.sin(lat[0]) * np.cos(lat[1]) * np.cos(dlon)
+		if x == 0.0 and y == 0.0:
+			return None
+		return float(np.degrees(np.arctan2(y, x)) % 360)
 
 
 @dataclass
@@ -144,24 +313,59 @@ class RadioPanel:
 	_stop_flag: bool = field(default=False, init=False, repr=False)
 	_thread: threading.Thread = field(default=None, init=False, repr=False)
 	_callbacks: List[Callable[[str, float, float], None]] = field(default_factory=list, init=False, repr=False)
+	_frame_listeners: List[Callable[["TelemetrySnapshot", "TelemetryHistory"], None]] = field(default_factory=list, init=False, repr=False)
+	_source: TelemetrySource = field(default=None, init=False, repr=False)
+	clock: Callable[[], float] = field(default=None, init=False, repr=False)	# time source, replaced by a virtual clock when replaying
+
+	# Frame skipping: the DLL writes {"timestamp":<sim time>,...} every frame, the timestamp works as a generation counter
+	_last_generation: bytes = field(default=b"", init=False, repr=False)
+	_last_body: bytes = field(default=b"", init=False, repr=False)
+	_last_new_frame_time: float = field(default=0.0, init=False, repr=False)
+	_last_sim_time: float = field(default=0.0, init=False, repr=False)	# of the last frame with a readable timestamp
+	_last_control_change_time: float = field(default=0.0, init=False, repr=False)
+	_ptt_active: bool = field(default=False, init=False, repr=False)
+	_wake: threading.Event = field(default=None, init=False, repr=False)
+	framesDecoded: int = field(default=0, init=False, repr=False)
+	framesSkipped: int = field(default=0, init=False, repr=False)
+	framesDropped: int = field(default=0, init=False, repr=False)	# torn or unreadable frames
+	_snapshot: TelemetrySnapshot = field(default=None, init=False, repr=False)
+	history: TelemetryHistory = field(default=None, init=False, repr=False)
 	
-	def __new__(cls, enablePanel):
-		if MAC_PLATFORM:
-			print("RadioPanel: Mac platform is not supported.")
-			return None
-		elif not enablePanel:
+	def __new__(cls, enablePanel, source: Optional[TelemetrySource] = None):
+		if not enablePanel:
 			print("RadioPanel: Panel disabled in settings.")
 			return None
+		elif source is None and default_telemetry_source() is None:
+			if MAC_PLATFORM:
+				print("RadioPanel: Mac platform is not supported.")
+			else:
+				print("RadioPanel: no telemetry source available on this platform.")
+			return None
 			
 		return super().__new__(cls)
 
-	def __init__(self, enablePanel):
+	def __init__(self, enablePanel, source: Optional[TelemetrySource] = None):
 		
 		
 		
 		self._stop_flag = False
 		self._thread = None
 		self._callbacks = []
+		self._frame_listeners = []
+		self._source = source if source is not None else default_telemetry_source()
+		self.clock = time.monotonic
+		self._wake = threading.Event()
+		self._last_generation = b""
+		self._last_body = b""
+		self._last_new_frame_time = 0.0
+		self._last_sim_time = 0.0
+		self._last_control_change_time = 0.0
+		self._ptt_active = False
+		self.framesDecoded = 0
+		self.framesSkipped = 0
+		self.framesDropped = 0
+		self._snapshot = TelemetrySnapshot()
+		self.history = TelemetryHistory()
 	
 
 	def add_callback(self, func: Callable[[str, float, float], None]):
@@ -169,74 +373,138 @@ class RadioPanel:
 		Callback signature: (name, old_value, new_value)."""
 		self._callbacks.append(func)
 
-	shm = None
+	def add_frame_listener(self, func: Callable[[TelemetrySnapshot, TelemetryHistory], None]):
+		"""Register a function to be called with (snapshot, history) for every new decoded frame, on the polling thread.
+		Used for logic that follows continuous telemetry (flight phase), which does not get change callbacks."""
+		self._frame_listeners = self._frame_listeners + [func]	# copied, the polling thread may be iterating
+
+	def remove_frame_listener(self, func: Callable[[TelemetrySnapshot, TelemetryHistory], None]):
+		self._frame_listeners = [listener for listener in self._frame_listeners if listener != func]
+
+	def snapshot(self) -> TelemetrySnapshot:
+		"""Return telemetry of the latest decoded frame.
+		The snapshot is immutable and replaced as a whole, so it can be read from any thread without locks."""
+		return self._snapshot
+
+	def set_ptt_active(self, active: bool):
+		"""Tell the panel that a push-to-talk source (VR controller, app button) is held.
+		Polling runs at FAST_POLLING_INTERVAL while any PTT source is active."""
+		self._ptt_active = active
+		self._wake.set()
+
+	def _current_interval(self, interval: float) -> float:
+		"""Choose the next polling interval based on PTT state and recent frame activity."""
+		now = self.clock()
+		if self._ptt_active or self.AUXAudioSelectButton == 1.0 or now - self._last_control_change_time < ACTIVE_HOLD_TIME:
+			return min(interval, FAST_POLLING_INTERVAL)
+		if now - self._last_new_frame_time > IDLE_HOLD_TIME:
+			return max(interval, SLOW_POLLING_INTERVAL)
+		return interval
+
+	def _frame_time(self, generation: bytes) -> float:
+		# Sim time from the '{"timestamp":<value>' frame prefix. Without one the frame keeps the last sim time read:
+		# the clock is on another time base, in the history it would look like sim time jumped
+		try:
+			self._last_sim_time = float(generation[generation.index(b':') + 1:])
+		except ValueError:
+			pass
+		return self._last_sim_time
+
+	def _process_frame(self, data: bytes):
+		"""Decode a raw frame and fire callbacks for changed values.
+		Frames with an unchanged timestamp (generation) or unchanged content are skipped without parsing."""
+		comma_pos = data.find(b',')
+		generation = data[:comma_pos]
+		if generation == self._last_generation:
+			self.framesSkipped += 1
+			return
+
+		body = data[comma_pos:]
+		if body == self._last_body:
+			self._last_generation = generation
+			self._last_new_frame_time = self.clock()
+			self.history.append_unchanged(self._frame_time(generation))
+			self.framesSkipped += 1
+			return
+
+		# Parse before remembering the generation, so a torn read is retried on the next poll
+		decode_start = time.perf_counter()
+		game_data = json.loads(data.decode('utf-8', errors='ignore'))
+		self._last_generation = generation
+		self._last_body = body
+		self._last_new_frame_time = self.clock()
+		self.framesDecoded += 1
+
+		# Print all available keys (optional)
+		#print(f"\nAvailable data keys: {list(game_data.keys())}")
+
+		changes = []
+		for name, message in self.VARIABLE_MAP.items():
+			new_val = game_data.get(message, -9999) 
+			if new_val == -9999: # key not found, do not update this value
+				continue
+			
+			old_val = getattr(self, name)
+
+			if new_val != old_val:  # only trigger if value changed
+				# Ignore jumps to 0.0 for volume, that happens when volume control is grabbed in VR
+				if "VolumeOutput" in name and new_val == 0.0:
+					continue
+
+				setattr(self, name, new_val)
+
+				# Do not send callback for heading, speed, location and altitude changes, etc.
+				if name in TELEMETRY_VARIABLES:
+					continue
+
+				changes.append((name, old_val, new_val))
+
+		# Publish the whole frame at once (a single reference swap), before any callbacks run
+		self._snapshot = TelemetrySnapshot.from_panel(self, self._last_new_frame_time, self._frame_time(generation))
+		self.history.append(self._snapshot)
+		metrics.FRAME_DECODE.observe(time.perf_counter() - decode_start)
+
+		for listener in self._frame_listeners:
+			listener(self._snapshot, self.history)
+
+		if changes:
+			self._last_control_change_time = self._last_new_frame_time
+		for name, old_val, new_val in changes:
+			for cb in self._callbacks:
+				cb(name, old_val, new_val)
 	
+	def open_source(self) -> bool:
+		"""Open the telemetry source (shared memory, file or generator)."""
+		return self._source.open()
+
+	def poll_once(self):
+		"""Read the current frame from the telemetry source and process it.
+		Used by the polling thread, and directly when driving the panel without a thread (replay, benchmarks)."""
+		data = None
+		try:
+			data = self._source.read_frame()
+			if data:
+				self._process_frame(data)
+		except json.JSONDecodeError as e:
+			self.framesDropped += 1
+			print(f"JSON decode error: {e}\nData: ", data)
+		except Exception as e:
+			print(f"Error in polling loop: {e}\nData: ", data	)
+
 	def start_polling(self, interval: float = 0.2):
-		"""Start background thread to refresh values every `interval` seconds."""
+		"""Start background thread to refresh values every `interval` seconds.
+		The actual interval adapts between FAST_POLLING_INTERVAL and SLOW_POLLING_INTERVAL."""
 		self._stop_flag = False
 		
-		global shm
-		
-		# Open shared memory (matches the name in C++)
-		try:
-			shm = mmap.mmap(-1, 65536, "Local\\AeroflyFS4Data", access=mmap.ACCESS_READ)
-		except FileNotFoundError:
-			print("Shared memory not found. Is the game running with the DLL loaded?")
-		except KeyboardInterrupt:
-			print("\nStopped")
-			if 'shm' in locals():
-				shm.close()
-		
-			
+		self.open_source()
 
 		def _poll_loop():
 			while not self._stop_flag:
-				try:
-					# Read from shared memory
-					shm.seek(0)
-					data = shm.read(65536)
-					
-					# Find the null terminator
-					null_pos = data.find(b'\x00')
-					if null_pos > 0:
-						json_str = data[:null_pos].decode('utf-8', errors='ignore')
-						
-						# Parse JSON
-						game_data = json.loads(json_str)
-					
-						# Print all available keys (optional)
-						#print(f"\nAvailable data keys: {list(game_data.keys())}")
-						
-						for name, message in self.VARIABLE_MAP.items():
-							new_val = game_data.get(message, -9999) 
-							if new_val == -9999: # key not found, do not update this value
-								continue
-							
-							old_val = getattr(self, name)
-
-							if new_val != old_val:  # only trigger if value changed
-								# Ignore jumps to 0.0 for volume, that happens when volume control is grabbed in VR
-								if "VolumeOutput" in name and new_val == 0.0:
-									continue
-
-								setattr(self, name, new_val)
-
-								# Do not send callback for heading, speed, location and altitude changes, etc.
-								if name in ["AircraftTrueHeading", "AircraftLongitude", "AircraftLatitude", "AircraftAltitude", "AircraftGroundSpeed", "AircraftHeight"]:
-									continue
-
-								for cb in self._callbacks:
-									cb(name, old_val, new_val)
-				except json.JSONDecodeError as e:
-					print(f"JSON decode error: {e}\nData: ", data)
-				except KeyboardInterrupt:
-					print("\nStopped")
-				except Exception as e:
-					print(f"Error in polling loop: {e}\nData: ", data	)
-					
+				self.poll_once()
 				
-				
-				time.sleep(interval)
+				# Sleep until the next poll, or until woken up by a PTT change
+				self._wake.wait(self._current_interval(interval))
+				self._wake.clear()
 
 		self._thread = threading.Thread(target=_poll_loop, daemon=True)
 		self._thread.start()
@@ -244,14 +512,14 @@ class RadioPanel:
 	def stop_polling(self):
 		"""Stop the background polling thread."""
 		self._stop_flag = True
-		
-		if 'shm' in locals():
-				shm.close()
+		self._wake.set()
 				
 		if self._thread:
 			self._thread.join(timeout=1.0)
 			self._thread = None
 
+		self._source.close()
+
 
 
 def on_change(name, old, new):
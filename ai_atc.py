@@ -10,7 +10,7 @@ RADIO_CHATTER_PROBABILITY = 70.0 # 0.0-100.0 (in %), chance of radio chatter bei
 # For smaller airports (less frequencies), the chatter will be generated a bit less often. Chatter on GUARD (121.5) is rare, and frequent on CENTER (134.0).
 
 # Which AI service to use
-AI_TYPE = "OPENROUTER" # Possible values: "DEEPSEEK", "OPENAI", "OPENROUTER"
+AI_TYPE = "OPENROUTER" # Possible values: "DEEPSEEK", "OPENAI", "OPENROUTER", "LOCAL"
 
 # AI models to use. If AI_TYPE = "OPENROUTER", the model will be used through Openrouter (OPENROUTER_MODEL setting)
 # Best in my experience so far is Deepseek v3, but it is currently available only through Openrouter, and is slower than newer models.
@@ -28,6 +28,10 @@ OPENROUTER_MODEL = "google/gemini-3-flash-preview" # seems even better than deep
 #OPENROUTER_MODEL = "google/gemini-2.5-flash"
 #OPENROUTER_MODEL = "google/gemini-3.1-flash-lite-preview"
 
+# Any OpenAI-compatible server (e.g. LM Studio, Ollama, or the stand-in server in benchmarks/e2e_latency.py), used if AI_TYPE = "LOCAL"
+LOCAL_AI_BASE_URL = "http://127.0.0.1:1234/v1"
+LOCAL_AI_MODEL = "local-model"
+
 # If using Openrouter, which providers to prefer:
 OPENROUTER_PROVIDER_SORT_THROUGHOUTPUT = "throughput" 
 OPENROUTER_PROVIDER_SORT_PRICE = "price"
@@ -37,6 +41,12 @@ OPENROUTER_PROVIDER_SORT_LATENCY = "latency"
 OPENROUTER_MAX_PROMPT_PRICE = 0.8
 OPENROUTER_MAX_COMPLETION_PRICE = 3.0
 
+# AI spend budget per ATC session in USD (0.0 = no budget). When half of it is used, radio chatter becomes less frequent
+# and uses the cheaper model below, later less conversation history is sent with each message. ATC replies are never skipped.
+SESSION_AI_BUDGET = 1.0
+OPENROUTER_CHEAP_CHATTER_MODEL = "google/gemini-2.5-flash-lite"
+OPENAI_CHEAP_CHATTER_MODEL = "gpt-4.1-nano"
+
 
 # Enable interaction with the radio panel (COM1/COM2 volumes and frequencies, audio routing, transponder)
 # Currently suported only on Windows, for Cessna 172, Baron 58, DR400 and Q400 in Aerofly FS4
@@ -49,11 +59,51 @@ VR_CONTROLLER_BUTTON_ID = 1
 # Shoud airport diagrams be created?
 CREATE_AIRPORT_DIAGRAMS=False
 
+# Build airport diagrams only from OSM data cached in AirportDiagrams/OSMCache or imported from a local extract
+# (python airport_diagrams_generator.py --import extract.osm), never contacting Overpass. Also FINALCALLATC_OSM_OFFLINE=1.
+AIRPORT_DIAGRAMS_OFFLINE = False
+
+# Record radio panel/telemetry frames into Recordings folder, for replaying with telemetry_recorder.py
+RECORD_TELEMETRY = False
+
+# Record tracing spans (STT, LLM, TTS, radio effect, queue wait...) per transmission into Traces folder as Chrome trace JSON,
+# open with ui.perfetto.dev or chrome://tracing. Can also be enabled with FINALCALLATC_TRACE=1 environment variable.
+TRACE_SESSION = False
+
+# Sample the stacks of all app threads (poll loop, chatter, recognizer, playback, OpenVR, AI) and save
+# flamegraph-ready collapsed stacks into Profiles folder at exit or on SIGUSR1 / Ctrl+Break. Also FINALCALLATC_PROFILE=1.
+PROFILE_THREADS = False
+
+# Serve live metrics (queue depth, latencies, tokens, frame decoding, threads, memory) in Prometheus text format
+# at http://127.0.0.1:METRICS_PORT/metrics. The Metrics button in the app window shows them as well.
+ENABLE_METRICS_ENDPOINT = False
+METRICS_PORT = 9477
+
+# Watch main.mcf and apply flight plan, wind, visibility and aircraft changes without "reset session".
+# Only the work depending on what changed is redone: AI instructions, ATIS of the affected airports, their diagrams.
+WATCH_MAIN_MCF = True
+
 # END OF SETTINGS
 
 import RadioPanel
+import telemetry_source
+import telemetry_recorder
+import tracing
+import profiler
+import metrics
+import ai_costs
+import flight_phase
+import geodesy
+import route_geometry
+import approach_geometry
+from flight_phase import FlightPhase
 import mcfparser
+import mcf_watcher
+import task_graph
+import atis_composer
+import atis_scheduler
 import airport_diagrams_generator
+import osm_cache
 
 import glob
 from decimal import Decimal, ROUND_HALF_UP
@@ -66,7 +116,6 @@ import time
 from typing import Optional, Dict, List, Any
 from datetime import datetime
 import random
-import math
 from dotenv import load_dotenv
 import shutil
 from enum import Enum
@@ -78,6 +127,7 @@ import sys
 import os
 import io
 import atexit
+import psutil
 from pydub import AudioSegment, effects
 
 
@@ -112,14 +162,8 @@ PHONETIC_ALPHABET = [
         "Victor", "Whiskey", "X-ray", "Yankee", "Zulu"
     ]
 
-class FlightPhase(Enum):
-	ON_GROUND	= 1
-	IN_FLIGHT   = 2
-	DESCENDING  = 3
-	APPROACH    = 4
-	LANDING     = 5
-
 GAME_VARIABLES_POLLING_INTERVAL = 0.2 # Reading interval for state of radio panel controls, in seconds
+SESSION_START_TIMEOUT = 30.0 # Longest wait for AI instructions of a starting session before a pilot transmission is dropped, in seconds
 
 #Aerofly config file 
 mcf_path = None
@@ -298,8 +342,7 @@ atisPlayingOnRadio = ""
 atisThread = None
 atcSoundCOM1 = None
 atcSoundCOM2 = None
-atcChannelCOM1 = None
-atcChannelCOM2 = None
+atisLoop = None # atis_scheduler.ATISLoop playing on atisPlayingOnRadio
 ttsengine = None
 synthesizer = None
 recognizer = None
@@ -313,13 +356,16 @@ trafficChatMessageCnt = 0
 onGroundTimer = None
 readbackCheckTimer = None
 radioPlaybackQueue = []
+radioQueueEntries = {} # (enqueue time, tracing span) of queued radio messages, by file name
 radioPlaybackThread = None
-currentFlightPhase = FlightPhase.ON_GROUND
-flightPhaseThread = None
-tower_handoff_done = False
-approach_handoff_done = False
-center_handoff_done = False
+flightPhaseEngine = flight_phase.FlightPhaseEngine() # evaluated on every radio panel frame
+sessionStart = None # task_graph.TaskGraph of the last session start or reset
+atisRecordings = {} # Future of the ATIS recording being generated, by airport code
+atisWaitingFor = None # (airport code, radio) of ATIS to be played when its recording is done
+speechConfigLock = threading.Lock() # speech_config voice is set right before creating a synthesizer, from several threads
+airportDiagramsLock = threading.Lock() # one diagram generation at a time, session start and main.mcf changes both render with pyplot
 atcSessionActive = False
+sttSpan = None # speech recognition finalization span, from PTT release to recognized text
 
 recognizer_thread = None
 recognizer_controller = None
@@ -333,7 +379,8 @@ def round_half_up(n, decimals=0):
 	"""
 
 class ChatSession:
-	def __init__(self, responseFormat, system_prompt=ATC_INIT_INSTRUCTIONS, aiTools=None):
+	def __init__(self, responseFormat, system_prompt=ATC_INIT_INSTRUCTIONS, aiTools=None, callType="atc"):
+		self.callType = callType # "atc", "chatter" or "readback", for tracing
 		
 		if AI_TYPE == "DEEPSEEK":
 			self.client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
@@ -341,6 +388,8 @@ class ChatSession:
 			self.client = OpenAI(api_key=OPENROUTER_API_KEY, base_url="https://openrouter.ai/api/v1")
 		elif AI_TYPE == "OPENAI":
 			self.client = OpenAI(api_key=OPENAI_API_KEY)
+		elif AI_TYPE == "LOCAL":
+			self.client = OpenAI(api_key=os.environ.get("LOCAL_AI_API_KEY") or "local", base_url=LOCAL_AI_BASE_URL)
 		else:
 			print("Unknown AI_TYPE ", AI_TYPE, ", not creating AI session.")
 			return
@@ -362,6 +411,10 @@ class ChatSession:
 		
 	def reset_session(self, system_prompt=ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN):
 		self.messages = [{"role": "system", "content": system_prompt}]
+
+	def set_system_prompt(self, system_prompt):
+		# New instructions (changed flight plan) while keeping the conversation
+		self.messages[0] = {"role": "system", "content": system_prompt}
 		
     
 	def get_response(self, toolsAllowed, orProviderSort=OPENROUTER_PROVIDER_SORT_THROUGHOUTPUT):
@@ -371,9 +424,12 @@ class ChatSession:
 			model=OPENROUTER_MODEL
 		elif AI_TYPE == "OPENAI":
 			model=OPENAI_MODEL
+		elif AI_TYPE == "LOCAL":
+			model=LOCAL_AI_MODEL
 		else:
 			print("Unknown AI_TYPE ", AI_TYPE, ", not sending message to AI.")
 			return
+		model = budgetGovernor.model_for(self.callType, model)
 
 		aiTools = None
 		if toolsAllowed:
@@ -381,20 +437,28 @@ class ChatSession:
 
 		
 		start = time.time()	
-		response = self.client.chat.completions.create(
-			model=model,
-			messages=self.messages,
-			response_format=self.responseFormat,
-			tools=aiTools,
-			extra_body={
-				"provider": {
-					"sort": orProviderSort,
-					#"only": ["google-vertex"]
-				},
-				"max_price": {"prompt": OPENROUTER_MAX_PROMPT_PRICE, "completion": OPENROUTER_MAX_COMPLETION_PRICE}
-			}
-		)
+		messages = budgetGovernor.trim_context(self.messages)
+		with tracing.span("llm", call=self.callType, model=model, messages=len(messages)):
+			response = self.client.chat.completions.create(
+				model=model,
+				messages=messages,
+				response_format=self.responseFormat,
+				tools=aiTools,
+				extra_body={
+					"provider": {
+						"sort": orProviderSort,
+						#"only": ["google-vertex"]
+					},
+					"max_price": {"prompt": OPENROUTER_MAX_PROMPT_PRICE, "completion": OPENROUTER_MAX_COMPLETION_PRICE},
+					"usage": {"include": True} # Openrouter reports the cost of the call
+				}
+			)
 		end = time.time()
+		metrics.LLM_LATENCY.observe(end - start, call=self.callType)
+		if response.usage:
+			metrics.LLM_PROMPT_TOKENS.inc(response.usage.prompt_tokens or 0, call=self.callType)
+			metrics.LLM_COMPLETION_TOKENS.inc(response.usage.completion_tokens or 0, call=self.callType)
+			aiUsage.record(self.callType, model, response.usage.prompt_tokens or 0, response.usage.completion_tokens or 0, (response.usage.model_extra or {}).get("cost"))
 		provider = response.model_extra.get("provider") or "unknown"
 		#print(f"AI response time: {end - start:.2f} seconds, provider: {provider}")
 		#print(response)
@@ -412,8 +476,15 @@ class ChatSession:
 		return assistant_message 
 
 chatSession: Optional[ChatSession] = None	
+
+# Token usage and cost of AI calls in this session, and the governor keeping it within SESSION_AI_BUDGET.
+# Cost of models without a known price is estimated with the Openrouter price caps.
+aiUsage = ai_costs.UsageTracker((OPENROUTER_MAX_PROMPT_PRICE, OPENROUTER_MAX_COMPLETION_PRICE))
+budgetGovernor = ai_costs.BudgetGovernor(aiUsage, SESSION_AI_BUDGET,
+	{"OPENROUTER": OPENROUTER_CHEAP_CHATTER_MODEL, "OPENAI": OPENAI_CHEAP_CHATTER_MODEL}.get(AI_TYPE))
 trafficChatSession: Optional[ChatSession] = None
 
+@tracing.traced()
 def handle_tool_calls(parsed_response):
 	"""
 	Handle tool/function calls from AI response
@@ -467,6 +538,8 @@ def call_function(name, args):
 # AI tool
 def get_heading_to_approach_point(current_latitude, current_longitude):
 	print("TOOL CALL: calculate_heading called")
+	if approachGeometry:
+		return approachGeometry.vector(current_latitude, current_longitude).heading
 	return getHeadingToLocation(current_latitude, current_longitude, aeroflySettings.approach_start_latitude, aeroflySettings.approach_start_longitude)
 
 # AI tool
@@ -488,7 +561,7 @@ def doReadbackCheck(entity, atc_query):
 	READBACK_CHATTER_GENERATION_PROMPT = "You are an ATC controller in a flight simulator."
 	prompt = "You are ATC controller '" + entity + "' and gave the pilot the following instructions: '" + atc_query + "'. The pilot did not read it back. Generate ATC's question to pilot asking for the readback, for example in format similar to: '[Callsign], did you copy [instruction]?' Respond with JSON object with field READBACK_REQUEST (containing your question)."
 	
-	readbackChatSession = ChatSession(READBACK_RESPONSE_FORMAT, READBACK_CHATTER_GENERATION_PROMPT, aiTools=None)
+	readbackChatSession = ChatSession(READBACK_RESPONSE_FORMAT, READBACK_CHATTER_GENERATION_PROMPT, aiTools=None, callType="readback")
 
 	readbackChatSession.add_user_message(prompt)
 	toolsAllowed = False
@@ -520,36 +593,18 @@ def getHeadingToLocation(currentLatitude, currentLongitude, destLatitude, destLo
 		135.23  # Heading from San Francisco to Los Angeles
 	"""
 	
-	# Convert degrees to radians
-	lat1 = math.radians(currentLatitude)
-	lon1 = math.radians(currentLongitude)
-	lat2 = math.radians(destLatitude)
-	lon2 = math.radians(destLongitude)
-
-	# Calculate the differences
-	dlon = lon2 - lon1
-
-	# Calculate the bearing using the formula
-	y = math.sin(dlon) * math.cos(lat2)
-	x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
-
-	# Calculate the initial bearing in radians
-	bearing_rad = math.atan2(y, x)
+	return geodesy.reference(destLatitude, destLongitude).bearing_from(currentLatitude, currentLongitude)
 
-	# Convert to degrees and normalize to 0-360
-	bearing_deg = math.degrees(bearing_rad)
-	heading = (bearing_deg + 360) % 360
 
-	return heading
-
-
-def getRelativePositionDescription():
-	if not radioPanel or not radioPanel.AircraftLatitude or not radioPanel.AircraftLongitude:
+def getRelativePositionDescription(telemetry=None):
+	if telemetry is None and radioPanel:
+		telemetry = radioPanel.snapshot()
+	if not telemetry or not telemetry.has_position:
 		return "unknown position"
 	
 	# Get relative position of the plane to the destination airport
-	currentLatitude = round(math.degrees(radioPanel.AircraftLatitude), 5) 
-	currentLongitude = round(math.degrees(radioPanel.AircraftLongitude), 5) 
+	currentLatitude = telemetry.latitude
+	currentLongitude = telemetry.longitude
 	distanceToDestination = getDistanceToLocation(currentLatitude, currentLongitude, aeroflySettings.destination_airport_latitude, aeroflySettings.destination_airport_longitude)
 	distancetoOrigin = getDistanceToLocation(currentLatitude, currentLongitude, aeroflySettings.origin_airport_latitude, aeroflySettings.origin_airport_longitude)
 	headingToDestination = getHeadingToLocation(currentLatitude, currentLongitude, aeroflySettings.destination_airport_latitude, aeroflySettings.destination_airport_longitude)
@@ -565,45 +620,11 @@ def bearingToDirection(heading_deg: float) -> str:
     Convert a heading to a location (degrees) into a relative cardinal direction 
     (from that location back to you).
     """
-    # Step 1: Compute reciprocal bearing
-    reciprocal = (heading_deg + 180) % 360
-
-    # Step 2: Define compass sectors
-    directions = [
-        ("N",   337.5, 360.0),
-        ("N",     0.0, 22.5),
-        ("NE",   22.5, 67.5),
-        ("E",    67.5, 112.5),
-        ("SE",  112.5, 157.5),
-        ("S",   157.5, 202.5),
-        ("SW",  202.5, 247.5),
-        ("W",   247.5, 292.5),
-        ("NW",  292.5, 337.5),
-    ]
-
-    # Step 3: Find matching direction
-    for dir_name, start, end in directions:
-        if start <= reciprocal < end:
-            return dir_name
-
-    # Just in case (should never happen)
-    return "Unknown"
+    return geodesy.bearing_to_direction(heading_deg)
 
 def getDistanceToLocation(currentLatitude, currentLongitude, destLatitude, destLongitude):
-	# Calculate distance in nautical miles between two lat/lon points using Haversine formula
-		
-	R = 6371.0  # Earth radius in kilometers
-	lat1 = math.radians(currentLatitude)
-	lon1 = math.radians(currentLongitude)
-	lat2 = math.radians(destLatitude)
-	lon2 = math.radians(destLongitude)
-	dlon = lon2 - lon1
-	dlat = lat2 - lat1
-	a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-	c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-	distance_km = R * c
-	distance_nm = distance_km * 0.539957  # Convert km to nautical miles
-	return distance_nm
+	# Calculate distance in nautical miles between two lat/lon points using Haversine formula, destination trig terms are cached
+	return geodesy.reference(destLatitude, destLongitude).distance_nm(currentLatitude, currentLongitude)
 
 
 
@@ -652,9 +673,10 @@ def getReachableFrequencies():
 
 	currentLatitude = 0.0
 	currentLongitude = 0.0
-	if radioPanel.AircraftLatitude and radioPanel.AircraftLongitude:
-		currentLatitude = round(math.degrees(radioPanel.AircraftLatitude), 5)
-		currentLongitude = round(math.degrees(radioPanel.AircraftLongitude), 5)
+	if radioPanel:
+		telemetry = radioPanel.snapshot()
+		currentLatitude = telemetry.latitude
+		currentLongitude = telemetry.longitude
 	
 	# Add reachable frequencies from origin. If current location is unknown, station reach will be ignored
 	distanceFromOrigin = 0.0
@@ -770,6 +792,7 @@ def radioTunedToFrequency(senderFrequency):
 		return ""
 
 
+@tracing.traced()
 def canPilotBeHeard():
 	# Can anyone hear the pilot on the transmitting frequency?
 	global aeroflySettings
@@ -837,10 +860,7 @@ def pilotTransmittingFrequency():
 
 	return pilotTransmittingFrequency
 
-def radiant_to_heading(r):
-    heading = 90 - math.degrees(r)
-    return heading % 360
-
+@tracing.traced()
 def sendMessageToAI(cleanedtext):
 	print("sendMessageToAI: ", cleanedtext)
 	timestamp = datetime.now().strftime("%H:%M:%S")
@@ -854,11 +874,13 @@ def sendMessageToAI(cleanedtext):
 	if readbackCheckTimer and readbackCheckTimer.is_alive():
 		readbackCheckTimer.cancel()  # Cancel any existing readback check timer
 	
+	telemetry = None
 	if radioPanel:
-		currentHeading = "Heading " + str(int(radiant_to_heading(radioPanel.AircraftTrueHeading)))
-		currentLocation = ", location Latitude: " + str(round(math.degrees(radioPanel.AircraftLatitude), 5)) + ", location Longitude: " + str(round(math.degrees(radioPanel.AircraftLongitude),5))
-		currentGroundspeed = ", Groundspeed " + str(int(radioPanel.AircraftGroundSpeed * 1.94384)) + " kn" # convert m/s to knots
-		currentAltitude = round(radioPanel.AircraftAltitude,0) * FEET_IN_METER
+		telemetry = radioPanel.snapshot()
+		currentHeading = "Heading " + str(int(telemetry.heading))
+		currentLocation = ", location Latitude: " + str(round(telemetry.latitude, 5)) + ", location Longitude: " + str(round(telemetry.longitude, 5))
+		currentGroundspeed = ", Groundspeed " + str(int(telemetry.ground_speed * 1.94384)) + " kn" # convert m/s to knots
+		currentAltitude = round(telemetry.altitude, 0) * FEET_IN_METER
 
 	# Send squawk code if transponder is ON or squawk + altitude if on ALT
 	transponderCode = "0000"
@@ -889,7 +911,12 @@ def sendMessageToAI(cleanedtext):
 	else:
 		telemetryMessage += ", Transmitting on the right frequency. "
 
-	telemetryMessage += getRelativePositionDescription()
+	telemetryMessage += getRelativePositionDescription(telemetry)
+	routePosition = flightPhaseEngine.routePosition
+	if routePosition:
+		telemetryMessage += " " + routePosition.describe()
+	if approachGeometry and telemetry and telemetry.has_position:
+		telemetryMessage += " " + approachGeometry.describe(telemetry.latitude, telemetry.longitude)
 	
 	
 	
@@ -925,83 +952,119 @@ def sendMessageToAI(cleanedtext):
 
 
 def startATCSession():
-	global chatSession
-	global radioPanel
 	global entityVoices
-	global atcSessionStarted
 	global atcSessionActive
 	atcSessionActive = True
-	currentFlightPhase = FlightPhase.ON_GROUND
-
-	radioPanel = None
-	radioPanel = RadioPanel.RadioPanel(ENABLE_RADIO_PANEL) # start reading radio panel
-	print(radioPanel)
-	if radioPanel:
-		radioPanel.add_callback(onGameVariableChange)
-		radioPanel.start_polling(GAME_VARIABLES_POLLING_INTERVAL)
 
-	loadAeroflySettings() # reload Aerofly settings
-	chatSession = ChatSession(ATC_RESPONSE_FORMAT, ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN, None) #ATC_AI_TOOLS)
+	print(aiUsage.summary())
+	aiUsage.reset()
 	deleteRadioLogFiles()
 	entityVoices = {}
 	print("AI ATC SESSION START command")
-	say("ATC session started")
-	writeRadioLogToFile()
-	currentFlightPhase = FlightPhase.ON_GROUND
-	tower_handoff_done = False
-	
-	atcSessionStarted = True
-	global chatterTimer
-	if chatterTimer:
-		chatterTimer.cancel()
-	chatterTimer = threading.Timer(10, createRadioExchange)
-	chatterTimer.start() # Generate radio chatter
-
-	# Start flight phase thread
-	global flightPhaseThread
-	flightPhaseThread = threading.Thread(target=flight_phase_tick, daemon=True)
-	flightPhaseThread.start()
-	
+	runSessionStart("ATC session started", True)
 
 def resetATCSession():
-	global chatSession
 	global entityVoices
 	global atcSessionActive
 	atcSessionActive = True
-	currentFlightPhase = FlightPhase.ON_GROUND
 
-	loadAeroflySettings() # reload Aerofly settings
 	#chatSession.reset_session()
-	chatSession = ChatSession(ATC_RESPONSE_FORMAT, ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN, None) #ATC_AI_TOOLS)
+	print(aiUsage.summary())
+	aiUsage.reset()
 	deleteRadioLogFiles()
 	entityVoices = {}
 	print("AI ATC SESSION RESET command")
-	say("ATC session reset")
-	writeRadioLogToFile()
-	currentFlightPhase = FlightPhase.ON_GROUND
-	tower_handoff_done = False
+	runSessionStart("ATC session reset", False)
+
+def runSessionStart(announcement, newRadioPanel):
+	# Session start as a graph of tasks running in parallel. Pilot transmissions are accepted as soon as the
+	# AI instructions are ready; ATIS recordings, diagrams, radio log and the announcement finish in the background.
+	global sessionStart
+	graph = task_graph.TaskGraph("session_start")
+	if newRadioPanel:
+		graph.add("radio_panel", startRadioPanel)
+	graph.add("announce", lambda: say(announcement))
+	graph.add("settings", lambda: loadSessionSettings(graph))
+	graph.add("prompt", startChatSession, after=["settings"])
+	# Frames reach the flight phase engine only after it was reset, which needs the new radio panel
+	graph.add("flight_phase", resetFlightPhase, after=["settings", "radio_panel"] if newRadioPanel else ["settings"])
+	graph.add("origin_atis", lambda: generateAirportATIS(True), after=["settings"])
+	graph.add("destination_atis", lambda: generateAirportATIS(False), after=["settings"])
+	if CREATE_AIRPORT_DIAGRAMS:
+		graph.add("diagrams", generateAirportDiagrams, after=["settings"])
+	graph.add("radio_log", writeRadioLogToFile, after=["prompt"])
+	graph.add("chatter", startRadioChatter, after=["prompt"])
+	sessionStart = graph.start()
+
+def waitForSessionStart():
+	# True when the AI session is ready for pilot transmissions
+	if sessionStart and not sessionStart.wait("prompt", SESSION_START_TIMEOUT):
+		print("ATC session not ready, message not sent")
+		return False
+	return True
+
+def loadSessionSettings(graph):
+	loadAeroflySettings(generateATIS=False, generateDiagrams=False) # reload Aerofly settings
+	# ATIS recordings are generated next, tuning to them meanwhile plays them when done
+	for task, airportCode in (("origin_atis", aeroflySettings.origin_name), ("destination_atis", aeroflySettings.destination_name)):
+		if task == "destination_atis" and airportCode == aeroflySettings.origin_name:
+			continue # same airport, the origin task makes its recording
+		if airportCode:
+			future = graph.futures[task]
+			atisRecordings[airportCode] = future
+			future.add_done_callback(lambda f, airportCode=airportCode: onATISRecordingDone(airportCode))
+
+def startRadioPanel():
+	global radioPanel
+	if radioPanel:
+		radioPanel.stop_polling()
+	radioPanel = None
+	source = telemetry_source.default_telemetry_source()
+	if RECORD_TELEMETRY and source:
+		source = telemetry_recorder.RecordingSource(source, telemetry_recorder.new_recording_path())
+	radioPanel = RadioPanel.RadioPanel(ENABLE_RADIO_PANEL, source) # start reading radio panel
+	print(radioPanel)
+	if radioPanel:
+		radioPanel.add_callback(onGameVariableChange)
+		radioPanel.start_polling(GAME_VARIABLES_POLLING_INTERVAL)
+
+def startChatSession():
+	global chatSession
+	global atcSessionStarted
+	chatSession = ChatSession(ATC_RESPONSE_FORMAT, ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN, None) #ATC_AI_TOOLS)
+	atcSessionStarted = True
 
+def startRadioChatter():
 	global chatterTimer
 	if chatterTimer:
 		chatterTimer.cancel()
 	chatterTimer = threading.Timer(10, createRadioExchange)
 	chatterTimer.start() # Generate radio chatter
 
-	
-
 def stopATCSession():
 	global atcSessionActive
 	atcSessionActive = False
 	
 	say("ATC session stopped.")
+	print(aiUsage.summary())
 	global chatterTimer
 	if chatterTimer:
 		chatterTimer.cancel()
 
 	if radioPanel:
 		radioPanel.AUXAudioSelectButton = -1.0 # To prevent mic getting activated on the next session start
+
+	tracing.dump()
 	
 def recognized_handler(evt):
+	# Continue the transmission started by PTT press, if the recognition was ended by PTT release
+	global sttSpan
+	if sttSpan:
+		tracing.set_transmission(sttSpan.transmission)
+		sttSpan.finish()
+		sttSpan = None
+	else:
+		tracing.start_transmission()
 	trySendingMessage(evt.result.text)		
 			
 def trySendingMessage(message):
@@ -1031,9 +1094,10 @@ def trySendingMessage(message):
 		return
 			
 	
-	if not atcSessionStarted:
+	if not atcSessionStarted and not sessionStart:
 		startATCSession()
-		time.sleep(0.5) # give it a moment to start properly
+	if not waitForSessionStart():
+		return
 
 	if not canPilotBeHeard():
 		return
@@ -1041,7 +1105,7 @@ def trySendingMessage(message):
 	global communicationWithAIInProgress
 	communicationWithAIInProgress = True
 	#print(timestamp + " sending speech to AI")
-	ai_thread = threading.Thread(target=sendMessageToAI, args=(cleanedtext,), daemon=True)
+	ai_thread = threading.Thread(target=tracing.bind(sendMessageToAI), args=(cleanedtext,), daemon=True)
 	ai_thread.start()
 			
 
@@ -1200,8 +1264,9 @@ def printATCInstructions(instructions, aiComment, withTimestamp):
 
 
 def say(text):
-	speech_config.speech_synthesis_voice_name = 'en-US-GuyNeural'
-	synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config)
+	with speechConfigLock:
+		speech_config.speech_synthesis_voice_name = 'en-US-GuyNeural'
+		synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config)
 	result = synthesizer.speak_text_async(text).get()
 
 
@@ -1233,14 +1298,18 @@ def sayWithRadioEffect(entityName, message, receivingRadio, blocking, filePrefix
 	# set voice for entity
 	voice = get_entity_voice(entityName)
 	#print("Assigned voice " + voice + " to entity " + entityName)
-	speech_config.speech_synthesis_voice_name = voice
 	
 	soundID = random.randint(10000, 99999)
 	
 	cleanRecordingFileName = os.path.join("Temp", filePrefix + "_clean_tts_" + str(soundID) + ".wav")
 	audio_config = speechsdk.audio.AudioOutputConfig(filename=cleanRecordingFileName)
-	synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config,audio_config=audio_config)
-	result = synthesizer.speak_text_async(message).get()
+	with speechConfigLock:
+		speech_config.speech_synthesis_voice_name = voice
+		synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config,audio_config=audio_config)
+	ttsStart = time.perf_counter()
+	with tracing.span("tts", voice=voice, characters=len(message)):
+		result = synthesizer.speak_text_async(message).get()
+	metrics.TTS_LATENCY.observe(time.perf_counter() - ttsStart)
 	
 	try:
 		if (result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted):
@@ -1255,6 +1324,7 @@ def sayWithRadioEffect(entityName, message, receivingRadio, blocking, filePrefix
 
 	# Add audio to playback queue
 	global radioPlaybackQueue
+	radioQueueEntries[radioEffectRecordingFileName] = (time.perf_counter(), tracing.start_span("queue_wait", prefix=filePrefix))
 	radioPlaybackQueue.append((radioEffectRecordingFileName, receivingRadio, blocking, filePrefix))
 
 def playRadioMessageFromQueue():
@@ -1301,9 +1371,17 @@ def playRadioMessageFromQueue():
 			print("Unknown receiving radio, not playing atc sound: ", receivingRadio)
 			return
 
+		queueEntry = radioQueueEntries.pop(radioEffectRecordingFileName, None)
+		if queueEntry:
+			enqueueTime, queueSpan = queueEntry
+			metrics.RADIO_QUEUE_WAIT.observe(time.perf_counter() - enqueueTime, prefix=filePrefix)
+			queueSpan.finish(queueDepth=len(radioPlaybackQueue))
+			tracing.set_transmission(queueSpan.transmission)
+
 		if blocking:
-			while channel.get_busy():
-				time.sleep(0.5) 
+			with tracing.span("playback", radio=receivingRadio):
+				while channel.get_busy():
+					time.sleep(0.5) 
 
 		# Remove the item from queue
 		radioPlaybackQueue.pop(0)
@@ -1312,20 +1390,24 @@ def playRadioMessageFromQueue():
 		time.sleep(3.0)
 
 
+@tracing.traced("radio_effect")
+def radioFilter(audio):
+	# Bandpass filter (300–3400 Hz)
+	audio = audio.low_pass_filter(3400)
+	audio = audio.high_pass_filter(300)
+
+	# Add compression (normalize)
+	return effects.compress_dynamic_range(audio)
+
 def addRadioEffectToRecording(fileName, newFileName):
+	dspStart = time.perf_counter()
 	# Load the clean TTS
 	audio = AudioSegment.from_wav(fileName)
 
 	# --- Radio Effect ---
 	# Convert to mono, 8kHz
 	audio = audio.set_channels(1).set_frame_rate(8000)
-
-	# Bandpass filter (300–3400 Hz)
-	audio = audio.low_pass_filter(3400)
-	audio = audio.high_pass_filter(300)
-
-	# Add compression (normalize)
-	audio = effects.compress_dynamic_range(audio)
+	audio = radioFilter(audio)
 
 	# Add light static noise
 	#noise = AudioSegment.white_noise(duration=len(audio)).apply_gain(-35)  # subtle
@@ -1340,6 +1422,7 @@ def addRadioEffectToRecording(fileName, newFileName):
 
 	# Save processed audio
 	audio.export(newFileName, format="wav")
+	metrics.DSP_TIME.observe(time.perf_counter() - dspStart)
 
 	return audio
 
@@ -1357,6 +1440,7 @@ def controllerInputListen():
 
 	vr_system = openvr.VRSystem()
 	global radioButtonHeld
+	global sttSpan
 	
 	# Mask for button
 	button_mask = 1 << VR_CONTROLLER_BUTTON_ID
@@ -1382,13 +1466,18 @@ def controllerInputListen():
 				else:
 					radioButtonHeld = False
 					
+				if was_pressed != radioButtonHeld and radioPanel:
+					radioPanel.set_ptt_active(radioButtonHeld)
+
 				if was_pressed and not radioButtonHeld:
 					#print("radio button not held any more, stopping speech recognition")
+					sttSpan = tracing.start_span("stt_finalize")
 					pygame.mixer.Sound('radio-off.mp3').play()
 					recognizer.stop_continuous_recognition()
 					
 				elif not was_pressed and radioButtonHeld:
 					print("radio button is held")
+					tracing.start_transmission()
 					pygame.mixer.Sound('radio-on.mp3').play()
 					recognizer.start_continuous_recognition()
 					 
@@ -1435,7 +1524,8 @@ class AeroflySettings:
 		origin_airport_longitude: float = 0.0,
 		departure_runway_ils_frequency: float = 0.0,
 		destination_airport_latitude: float = 0.0,
-		destination_airport_longitude: float = 0.0
+		destination_airport_longitude: float = 0.0,
+		time_utc_hours: float = 0.0
 	):
 		
 		self.destination_runway_longitude = destination_runway_longitude
@@ -1460,17 +1550,19 @@ class AeroflySettings:
 		self.departure_runway_ils_frequency = departure_runway_ils_frequency
 		self.destination_airport_latitude = destination_airport_latitude
 		self.destination_airport_longitude = destination_airport_longitude
+		self.time_utc_hours = time_utc_hours # sim time when main.mcf was loaded
+		self.loaded_at = time.time()
 		
 	
 
 aeroflySettings = None
+routeGeometry = None # all waypoints and legs of the flight plan, route_geometry.RouteGeometry
+approachGeometry = None # final approach of the destination runway, approach_geometry.ApproachGeometry
 airports = None
 
-def loadAeroflySettings():
-	global aeroflySettings
-	global mcf_path
-	aeroflySettings = AeroflySettings()
-	
+mcfWatcher = None # mcf_watcher.McfWatcher, started in main() when WATCH_MAIN_MCF is set
+
+def loadAeroflySettings(generateATIS=True, generateDiagrams=True):
 	# Create the parser factory
 	parser = mcfparser.MainMcfFactory()
 	
@@ -1481,95 +1573,165 @@ def loadAeroflySettings():
 		
 		# Parse the content
 		parsed_data = parser.create(mcf_content)
+		if mcfWatcher:
+			mcfWatcher.set_baseline(parsed_data)
+		applyMainMcf(parsed_data)
 		
-		aeroflySettings.wind_strength = parsed_data.wind['strength'] * WIND_SPEED_100_PERCENT_IN_KNOTS
-		aeroflySettings.wind_direction_in_degree = parsed_data.wind['direction_in_degree']
-		aeroflySettings.aircraft_model = parsed_data.aircraft['name']
-		aeroflySettings.cruise_altitude = parsed_data.navigation['Route']['CruiseAltitude'] * FEET_IN_METER
-		aeroflySettings.visibility = parsed_data.visibility
-		
-		# Access the parsed data
-		#print(f"Aircraft: {parsed_data.aircraft['name']}")
-		#print(f"Position: {parsed_data.flight_setting['position']}")
-		#print(f"Visibility: {parsed_data.visibility}")
-		#print(f"Wind Strength: {parsed_data.wind['strength']}")
-		#print(f"Wind direction_in_degree: {parsed_data.wind['direction_in_degree']}")
-		
-		# Access waypoints
-		#print(f"\nNumber of waypoints: {len(parsed_data.navigation['Route']['Ways'])}")
-		for i, waypoint in enumerate(parsed_data.navigation['Route']['Ways']):
-			#print(f"Waypoint {i+1}: {waypoint.Identifier} at {waypoint.Position}. Type:{waypoint.type}. Direction:{waypoint.Direction}")
-			if (waypoint.type == mcfparser.MissionCheckpointType.DESTINATION_RUNWAY):
-				# Get location of the destination runway and approach start point
-				lat_deg, lon_deg, alt_m = mcfparser.ecef_to_lla(waypoint.Position[0], waypoint.Position[1], waypoint.Position[2])
-				aeroflySettings.destination_runway_longitude = lon_deg
-				aeroflySettings.destination_runway_latitude = lat_deg
-				aeroflySettings.destination_runway = waypoint.Identifier
-				approach_distance_km = 10
-				approach_lat_deg, approach_lon_deg, approach_alt_m = mcfparser.offset_position((waypoint.Position[0], waypoint.Position[1], waypoint.Position[2]), (waypoint.Direction[0], waypoint.Direction[1], waypoint.Direction[2]), approach_distance_km)["lla"]
-				aeroflySettings.approach_start_longitude = approach_lon_deg
-				aeroflySettings.approach_start_latitude = approach_lat_deg
-				
-			elif (waypoint.type == mcfparser.MissionCheckpointType.DESTINATION):
-				aeroflySettings.destination_name = waypoint.Identifier
-				aeroflySettings.destination_runway_altitude_msl = waypoint.Elevation * FEET_IN_METER
-				lat_deg, lon_deg, alt_m = mcfparser.ecef_to_lla(waypoint.Position[0], waypoint.Position[1], waypoint.Position[2])
-				aeroflySettings.destination_airport_latitude = lat_deg
-				aeroflySettings.destination_airport_longitude = lon_deg
-			elif (waypoint.type == mcfparser.MissionCheckpointType.ORIGIN):
-				aeroflySettings.origin_name = waypoint.Identifier
-				lat_deg, lon_deg, alt_m = mcfparser.ecef_to_lla(waypoint.Position[0], waypoint.Position[1], waypoint.Position[2])
-				aeroflySettings.origin_airport_latitude = lat_deg
-				aeroflySettings.origin_airport_longitude = lon_deg
-			elif (waypoint.type == mcfparser.MissionCheckpointType.DEPARTURE_RUNWAY):
-				aeroflySettings.departure_runway = waypoint.Identifier
-		
-		#print("Aerofly settings loaded: ", aeroflySettings.__dict__)
-
-		originAirportName = get_airport_name(aeroflySettings.origin_name)
-		destinationAirportName = get_airport_name(aeroflySettings.destination_name)
-		origFreqs = get_airport_frequencies(aeroflySettings.origin_name)
-		aeroflySettings.origin_airport_atis_frequency = getATISFrequency(origFreqs)
-		originAirportFrequencies = ", ".join(f"{f['description']}:{f['frequency_mhz']}" for f in origFreqs)
-		destFreqs = get_airport_frequencies(aeroflySettings.destination_name)
-		aeroflySettings.destination_airport_atis_frequency = getATISFrequency(destFreqs)
-		destinationAirportFrequencies = ", ".join(f"{f['description']}:{f['frequency_mhz']}" for f in destFreqs)
-
-		aeroflySettings.departure_runway_ils_frequency = get_runway_ils_frequency(aeroflySettings.origin_name, aeroflySettings.departure_runway)
-		aeroflySettings.destination_runway_ils_frequency = get_runway_ils_frequency(aeroflySettings.destination_name, aeroflySettings.destination_runway)
-		
-		# add flight plan to AI ATC instructions
-		global ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN
-		ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN = (ATC_INIT_INSTRUCTIONS + 
-			" Wind direction in degrees is " + str(aeroflySettings.wind_direction_in_degree) +
-			". Wind strength in knots is " + str(aeroflySettings.wind_strength) +
-			#". My aircraft model is " + radioPanel.AircraftName +
-			". My flight plan is: cruise altitude " + str(int(aeroflySettings.cruise_altitude)) + " feet. " + 
-			". Origin airport code: " + aeroflySettings.origin_name + ", origin airport name: " + originAirportName + "(frequencies:" + originAirportFrequencies + ")" +
-			". Departure runway: "  + aeroflySettings.departure_runway + 
-			". Destination airport code: " + aeroflySettings.destination_name + ", destination airport name: " + destinationAirportName + "(frequencies:" + destinationAirportFrequencies + ")" +
-			". Destination runway latitude: "  + str(aeroflySettings.destination_runway_latitude) +
-			". Destination runway longitude: "  + str(aeroflySettings.destination_runway_longitude) +
-			". Destination runway: "  + aeroflySettings.destination_runway +
-			". Destination elevation: " + str(int(aeroflySettings.destination_runway_altitude_msl)) + " feet " +
-			". Approach start waypoint latitude: " + str(aeroflySettings.approach_start_latitude) + 
-			". Approach start waypoint longitude: " + str(aeroflySettings.approach_start_longitude) + 
-			". When I ask for vector for runway, calculate it using my current position towards the approach start waypoint.")
-			
-		
-		generateATISRecording(aeroflySettings.origin_name, originAirportName, None, aeroflySettings.departure_runway, aeroflySettings.wind_strength, aeroflySettings.wind_direction_in_degree, aeroflySettings.visibility)
-		generateATISRecording(aeroflySettings.destination_name, destinationAirportName, None, aeroflySettings.destination_runway, aeroflySettings.wind_strength, aeroflySettings.wind_direction_in_degree, aeroflySettings.visibility)
+		atisScheduler.set_airports([aeroflySettings.origin_name, aeroflySettings.destination_name])
+		if generateATIS:
+			for airport in dict.fromkeys([aeroflySettings.origin_name, aeroflySettings.destination_name]): # once if origin is destination
+				atisScheduler.refresh(airport)
 
 		# Generate airport diagrams
-		if CREATE_AIRPORT_DIAGRAMS:
+		if CREATE_AIRPORT_DIAGRAMS and generateDiagrams:
 			thread = threading.Thread(target=generateAirportDiagrams, daemon=True)
 			thread.start()
 		
 
 	except FileNotFoundError:
 		print("Error: main.mcf file not found")
+		clearAeroflySettings()
 	except Exception as e:
 		print(f"Error parsing file: {e}")
+		clearAeroflySettings()
+
+def clearAeroflySettings():
+	global aeroflySettings
+	global routeGeometry
+	global approachGeometry
+	aeroflySettings = AeroflySettings()
+	routeGeometry = None
+	approachGeometry = None
+
+def applyMainMcf(parsed_data):
+	# Aerofly settings, route and approach geometry and AI instructions from parsed main.mcf.
+	# Built into new objects and assigned at the end, other threads never see half-updated settings.
+	global aeroflySettings
+	global routeGeometry
+	global approachGeometry
+	settings = AeroflySettings()
+	newApproachGeometry = None
+
+	settings.wind_strength = parsed_data.wind['strength'] * WIND_SPEED_100_PERCENT_IN_KNOTS
+	settings.wind_direction_in_degree = parsed_data.wind['direction_in_degree']
+	settings.aircraft_model = parsed_data.aircraft['name']
+	settings.cruise_altitude = parsed_data.navigation['Route']['CruiseAltitude'] * FEET_IN_METER
+	settings.visibility = parsed_data.visibility
+	settings.time_utc_hours = parsed_data.time_utc['time_hours']
+	
+	# Access the parsed data
+	#print(f"Aircraft: {parsed_data.aircraft['name']}")
+	#print(f"Position: {parsed_data.flight_setting['position']}")
+	#print(f"Visibility: {parsed_data.visibility}")
+	#print(f"Wind Strength: {parsed_data.wind['strength']}")
+	#print(f"Wind direction_in_degree: {parsed_data.wind['direction_in_degree']}")
+	
+	# Access waypoints, all converted to lat/lon at once
+	#print(f"\nNumber of waypoints: {len(parsed_data.navigation['Route']['Ways'])}")
+	newRouteGeometry = route_geometry.RouteGeometry.from_waypoints(parsed_data.navigation['Route']['Ways'])
+	for i, waypoint in enumerate(parsed_data.navigation['Route']['Ways']):
+		lat_deg, lon_deg = float(newRouteGeometry.latitudes[i]), float(newRouteGeometry.longitudes[i])
+		#print(f"Waypoint {i+1}: {waypoint.Identifier} at {waypoint.Position}. Type:{waypoint.type}. Direction:{waypoint.Direction}")
+		if (waypoint.type == mcfparser.MissionCheckpointType.DESTINATION_RUNWAY):
+			# Get location of the destination runway and approach start point
+			settings.destination_runway_longitude = lon_deg
+			settings.destination_runway_latitude = lat_deg
+			settings.destination_runway = waypoint.Identifier
+			newApproachGeometry = approach_geometry.ApproachGeometry.from_waypoint(waypoint)
+			settings.approach_start_longitude = newApproachGeometry.approach_start_longitude
+			settings.approach_start_latitude = newApproachGeometry.approach_start_latitude
+			
+		elif (waypoint.type == mcfparser.MissionCheckpointType.DESTINATION):
+			settings.destination_name = waypoint.Identifier
+			settings.destination_runway_altitude_msl = waypoint.Elevation * FEET_IN_METER
+			settings.destination_airport_latitude = lat_deg
+			settings.destination_airport_longitude = lon_deg
+		elif (waypoint.type == mcfparser.MissionCheckpointType.ORIGIN):
+			settings.origin_name = waypoint.Identifier
+			settings.origin_airport_latitude = lat_deg
+			settings.origin_airport_longitude = lon_deg
+		elif (waypoint.type == mcfparser.MissionCheckpointType.DEPARTURE_RUNWAY):
+			settings.departure_runway = waypoint.Identifier
+	
+	#print("Aerofly settings loaded: ", settings.__dict__)
+
+	originAirportName = get_airport_name(settings.origin_name)
+	destinationAirportName = get_airport_name(settings.destination_name)
+	origFreqs = get_airport_frequencies(settings.origin_name)
+	settings.origin_airport_atis_frequency = getATISFrequency(origFreqs)
+	originAirportFrequencies = ", ".join(f"{f['description']}:{f['frequency_mhz']}" for f in origFreqs)
+	destFreqs = get_airport_frequencies(settings.destination_name)
+	settings.destination_airport_atis_frequency = getATISFrequency(destFreqs)
+	destinationAirportFrequencies = ", ".join(f"{f['description']}:{f['frequency_mhz']}" for f in destFreqs)
+
+	settings.departure_runway_ils_frequency = get_runway_ils_frequency(settings.origin_name, settings.departure_runway)
+	settings.destination_runway_ils_frequency = get_runway_ils_frequency(settings.destination_name, settings.destination_runway)
+	
+	# add flight plan to AI ATC instructions
+	global ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN
+	ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN = (ATC_INIT_INSTRUCTIONS + 
+		" Wind direction in degrees is " + str(settings.wind_direction_in_degree) +
+		". Wind strength in knots is " + str(settings.wind_strength) +
+		#". My aircraft model is " + radioPanel.AircraftName +
+		". My flight plan is: cruise altitude " + str(int(settings.cruise_altitude)) + " feet. " + 
+		". Origin airport code: " + settings.origin_name + ", origin airport name: " + originAirportName + "(frequencies:" + originAirportFrequencies + ")" +
+		". Departure runway: "  + settings.departure_runway + 
+		". Route (course, distance): " + (newRouteGeometry.describe() if newRouteGeometry else "unknown") +
+		". Destination airport code: " + settings.destination_name + ", destination airport name: " + destinationAirportName + "(frequencies:" + destinationAirportFrequencies + ")" +
+		". Destination runway latitude: "  + str(settings.destination_runway_latitude) +
+		". Destination runway longitude: "  + str(settings.destination_runway_longitude) +
+		". Destination runway: "  + settings.destination_runway +
+		". Destination elevation: " + str(int(settings.destination_runway_altitude_msl)) + " feet " +
+		". Approach start waypoint latitude: " + str(settings.approach_start_latitude) + 
+		". Approach start waypoint longitude: " + str(settings.approach_start_longitude) + 
+		(". Final approach course: " + str(int(round(newApproachGeometry.final_course)) % 360) if newApproachGeometry else "") +
+		". When I ask for vectors for the runway, give the vector heading and glide path altitude precomputed in the telemetry, do not calculate headings yourself.")
+
+	aeroflySettings = settings
+	routeGeometry = newRouteGeometry
+	approachGeometry = newApproachGeometry
+
+def onMainMcfChanged(change):
+	# Called on the watcher thread after main.mcf changed. Redo only the work depending on the changed sections.
+	print("main.mcf changed: " + ", ".join(sorted(change.sections)))
+	previous = aeroflySettings
+	try:
+		applyMainMcf(change.new)
+	except Exception as e:
+		print(f"Error applying main.mcf changes: {e}")
+		return
+	settings = aeroflySettings
+
+	# AI instructions include route, wind and aircraft, the conversation so far is kept
+	if chatSession and atcSessionStarted:
+		chatSession.set_system_prompt(ATC_INIT_INSTRUCTIONS_WITH_FLIGHT_PLAN)
+
+	if mcf_watcher.ROUTE in change.sections:
+		# New geofences and route projection, the current flight phase is kept
+		flightPhaseEngine.set_flight_plan(*flightPlanPositions(), routeGeometry)
+
+	# ATIS of an airport depends on the airport, its runway in use, wind and visibility.
+	# The scheduler follows the new origin and destination, each changed airport gets one new letter
+	atisScheduler.set_airports([settings.origin_name, settings.destination_name])
+	weather = (settings.wind_strength, settings.wind_direction_in_degree, settings.visibility)
+	previousWeather = (previous.wind_strength, previous.wind_direction_in_degree, previous.visibility) if previous else None
+	changedAirports = {}
+	for airport, runway, previousAirport, previousRunway in (
+		(settings.origin_name, settings.departure_runway, previous and previous.origin_name, previous and previous.departure_runway),
+		(settings.destination_name, settings.destination_runway, previous and previous.destination_name, previous and previous.destination_runway)):
+		if airport and (weather != previousWeather or (airport, runway) != (previousAirport, previousRunway)):
+			changedAirports[airport] = True
+	for airport in changedAirports:
+		print("Regenerating ATIS for " + airport)
+		atisScheduler.refresh(airport) # new information letter, playing ATIS switches to it at the end of its loop
+
+	if CREATE_AIRPORT_DIAGRAMS and previous:
+		origin = settings.origin_name != previous.origin_name
+		destination = settings.destination_name != previous.destination_name
+		if origin or destination:
+			# Fetching and rendering take seconds, the watcher must keep picking up main.mcf edits meanwhile
+			thread = threading.Thread(target=generateAirportDiagrams, args=(origin, destination), daemon=True)
+			thread.start()
 
 def getATISFrequency(frequencies):
     """Searches a list of frequency dicts and returns the ATIS frequency."""
@@ -1578,7 +1740,29 @@ def getATISFrequency(frequencies):
             return freq_item.get("frequency_mhz")
     return None  # Return None if ATIS is not found
 
-def generateATISRecording(airportCode, airportName, time, runway, wind_strength, wind_direction_in_degree, visibility):
+def generateAirportATIS(origin):
+	# ATIS of the origin or destination airport, as a session start task
+	if origin:
+		airportCode = aeroflySettings.origin_name
+	else:
+		airportCode = aeroflySettings.destination_name
+		if airportCode == aeroflySettings.origin_name:
+			return # same airport, one recording (same file) made by the origin task
+	if not airportCode:
+		return
+	atisScheduler.refresh(airportCode)
+
+def onATISRecordingDone(airportCode):
+	global atisWaitingFor
+	if atisRecordings.get(airportCode) and not atisRecordings[airportCode].done():
+		return # newer recording of the same airport in progress
+	if atisWaitingFor and atisWaitingFor[0] == airportCode:
+		radio = atisWaitingFor[1]
+		atisWaitingFor = None
+		print("ATIS recording for " + airportCode + " is ready, playing it")
+		startPlayingATIS(airportCode, radio)
+
+def generateATISRecording(airportCode, airportName, time, runway, wind_strength, wind_direction_in_degree, visibility, informationVersion=None):
 	
 	visibilityDescription = None
 	if visibility >= 0.7:
@@ -1596,40 +1780,52 @@ def generateATISRecording(airportCode, airportName, time, runway, wind_strength,
 	else:
 		visibilityDescription = "less than one quarter mile"
 
-	informationVersion = random.choice(PHONETIC_ALPHABET)
-	
-	message = airportName + " Information " + informationVersion + ", time 0900 Zulu. Runway in use " + runway + ". Wind " + str(int(wind_direction_in_degree)) + " degrees at " + str(int(wind_strength)) + " knots. Visibility " + visibilityDescription + ". No significant weather. Temperature one eight, dewpoint one zero. QNH one zero one three. On first radio contact, advise you have Information " + informationVersion + "."
+	if informationVersion is None:
+		informationVersion = random.choice(PHONETIC_ALPHABET)
 	
+	# Assembled from cached fragments, Azure is called only for fragments never synthesized before (e.g. a new airport name)
 	atisTempFilename = os.path.join("Temp", airportCode + "_atis_temp.wav")
 	atisFilename = os.path.join("Temp", airportCode + "_atis.wav")
-	global speech_config
-	audio_config = speechsdk.audio.AudioOutputConfig(filename=atisTempFilename)
-	speech_config.speech_synthesis_voice_name = 'en-US-ChristopherNeural'
-	synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config,audio_config=audio_config)
-	
-	
-	ssml_string = f"""
-    <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-US'>
-        
-		<voice name='en-US-ChristopherNeural' style="calm">
-            <prosody rate='{"+10%"}'>
-                {message}
-            </prosody>
-        </voice>
-    </speak>
-    """
+	audio = atisComposer.compose_atis(airportName, informationVersion, time or "0900", runway, wind_direction_in_degree, wind_strength, visibilityDescription)
+	audio.export(atisTempFilename, format="wav")
+	os.replace(atisTempFilename, atisFilename)
+	return audio
 
-	result = synthesizer.speak_ssml_async(ssml_string).get()
+def synthesizeSSMLToFile(ssml, fileName):
+	# Speech synthesis into a wav file, True if successful
+	audio_config = speechsdk.audio.AudioOutputConfig(filename=fileName)
+	with speechConfigLock:
+		synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config,audio_config=audio_config)
+	result = synthesizer.speak_ssml_async(ssml).get()
 
-	if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-		print("Speech synthesized successfully.")
-	elif result.reason == speechsdk.ResultReason.Canceled:
+	if result.reason == speechsdk.ResultReason.Canceled:
 		cancellation_details = result.cancellation_details
 		print(f"Speech synthesis canceled: {cancellation_details.reason}")
 		if cancellation_details.reason == speechsdk.CancellationReason.Error:
 			print(f"Error details: {cancellation_details.error_details}")
+	return result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted
+
+atisComposer = atis_composer.ATISComposer(synthesizeSSMLToFile, radioFilter)
+
+def getATISTime():
+	# Sim time in Zulu (HHMM) from main.mcf, advanced by the time since it was loaded
+	hours = (aeroflySettings.time_utc_hours + (time.time() - aeroflySettings.loaded_at) / 3600) % 24
+	minutes = int(hours * 60)
+	return f"{minutes // 60:02d}{minutes % 60:02d}"
+
+def generateScheduledATIS(airportCode, informationVersion):
+	# Called by atisScheduler (never on the playback thread), returns the new recording or None without ATIS to generate
+	settings = aeroflySettings
+	if airportCode == settings.destination_name:
+		runway = settings.destination_runway
+	elif airportCode == settings.origin_name:
+		runway = settings.departure_runway
+	else:
+		return None
+	generateATISRecording(airportCode, get_airport_name(airportCode), getATISTime(), runway, settings.wind_strength, settings.wind_direction_in_degree, settings.visibility, informationVersion)
+	return os.path.join("Temp", airportCode + "_atis.wav")
 
-	audio = addRadioEffectToRecording(atisTempFilename, atisFilename)
+atisScheduler = atis_scheduler.ATISScheduler(generateScheduledATIS, PHONETIC_ALPHABET)
 
 def onGroundEvent():
 	print("Detected landing.")
@@ -1639,6 +1835,8 @@ def onGroundEvent():
 def onGameVariableChange(name, old, new):
 	global atcSoundCOM1
 	global atcSoundCOM2
+	global atisPlaying
+	global atisPlayingOnRadio
 	
 	if (name in {"SenderTransponderIdent",}):
 		return
@@ -1668,9 +1866,13 @@ def onGameVariableChange(name, old, new):
 	if name == "COM1VolumeOutput":
 		if atcSoundCOM1 is not None:
 			atcSoundCOM1.set_volume(new)
+		if atisLoop is not None and atisPlayingOnRadio == "COM1":
+			atisLoop.set_volume(new)
 	elif name == "COM2VolumeOutput":
 		if atcSoundCOM2 is not None:
 			atcSoundCOM2.set_volume(new)
+		if atisLoop is not None and atisPlayingOnRadio == "COM2":
+			atisLoop.set_volume(new)
 
 	if name == "TransponderIdentButton" and old == 0.0 and new == 1.0:
 		print("Transponder IDENT button pressed.")
@@ -1698,8 +1900,6 @@ def onGameVariableChange(name, old, new):
 	# TODO react on transponder code change
 
 	# React if we tune to ATIS freq
-	global atisPlaying
-	global atisPlayingOnRadio
 	if not atisPlaying:
 		if (name == "COM1Frequency" or name == "COM1AudioSelectButton") and radioPanel.COM1AudioSelectButton:
 			if aeroflySettings.origin_airport_atis_frequency and aeroflySettings.origin_airport_atis_frequency >= radioPanel.COM1Frequency/1000000 - 0.01 and aeroflySettings.origin_airport_atis_frequency <= radioPanel.COM1Frequency/1000000 + 0.01:
@@ -1735,12 +1935,18 @@ def handleIdentButtonPress():
 
 def startPlayingATIS(airportCode, atisPlayingOn):
 	stopPlayingATIS()
-	atisFilename = os.path.join("Temp", airportCode + "_atis.wav")
+	global atisWaitingFor
+	pending = atisRecordings.get(airportCode)
+	if pending is not None and not pending.done():
+		print("ATIS recording for " + airportCode + " not ready yet, it will play when done")
+		atisWaitingFor = (airportCode, atisPlayingOn)
+		if pending.done(): # finished meanwhile
+			onATISRecordingDone(airportCode)
+		return
 	global atisPlaying
 	global atisPlayingOnRadio 
 	global atisThread
-	global atcChannelCOM1
-	global atcChannelCOM2
+	global atisLoop
 	global atcSoundCOM1
 	global atcSoundCOM2
 
@@ -1756,39 +1962,40 @@ def startPlayingATIS(airportCode, atisPlayingOn):
 	if atisPlayingOnRadio == "COM1":
 		if atcSoundCOM1 is not None:
 			atcSoundCOM1.stop()
-		atcSoundCOM1 = pygame.mixer.Sound(atisFilename)
-		atcSoundCOM1.set_volume(COM1VolumeOutput)
-		atisPlaying = True
-		atcChannelCOM1 = atcSoundCOM1.play(loops=-1)
+		volume = COM1VolumeOutput
 	elif atisPlayingOnRadio == "COM2":
 		if atcSoundCOM2 is not None:
 			atcSoundCOM2.stop()
-		atcSoundCOM2 = pygame.mixer.Sound(atisFilename)
-		atcSoundCOM2.set_volume(COM2VolumeOutput)
-		atisPlaying = True
-		atcChannelCOM2 = atcSoundCOM2.play(loops=-1)
+		volume = COM2VolumeOutput
 	else:
 		print("Unknown receiving radio, not playing ATIS sound: ", atisPlayingOnRadio)
+		return
+
+	# Looped by the scheduler's double buffer, a new ATIS information starts at the end of the current loop
+	atisLoop = atis_scheduler.ATISLoop(atisScheduler, airportCode, volume)
+	if atisLoop.start():
+		atisPlaying = True
+	else:
+		print("No ATIS recording for " + airportCode)
+		atisLoop = None
 	
 	
 
 def stopPlayingATIS():
 	print("Stopping ATIS playback.")
+	global atisWaitingFor
+	atisWaitingFor = None
 	global atisPlaying
 	global atisThread
 	global atisPlayingOnRadio
-	global atcChannelCOM1
-	global atcChannelCOM2
+	global atisLoop
 
 	
 	
-	if atisPlayingOnRadio == "COM1":
-		if atcChannelCOM1 is not None:
-			atcChannelCOM1.stop()
-	elif atisPlayingOnRadio == "COM2":
-		if atcChannelCOM2 is not None:
-			atcChannelCOM2.stop()
-	else:
+	if atisLoop is not None:
+		atisLoop.stop()
+		atisLoop = None
+	elif atisPlayingOnRadio:
 		print("Unknown receiving radio, not stopping ATIS sound: ", atisPlayingOnRadio)
 
 	atisPlaying = False
@@ -1813,6 +2020,8 @@ def setAeroflyVolume(volume=0.4):
 			continue
 
 def safe_shutdown():
+	profiler.stop()
+	profiler.dump(clear=True)
 	if not MAC_PLATFORM:
 		print("Shutting down OpenVR")
 		openvr.shutdown()
@@ -1914,6 +2123,7 @@ def write_lines_with_paragraph(pdf_path, lines, firstLineInBold, withFlightPlan)
 	doc.build(story)
 
 # Write entire message and debug history to PDF files
+@tracing.traced()
 def writeRadioLogToFile():
 	global aeroflySettings
 	
@@ -1967,7 +2177,8 @@ def writeRadioLogToFile():
 # Create radio chatter between other pilots and ATC
 def createRadioExchange():
 	global chatterTimer
-	if RADIO_CHATTER_PROBABILITY == 0.0:
+	chatterProbability = budgetGovernor.chatter_probability(RADIO_CHATTER_PROBABILITY)
+	if chatterProbability == 0.0:
 		chatterTimer = threading.Timer(RADIO_CHATTER_TIMER, createRadioExchange)
 		chatterTimer.start() 
 		return
@@ -2000,7 +2211,7 @@ def createRadioExchange():
 	# print("random station: ", randomStation)
 	airportSizeModifier = float(randomStation["airportSizeModifier"])
 	randomNum = float(random.randint(0, 100))
-	if RADIO_CHATTER_PROBABILITY * airportSizeModifier <= randomNum:
+	if chatterProbability * airportSizeModifier <= randomNum:
 		#print("Skipping radio exchange generation due to probability setting (rnd=" + str(randomNum) + ", airportSizeModifier=" + str(airportSizeModifier) + ", RADIO_CHATTER_PROBABILITY * airportSizeModifier=" + str(RADIO_CHATTER_PROBABILITY * airportSizeModifier))
 		chatterTimer = threading.Timer(RADIO_CHATTER_TIMER, createRadioExchange)
 		chatterTimer.start() 
@@ -2032,7 +2243,7 @@ def createRadioExchange():
 		trafficChatMessageCnt = 0
 
 	if not trafficChatSession:
-		trafficChatSession = ChatSession(CHATTER_RESPONSE_FORMAT, RADIO_CHATTER_GENERATION_PROMPT, aiTools=None)
+		trafficChatSession = ChatSession(CHATTER_RESPONSE_FORMAT, RADIO_CHATTER_GENERATION_PROMPT, aiTools=None, callType="chatter")
 
 	trafficChatSession.add_user_message(prompt)
 	toolsAllowed = False
@@ -2091,26 +2302,28 @@ def createRadioExchange():
 	chatterTimer = threading.Timer(RADIO_CHATTER_TIMER, createRadioExchange)
 	chatterTimer.start() 
 
-def generateAirportDiagrams():
-	if not aeroflySettings:
-		print("Aerofly settings not loaded, cannot generate airport diagrams")
-		return
+def generateAirportDiagrams(origin=True, destination=True):
+	# Serialized by airportDiagramsLock, callers run it on their own thread
+	with airportDiagramsLock:
+		if not aeroflySettings:
+			print("Aerofly settings not loaded, cannot generate airport diagrams")
+			return
 	
-	if not aeroflySettings.origin_name or not aeroflySettings.destination_name:
-		print("Origin or destination airport not set, cannot generate airport diagrams")
-		return
+		if not aeroflySettings.origin_name or not aeroflySettings.destination_name:
+			print("Origin or destination airport not set, cannot generate airport diagrams")
+			return
 	
-	# Origin airport
-	originDiagramPath = airport_diagrams_generator.generateAirportDiagram(aeroflySettings.origin_name)
-	if originDiagramPath:
-		genericOriginFileName = os.path.join("AirportDiagrams", "origin_airport_diagram.pdf")
-		shutil.copy2(originDiagramPath, genericOriginFileName)
+		# Origin airport
+		originDiagramPath = airport_diagrams_generator.generateAirportDiagram(aeroflySettings.origin_name) if origin else None
+		if originDiagramPath:
+			genericOriginFileName = os.path.join("AirportDiagrams", "origin_airport_diagram.pdf")
+			shutil.copy2(originDiagramPath, genericOriginFileName)
 	
-	# Destination airport
-	destinationDiagramPath = airport_diagrams_generator.generateAirportDiagram(aeroflySettings.destination_name)
-	if destinationDiagramPath:
-		genericDestinationFileName = os.path.join("AirportDiagrams", "destination_airport_diagram.pdf")
-		shutil.copy2(destinationDiagramPath, genericDestinationFileName)
+		# Destination airport
+		destinationDiagramPath = airport_diagrams_generator.generateAirportDiagram(aeroflySettings.destination_name) if destination else None
+		if destinationDiagramPath:
+			genericDestinationFileName = os.path.join("AirportDiagrams", "destination_airport_diagram.pdf")
+			shutil.copy2(destinationDiagramPath, genericDestinationFileName)
 
 def deleteRadioLogFiles():
 	file_path = "RadioLog.pdf"
@@ -2139,8 +2352,11 @@ def on_test_transmit_press(event):
 	global button_held
 	button_held = True
 	print("test transmit button pressed")
+	tracing.start_transmission()
 	
 	pygame.mixer.Sound('radio-on.mp3').play()
+	if radioPanel:
+		radioPanel.set_ptt_active(True)
 	
 	recognizer.start_continuous_recognition()
 	global communicationWithAIInProgress
@@ -2151,111 +2367,60 @@ def on_test_transmit_release(event):
 	global button_held
 	button_held = False
 	print("test transmit button released")
+	global sttSpan
+	sttSpan = tracing.start_span("stt_finalize")
 	pygame.mixer.Sound('radio-off.mp3').play()
+	if radioPanel:
+		radioPanel.set_ptt_active(False)
 
 	recognizer.stop_continuous_recognition()
 
-def flight_phase_tick():
-	while atcSessionActive:
-		global currentFlightPhase
-
-		#print("Height: ", radioPanel.AircraftHeight)
-
-		if currentFlightPhase == FlightPhase.ON_GROUND and radioPanel and radioPanel.AircraftGroundSpeed > 40 and radioPanel.AircraftHeight > 50:
-				# we probably took off, so switch to in flight phase
-				currentFlightPhase = FlightPhase.IN_FLIGHT
-				print("Flight phase changed to IN_FLIGHT")
-
-				# Initiate tower frequency handoff right after takeoff
-				message = "Automatic message: plane has taken off, send frequency handover instructions."
-				sendMessageToAI(message)
-
-		elif currentFlightPhase != FlightPhase.ON_GROUND and radioPanel and radioPanel.AircraftGroundSpeed < 30 and radioPanel.AircraftHeight < 10:
-				# we probably landed, so switch to on ground phase
-				currentFlightPhase = FlightPhase.ON_GROUND
-				print("Flight phase changed to ON_GROUND")
-
-				message = "Automatic message: plane has landed, send instructions for leaving the runway."
-				sendMessageToAI(message)
-
-		elif currentFlightPhase == FlightPhase.IN_FLIGHT:
-			distanceFromOriginToDestination = getDistanceToLocation(aeroflySettings.origin_airport_latitude, aeroflySettings.origin_airport_longitude, aeroflySettings.destination_runway_latitude, aeroflySettings.destination_runway_longitude)
-		
-			if distanceFromOriginToDestination > 40: # Only do handoff checks if we are on a longer flight
-				check_destination_tower_handoff()
-				check_destination_approach_handoff()
-				check_center_handoff()
-
-		time.sleep(3) # Check every 5 seconds
-
-	
-
-def check_destination_tower_handoff():
-	# Check whether we are close enough to the destination airport and low enough to initiate tower handoff, if we are not already in tower handoff. We do this by calculating the distance from our current position to the destination runway, and checking our altitude. If we are close enough and low enough, we send a message to the AI to initiate tower handoff.
-	
-	global tower_handoff_done
-	if tower_handoff_done:
-		return
-
-	currentLatitude = round(math.degrees(radioPanel.AircraftLatitude), 5) 
-	currentLongitude = round(math.degrees(radioPanel.AircraftLongitude), 5) 
-	distanceToDestination = getDistanceToLocation(currentLatitude, currentLongitude, aeroflySettings.destination_runway_latitude, aeroflySettings.destination_runway_longitude)
-    
-	# Core conditions
-	close_enough  = distanceToDestination < 8
-	low_enough    = radioPanel.AircraftHeight < 1000 # in meters
-		
-
-	if close_enough and low_enough:
-		print("Plane is close_enough and low_enough for tower handoff, sending message to AI")
-		tower_handoff_done = True
-		message = "Automatic message: plane is close to landing, send frequency handover instructions to tower frequency. If this is sent on the tower frequency, or if there is no tower on the destination airport, send blank response in ATC_VOICE."
-		sendMessageToAI(message)
+def flightPlanPositions():
+	# (latitude, longitude) of origin airport, destination runway and approach start point
+	return ((aeroflySettings.origin_airport_latitude, aeroflySettings.origin_airport_longitude),
+		(aeroflySettings.destination_runway_latitude, aeroflySettings.destination_runway_longitude),
+		(aeroflySettings.approach_start_latitude, aeroflySettings.approach_start_longitude))
 
+def resetFlightPhase():
+	# New flight on ground at the origin airport, with the route from the loaded flight plan.
+	# Frames are held back from the engine until it and the telemetry history are reset, so rates
+	# and phases of the previous flight do not leak into the new one
+	if radioPanel:
+		radioPanel.remove_frame_listener(flightPhaseEngine.on_frame)
+		radioPanel.history.clear()
+	flightPhaseEngine.reset(*flightPlanPositions(), routeGeometry)
+	if radioPanel:
+		radioPanel.add_frame_listener(flightPhaseEngine.on_frame)
 
-def check_destination_approach_handoff():
-	# Similar to tower handoff, but for approach frequency handoff. We check if we are close enough to the approach start waypoint, and if we are low enough, to initiate approach handoff.
-
-	global approach_handoff_done
-	if approach_handoff_done or tower_handoff_done:
-		return
-
-	
-
-	currentLatitude = round(math.degrees(radioPanel.AircraftLatitude), 5)
-	currentLongitude = round(math.degrees(radioPanel.AircraftLongitude), 5)
-	distanceToApproachStartWaypoint = getDistanceToLocation(currentLatitude, currentLongitude, aeroflySettings.approach_start_latitude, aeroflySettings.approach_start_longitude)
-
-	#print("Checking destination approach handoff conditions.distanceToApproachStartWaypoint=" + str(distanceToApproachStartWaypoint))
-
-	# Core conditions
-	close_enough  = distanceToApproachStartWaypoint < 15
+def sendAutomaticMessage(message):
+	# Flight phase events arrive on the radio panel polling thread, which must not wait for the AI
+	threading.Thread(target=tracing.bind(sendMessageToAI), args=(message,), daemon=True).start()
 
-	if close_enough:
-		print("Plane is close_enough for destination approach handoff, sending message to AI")
-		approach_handoff_done = True
-		message = "Automatic message: plane is close to destination, send frequency handover instructions to destination approach frequency. If there is no approach ATC at destination, handoff to destination tower frequency. If unable, handoff to any appropriate service at destination. If unable, send blank response in ATC_VOICE."
-		sendMessageToAI(message)
+def onFlightPhaseChanged(event):
+	print(f"Flight phase changed from {event.previous.name} to {event.phase.name}, {event.distance_to_go:.1f} nm to go")
 
-def check_center_handoff():
-	# When we get far enough from the departure airport, we can initiate center handoff. We check the distance from our current position to the departure airport, and if we are far enough, we send a message to the AI to initiate center handoff.
+	if event.phase == FlightPhase.IN_FLIGHT and event.previous == FlightPhase.ON_GROUND:
+		# Initiate tower frequency handoff right after takeoff
+		sendAutomaticMessage("Automatic message: plane has taken off, send frequency handover instructions.")
+	elif event.phase == FlightPhase.ON_GROUND:
+		sendAutomaticMessage("Automatic message: plane has landed, send instructions for leaving the runway.")
 
-	global center_handoff_done
-	if center_handoff_done or approach_handoff_done:
-		return
+def onTowerHandoff(event):
+	print("Plane is close enough and low enough for tower handoff, sending message to AI")
+	sendAutomaticMessage("Automatic message: plane is close to landing, send frequency handover instructions to tower frequency. If this is sent on the tower frequency, or if there is no tower on the destination airport, send blank response in ATC_VOICE.")
 
-	currentLatitude = round(math.degrees(radioPanel.AircraftLatitude), 5)
-	currentLongitude = round(math.degrees(radioPanel.AircraftLongitude), 5)
-	distanceFromDeparture = getDistanceToLocation(currentLatitude, currentLongitude, aeroflySettings.origin_airport_latitude, aeroflySettings.origin_airport_longitude)
+def onApproachHandoff(event):
+	print("Plane is close enough for destination approach handoff, sending message to AI")
+	sendAutomaticMessage("Automatic message: plane is close to destination, send frequency handover instructions to destination approach frequency. If there is no approach ATC at destination, handoff to destination tower frequency. If unable, handoff to any appropriate service at destination. If unable, send blank response in ATC_VOICE.")
 
-	# Core conditions
-	far_enough  = distanceFromDeparture > 15
+def onCenterHandoff(event):
+	print("Plane is far enough from departure airport for center handoff, sending message to AI")
+	sendAutomaticMessage("Automatic message: plane is far from departure airport, send frequency handover instructions to center frequency. If the handover to center frequency has already been instructed, send blank response in ATC_VOICE.")
 
-	if far_enough:
-		print("Plane is far_enough from departure airport for center handoff, sending message to AI")
-		center_handoff_done = True
-		message = "Automatic message: plane is far from departure airport, send frequency handover instructions to center frequency. If the handover to center frequency has already been instructed, send blank response in ATC_VOICE."
-		sendMessageToAI(message)
+flightPhaseEngine.subscribe(onFlightPhaseChanged, [flight_phase.PHASE_CHANGED])
+flightPhaseEngine.subscribe(onTowerHandoff, [flight_phase.TOWER_HANDOFF])
+flightPhaseEngine.subscribe(onApproachHandoff, [flight_phase.APPROACH_HANDOFF])
+flightPhaseEngine.subscribe(onCenterHandoff, [flight_phase.CENTER_HANDOFF])
 
 
 
@@ -2295,6 +2460,12 @@ def createAppWindow():
 	tbutton = tk.Button(root, text="Test", command=testButton)
 	#tbutton.place(x=10,y=100)	
 
+	metricsBtn = tk.Button(root, text="Metrics", command=lambda: openMetricsWindow(root))
+	if MAC_PLATFORM:
+		metricsBtn.place(x=700,y=50)
+	else:
+		metricsBtn.place(x=700,y=50, width=60, height=30)
+
 	atc_font = tkfont.Font(family="Courier New", size=18)
 	atc_text_box = tk.Text(root, height=6, width=55, font=atc_font, fg='#000000', bg='#ffffff', bd=0, highlightthickness=0, wrap="word")
 	atc_text_box.grid(row=1, column=0, sticky="nsew", padx=10, pady=120)
@@ -2304,6 +2475,34 @@ def createAppWindow():
 
 
 
+def registerMetrics():
+	# Values read when metrics are shown or scraped
+	process = psutil.Process()
+	metrics.REGISTRY.gauge("atc_radio_playback_queue_depth", "Messages waiting in radioPlaybackQueue", lambda: len(radioPlaybackQueue))
+	metrics.REGISTRY.gauge("atc_radiopanel_frames_decoded", "RadioPanel frames decoded this session", lambda: radioPanel.framesDecoded if radioPanel else 0)
+	metrics.REGISTRY.gauge("atc_radiopanel_frames_skipped", "RadioPanel frames skipped as unchanged this session", lambda: radioPanel.framesSkipped if radioPanel else 0)
+	metrics.REGISTRY.gauge("atc_radiopanel_frames_dropped", "RadioPanel frames dropped as torn or unreadable this session", lambda: radioPanel.framesDropped if radioPanel else 0)
+	metrics.REGISTRY.gauge("atc_llm_session_cost_usd", "Estimated AI cost of the current session", lambda: aiUsage.totalCost)
+	metrics.REGISTRY.gauge("atc_llm_cost_usd_per_hour", "Estimated AI cost per hour in the current session", aiUsage.cost_per_hour)
+	metrics.REGISTRY.gauge("atc_llm_budget_used_ratio", "Part of SESSION_AI_BUDGET used", budgetGovernor.fraction)
+	metrics.REGISTRY.gauge("process_threads", "Python threads running", threading.active_count)
+	metrics.REGISTRY.gauge("process_resident_memory_bytes", "Resident memory size", lambda: process.memory_info().rss)
+
+def openMetricsWindow(root):
+	window = tk.Toplevel(root)
+	window.title("ATC metrics")
+	window.geometry("900x400")
+	text = tk.Text(window, font=("Courier New", 10), wrap="none")
+	text.pack(fill="both", expand=True)
+
+	def refresh():
+		if not window.winfo_exists():
+			return
+		text.delete("1.0", tk.END)
+		text.insert(tk.END, metrics.REGISTRY.render_summary())
+		window.after(1000, refresh)
+	refresh()
+
 def testButton():
 	createRadioExchange()
 	
@@ -2312,6 +2511,7 @@ def onTransmitTextBtnSubmit():
 	global entry
 	value = entry.get()
 	print("Entry value:", value)
+	tracing.start_transmission()
 	trySendingMessage(value)
 
 
@@ -2323,6 +2523,17 @@ def main():
 	if MAC_PLATFORM:
 		print("Mac platform detected, some features may not work (radio panel, volume controls).")
 
+	if TRACE_SESSION:
+		tracing.enable()
+	if PROFILE_THREADS or profiler.enabled_by_environment():
+		profiler.start()
+	if AIRPORT_DIAGRAMS_OFFLINE:
+		osm_cache.offline = True
+
+	registerMetrics()
+	if ENABLE_METRICS_ENDPOINT:
+		metrics.start_http_server(METRICS_PORT)
+
 	clearTempFolder()
 	#clearTempFolder("chatter")
 	
@@ -2351,8 +2562,14 @@ def main():
 	speech_config = speechsdk.SpeechConfig(subscription=MSSPEECH_API_KEY, region=MSSPEECH_API_REGION)
 	speech_config.speech_synthesis_voice_name = "en-US-GuyNeural"
 
-	# Load Aerofly settings from main.mcf file
+	# Load Aerofly settings from main.mcf file, and apply later changes of it automatically
+	global mcfWatcher
+	if WATCH_MAIN_MCF and mcf_path:
+		mcfWatcher = mcf_watcher.McfWatcher(mcf_path, onMainMcfChanged)
 	loadAeroflySettings()
+	if mcfWatcher:
+		mcfWatcher.start()
+	atisScheduler.start() # new ATIS information every hour
 
 	# Register callback for OpenVR shutdown
 	if not MAC_PLATFORM:
@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+
+# Known list prices in USD per million (prompt, completion) tokens, used when the provider does not report the cost.
+# OpenRouter reports the actual cost of each call, so its models do not need to be listed.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+	"gpt-4.1": (2.0, 8.0),
+	"gpt-4.1-mini": (0.4, 1.6),
+	"gpt-4.1-nano": (0.1, 0.4),
+	"gpt-4o-mini": (0.15, 0.6),
+	"deepseek-chat": (0.28, 0.42),
+	"local-model": (0.0, 0.0),
+}
+
+# Budget fractions at which the governor steps in
+CHATTER_REDUCTION_START = 0.5	# chatter probability goes down linearly from here to zero at the budget
+CHEAP_CHATTER_MODEL_FROM = 0.5	# chatter uses the cheaper model from here
+CONTEXT_LIMITS = [(0.6, 24), (0.8, 12), (1.0, 6)]	# (budget fraction, max messages sent to AI besides the system prompt)
+
+LLM_COST = metrics.REGISTRY.counter("atc_llm_cost_usd_total", "Estimated AI cost in USD", ("call",))
+
+
+class UsageTracker:
+	"""Token usage and cost per call type ("atc", "chatter", "readback") for the current session."""
+
+	def __init__(self, defaultPrices: Tuple[float, float] = (0.0, 0.0)):
+		self.defaultPrices = defaultPrices	# per million tokens, for models without a known price
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			self.sessionStart = time.time()
+			self.calls: Dict[str, dict] = {}
+			self.totalCost = 0.0
+
+	def record(self, callType: str, model: str, promptTokens: int, completionTokens: int, cost: Optional[float] = None) -> float:
+		"""Add a call's usage. cost is the provider-reported cost in USD, estimated from token prices if None."""
+		if cost is None:
+			promptPrice, completionPrice = MODEL_PRICES.get(model, self.defaultPrices)
+			cost = (promptTokens * promptPrice + completionTokens * completionPrice) / 1e6
+		with self._lock:
+			totals = self.calls.setdefault(callType, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+			totals["calls"] += 1
+			totals["prompt_tokens"] += promptTokens
+			totals["completion_tokens"] += completionTokens
+			totals["cost"] += cost
+			self.totalCost += cost
+		LLM_COST.inc(cost, call=callType)
+		return cost
+
+	def cost_per_hour(self) -> float:
+		hours = (time.time() - self.sessionStart) / 3600.0
+		# Do not extrapolate the first minutes (session start has a long system prompt)
+		return self.totalCost / max(hours, 0.1)
+
+	def summary(self) -> str:
+		with self._lock:
+			parts = [f"{callType}: {t['calls']} calls, {t['prompt_tokens']}+{t['completion_tokens']} tokens, ${t['cost']:.4f}" for callType, t in self.calls.items()]
+		return f"AI cost this session ${self.totalCost:.4f} (${self.cost_per_hour():.3f}/h). " + "; ".join(parts)
+
+
+class BudgetGovernor:
+	"""Reduces AI spend as the session approaches its budget: less chatter, cheaper chatter model, shorter context.
+	ATC replies to the pilot are never skipped."""
+
+	def __init__(self, usage: UsageTracker, budget: float, cheapChatterModel: Optional[str] = None):
+		self.usage = usage
+		self.budget = budget	# USD per session, 0 = unlimited
+		self.cheapChatterModel = cheapChatterModel
+		self._lastLevel = None
+
+	def fraction(self) -> float:
+		if self.budget <= 0:
+			return 0.0
+		return self.usage.totalCost / self.budget
+
+	def chatter_probability(self, probability: float) -> float:
+		f = self.fraction()
+		if f < CHATTER_REDUCTION_START:
+			return probability
+		if f >= 1.0:
+			return 0.0
+		return probability * (1.0 - f) / (1.0 - CHATTER_REDUCTION_START)
+
+	def model_for(self, callType: str, model: str) -> str:
+		if callType == "chatter" and self.cheapChatterModel and self.fraction() >= CHEAP_CHATTER_MODEL_FROM:
+			return self.cheapChatterModel
+		return model
+
+	def context_limit(self) -> Optional[int]:
+		f = self.fraction()
+		limit = None
+		for threshold, maxMessages in CONTEXT_LIMITS:
+			if f >= threshold:
+				limit = maxMessages
+		return limit
+
+	def trim_context(self, messages: List[dict]) -> List[dict]:
+		"""Messages to send: the system prompt plus the most recent ones, starting at a user message
+		so tool calls are never separated from their results."""
+		limit = self.context_limit()
+		self._report(limit)
+		if limit is None or len(messages) <= limit + 1:
+			return messages
+		start = len(messages) - limit
+		while start < len(messages) and messages[start]["role"] != "user":
+			start += 1
+		if start >= len(messages):
+			return messages
+		return messages[:1] + messages[start:]
+
+	def _report(self, limit):
+		level = (limit, self.fraction() >= CHEAP_CHATTER_MODEL_FROM)
+		if level != self._lastLevel and self.budget > 0 and self._lastLevel is not None:
+			print(f"AI budget {self.fraction() * 100:.0f}% used (${self.usage.totalCost:.3f} of ${self.budget:.2f}): "
+				f"context limit {limit or 'none'}, chatter probability reduced, cheaper chatter model {'on' if level[1] else 'off'}")
+		self._lastLevel = level
@@ -11,10 +11,13 @@ matplotlib.use('Agg')  # Must be before importing pyplot
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.collections import LineCollection, PolyCollection
 from matplotlib.backends.backend_pdf import PdfPages
 import numpy as np
 import os
 
+import osm_cache
+
 @dataclass
 class AirportElement:
     """Represents an airport element with coordinates and properties"""
@@ -25,12 +28,56 @@ class AirportElement:
     category: str  # 'runway', 'taxiway', 'building', 'road', etc.
 
 class AirportOSMFetcher:
-    def __init__(self):
+    def __init__(self, cache: Optional[osm_cache.OSMCache] = None, offline: Optional[bool] = None):
+        """
+        Args:
+            cache: Disk cache for Overpass results (default: osm_cache.CACHE_FOLDER)
+            offline: Only use cached or imported data, never contact Overpass (default: osm_cache.offline)
+        """
         self.overpass_url = "http://overpass-api.de/api/interpreter"
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Airport OSM Data Fetcher 1.0'
         })
+        self.cache = cache or osm_cache.OSMCache()
+        self.offline = osm_cache.offline if offline is None else offline
+    
+    def query_airport(self, icao_code: str, feature_types: Optional[list] = None) -> Optional[Dict[str, Any]]:
+        """
+        Airport data from the cache, or from a single Overpass request (osm_cache.airport_query).
+        
+        Args:
+            icao_code: Airport ICAO code
+            feature_types: OSM keys of the features to fetch (default: all elements)
+        
+        Returns:
+            OSM data dictionary or None if the airport is unknown or not available offline
+        """
+        query = osm_cache.airport_query(icao_code, feature_types)
+        cached = self.cache.get(icao_code, query, allow_stale=self.offline)
+        if cached is not None:
+            print(f"Using cached OSM data for {icao_code}")
+            return cached
+        if self.offline:
+            print(f"No cached OSM data for {icao_code} (offline)")
+            return None
+        
+        try:
+            print(f"Fetching OSM data for {icao_code}: {feature_types or 'all elements'}")
+            response = self.session.post(self.overpass_url, data=query)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, json.JSONDecodeError) as e:
+            print(f"Error fetching OSM data for {icao_code}: {e}")
+            # An expired entry is better than no diagram
+            return self.cache.get(icao_code, query, allow_stale=True)
+        
+        if not osm_cache.has_aerodrome(data, icao_code):
+            print(f"Airport with ICAO code {icao_code} not found")
+            return None
+        
+        self.cache.put(icao_code, query, data)
+        return data
     
     def get_airport_bounds(self, icao_code: str) -> Optional[Tuple[float, float, float, float]]:
         """
@@ -142,53 +189,32 @@ class AirportOSMFetcher:
             return None
     
     def fetch_airport_osm_data(self, icao_code: str, 
-                             element_types: Optional[list] = None,
-                             save_to_file: bool = True) -> Optional[Dict[str, Any]]:
+                             element_types: Optional[list] = None) -> Optional[Dict[str, Any]]:
         """
-        Complete workflow: get airport bounds and fetch OSM data.
+        Complete workflow: all OSM elements of an airport, cached.
         
         Args:
             icao_code: Airport ICAO code (e.g., 'KJFK', 'EGLL')
-            element_types: List of OSM element types to fetch
-            save_to_file: Whether to save data to JSON file
+            element_types: List of OSM element types to keep (default: ['way', 'node', 'relation'])
         
         Returns:
             OSM data dictionary or None if error
         """
         print(f"Looking up airport: {icao_code}")
         
-        # Get airport bounding box
-        bbox = self.get_airport_bounds(icao_code)
-        if not bbox:
-            return None
-        
-        print(f"Found airport bounds: {bbox}")
-        
-        # Add delay to be respectful to Overpass API
-        time.sleep(1)
-        
-        # Fetch OSM data
-        osm_data = self.fetch_osm_data(bbox, element_types)
+        osm_data = self.query_airport(icao_code)
         if not osm_data:
             return None
         
-        print(f"Retrieved {len(osm_data.get('elements', []))} OSM elements")
-        
-        # Save to file if requested
-        if save_to_file:
-            filename = f"{icao_code.lower()}_osm_data.json"
-            try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(osm_data, f, indent=2, ensure_ascii=False)
-                print(f"Data saved to {filename}")
-            except IOError as e:
-                print(f"Error saving file: {e}")
+        if element_types is not None:
+            osm_data = dict(osm_data, elements=[e for e in osm_data.get('elements', []) if e['type'] in element_types])
         
+        print(f"Retrieved {len(osm_data.get('elements', []))} OSM elements")
         return osm_data
     
     def get_specific_features(self, icao_code: str, feature_types: list) -> Optional[Dict[str, Any]]:
         """
-        Fetch specific types of features around an airport.
+        Fetch specific types of features around an airport, cached.
         
         Args:
             icao_code: Airport ICAO code
@@ -197,38 +223,7 @@ class AirportOSMFetcher:
         Returns:
             OSM data with specified features
         """
-        bbox = self.get_airport_bounds(icao_code)
-        if not bbox:
-            return None
-        
-        min_lat, min_lon, max_lat, max_lon = bbox
-        
-        # Build query for specific features
-        feature_queries = []
-        for feature in feature_types:
-            feature_queries.append(f'  way["{feature}"]({min_lat},{min_lon},{max_lat},{max_lon});')
-            feature_queries.append(f'  relation["{feature}"]({min_lat},{min_lon},{max_lat},{max_lon});')
-        
-        query = f"""
-        [out:json][timeout:60];
-        (
-{chr(10).join(feature_queries)}
-        );
-        out geom meta;
-        """
-        
-        try:
-            print(f"Fetching specific features: {feature_types}")
-            time.sleep(1)  # Be respectful to API
-            
-            response = self.session.post(self.overpass_url, data=query)
-            response.raise_for_status()
-            
-            return response.json()
-            
-        except requests.RequestException as e:
-            print(f"Error fetching feature data: {e}")
-            return None
+        return self.query_airport(icao_code, feature_types)
 
 
 class AirportDiagramGenerator:
@@ -260,6 +255,19 @@ class AirportDiagramGenerator:
             'building': 1.0,
             'default': 1.5
         }
+        
+        # Categories drawn as filled polygons even when the way is not closed
+        self.area_categories = {'building', 'terminal', 'hangar', 'apron', 'parking', 'grass', 'water'}
+        
+        # Each taxiway ref is labeled once, on its longest segment, if that is at least this long (meters)
+        self.min_taxiway_label_length = 100
+        
+        # Page size in inches, and the geometry detail (in points on the page) below which vertices are dropped, 0 to keep all
+        self.figure_size = (16, 12)
+        self.simplify_tolerance_pt = 0.25
+        
+        # Categories whose shared vertices (junctions) are always kept, so the network stays connected
+        self.network_categories = {'runway', 'taxiway'}
     
     def lat_lon_to_meters(self, lat: float, lon: float, center_lat: float, center_lon: float) -> Tuple[float, float]:
         """Convert lat/lon to approximate meters from center point"""
@@ -272,6 +280,109 @@ class AirportDiagramGenerator:
         
         return x, y
     
+    def project_to_meters(self, coordinates: np.ndarray, center_lat: float, center_lon: float) -> np.ndarray:
+        """Vectorized lat_lon_to_meters: (N, 2) array of (lat, lon) to (N, 2) array of (x, y)"""
+        lat_m_per_deg = 111320
+        lon_m_per_deg = 111320 * math.cos(math.radians(center_lat))
+        
+        return np.column_stack(((coordinates[:, 1] - center_lon) * lon_m_per_deg,
+                                (coordinates[:, 0] - center_lat) * lat_m_per_deg))
+    
+    def project_elements(self, elements: List[AirportElement]) -> List[np.ndarray]:
+        """All coordinates in one array, projected at once around their mean and split back into one (n, 2) view per element"""
+        counts = np.fromiter((len(element.coordinates) for element in elements), dtype=np.intp, count=len(elements))
+        all_coords = np.array([coord for element in elements for coord in element.coordinates], dtype=float)
+        center_lat, center_lon = all_coords.mean(axis=0)
+        return np.split(self.project_to_meters(all_coords, center_lat, center_lon), np.cumsum(counts)[:-1])
+    
+    def simplify_tolerance(self, points: List[np.ndarray]) -> float:
+        """Meters that correspond to simplify_tolerance_pt on the page, for the extent of the projected points"""
+        all_points = np.concatenate(points)
+        width, height = all_points.max(axis=0) - all_points.min(axis=0)
+        meters_per_inch = max(width / self.figure_size[0], height / self.figure_size[1])
+        return meters_per_inch * self.simplify_tolerance_pt / 72
+    
+    def simplify_geometry(self, elements: List[AirportElement], points: List[np.ndarray], tolerance: float) -> List[np.ndarray]:
+        """
+        Douglas-Peucker simplification of all elements at once.
+        
+        Vertices closer than tolerance (meters) to the simplified line are dropped. End points are kept, and so are
+        vertices shared by runways and taxiways, so junctions do not move. Polygons that would collapse keep all vertices.
+        
+        Args:
+            elements: Parsed elements
+            points: Their projected (n, 2) coordinates, as from project_elements
+            tolerance: Largest allowed deviation in meters
+        
+        Returns:
+            Simplified (m, 2) coordinates per element
+        """
+        if tolerance <= 0 or not points:
+            return points
+        
+        counts = np.fromiter((len(p) for p in points), dtype=np.intp, count=len(points))
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        xy = np.concatenate(points)
+        
+        keep = np.zeros(len(xy), dtype=bool)
+        keep[starts] = True
+        keep[ends - 1] = True
+        
+        # Lock junctions: vertices of runways and taxiways that occur more than once
+        network = np.fromiter((element.category in self.network_categories for element in elements), dtype=bool, count=len(elements))
+        network_points = np.repeat(network, counts)
+        if network_points.any():
+            _, inverse, occurrences = np.unique(xy[network_points], axis=0, return_inverse=True, return_counts=True)
+            keep[np.flatnonzero(network_points)[occurrences[inverse.ravel()] > 1]] = True
+        
+        # Ranges between consecutive kept vertices of the same element
+        element_ids = np.repeat(np.arange(len(points)), counts)
+        kept = np.flatnonzero(keep)
+        same_element = element_ids[kept[:-1]] == element_ids[kept[1:]]
+        self._douglas_peucker(xy, keep, kept[:-1][same_element], kept[1:][same_element], tolerance)
+        
+        # Polygons need at least 3 distinct vertices, closed rings repeat the first one
+        closed = np.fromiter((element.coordinates[0] == element.coordinates[-1] or element.category in self.area_categories
+                              for element in elements), dtype=bool, count=len(elements))
+        repeats_first = np.fromiter((element.coordinates[0] == element.coordinates[-1] for element in elements), dtype=bool, count=len(elements))
+        minimum = np.where(closed, 3 + repeats_first, 2)
+        kept_counts = np.add.reduceat(keep, starts)
+        collapsed = (kept_counts < minimum) & (counts >= minimum)
+        keep |= np.repeat(collapsed, counts)
+        
+        kept_counts = np.add.reduceat(keep, starts)
+        return np.split(xy[keep], np.cumsum(kept_counts)[:-1])
+    
+    def _douglas_peucker(self, xy: np.ndarray, keep: np.ndarray, starts: np.ndarray, ends: np.ndarray, tolerance: float):
+        """Mark in keep the vertices Douglas-Peucker keeps between each start and end vertex, one recursion level
+        of all ranges per iteration"""
+        while len(starts):
+            interior = ends - starts - 1
+            starts, ends, interior = starts[interior > 0], ends[interior > 0], interior[interior > 0]
+            if not len(starts):
+                break
+            
+            # Interior vertices of all ranges, grouped by range
+            offsets = np.cumsum(interior) - interior
+            group = np.repeat(np.arange(len(starts)), interior)
+            index = starts[group] + 1 + np.arange(interior.sum()) - offsets[group]
+            
+            # Distance to the segment between the range's end points (to the start point if they coincide)
+            a, ab = xy[starts][group], (xy[ends] - xy[starts])[group]
+            ap = xy[index] - a
+            squared_length = np.einsum('ij,ij->i', ab, ab)
+            t = np.clip(np.einsum('ij,ij->i', ap, ab) / np.where(squared_length > 0, squared_length, 1), 0, 1)
+            distance = np.hypot(*(ap - t[:, None] * ab).T)
+            
+            # Farthest vertex of each range, split the ranges where it is beyond tolerance
+            maximum = np.maximum.reduceat(distance, offsets)
+            farthest = np.flatnonzero(distance == maximum[group])
+            farthest = index[farthest[np.unique(group[farthest], return_index=True)[1]]]
+            split = maximum > tolerance
+            keep[farthest[split]] = True
+            starts, ends = np.concatenate([starts[split], farthest[split]]), np.concatenate([farthest[split], ends[split]])
+    
     def categorize_element(self, tags: Dict[str, str]) -> str:
         """Categorize OSM element based on its tags"""
         # Skip highways and roads - we don't want them in airport diagrams
@@ -363,30 +474,25 @@ class AirportDiagramGenerator:
             print("No elements found to draw")
             return ""
         
-        # Calculate bounds and center
-        all_coords = []
-        for element in elements:
-            all_coords.extend(element.coordinates)
-        
-        if not all_coords:
-            print("No coordinates found")
-            return ""
-        
-        lats = [coord[0] for coord in all_coords]
-        lons = [coord[1] for coord in all_coords]
-        center_lat, center_lon = sum(lats) / len(lats), sum(lons) / len(lons)
+        # Project, then drop detail the page scale cannot show
+        points = self.project_elements(elements)
+        tolerance = self.simplify_tolerance(points)
+        vertices = sum(len(p) for p in points)
+        points = self.simplify_geometry(elements, points, tolerance)
+        print(f"Simplified {vertices} vertices to {sum(len(p) for p in points)} (tolerance {tolerance:.2f} m)")
         
         # Create PDF
         with PdfPages(output_filename) as pdf:
             # Create main diagram
-            fig, ax = plt.subplots(1, 1, figsize=(16, 12))
+            fig, ax = plt.subplots(1, 1, figsize=self.figure_size)
             
             # Group elements by category for better layering
             element_groups = {}
-            for element in elements:
+            for element, element_points in zip(elements, points):
                 if element.category not in element_groups:
-                    element_groups[element.category] = []
-                element_groups[element.category].append(element)
+                    element_groups[element.category] = ([], [])
+                element_groups[element.category][0].append(element)
+                element_groups[element.category][1].append(element_points)
             
             # Draw elements in order (background first, important elements last)
             draw_order = ['grass', 'water', 'apron', 'parking', 'building', 'hangar', 'terminal', 'taxiway', 'runway']
@@ -395,14 +501,17 @@ class AirportDiagramGenerator:
             
             for category in draw_order:
                 if category in element_groups:
-                    stats[category] = len(element_groups[category])
-                    self._draw_element_group(ax, element_groups[category], center_lat, center_lon)
+                    stats[category] = len(element_groups[category][0])
+                    self._draw_element_group(ax, *element_groups[category])
             
             # Draw any remaining categories not in the order
-            for category, group in element_groups.items():
+            for category, (group, group_points) in element_groups.items():
                 if category not in draw_order:
                     stats[category] = len(group)
-                    self._draw_element_group(ax, group, center_lat, center_lon)
+                    self._draw_element_group(ax, group, group_points)
+            
+            # Collections do not rescale the axes when added
+            ax.autoscale_view()
             
             # Set equal aspect ratio and clean up axes
             ax.set_aspect('equal')
@@ -422,21 +531,21 @@ class AirportDiagramGenerator:
         print(f"Airport diagram saved as {output_filename}")
         return output_filename
     
-    def _calculate_line_length(self, coordinates: List[Tuple[float, float]], 
-                              center_lat: float, center_lon: float) -> float:
-        """Calculate the length of a line in meters"""
-        if len(coordinates) < 2:
-            return 0
-        
-        total_length = 0
-        for i in range(len(coordinates) - 1):
-            x1, y1 = self.lat_lon_to_meters(coordinates[i][0], coordinates[i][1], center_lat, center_lon)
-            x2, y2 = self.lat_lon_to_meters(coordinates[i+1][0], coordinates[i+1][1], center_lat, center_lon)
-            total_length += math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-        
-        return total_length
-    def _draw_element_group(self, ax, elements: List[AirportElement], center_lat: float, center_lon: float):
-        """Draw a group of elements of the same category"""
+    def _line_lengths(self, points: List[np.ndarray]) -> np.ndarray:
+        """Length in meters of each projected line (at least one point each), computed for all lines at once"""
+        if not points:
+            return np.zeros(0)
+        
+        counts = np.fromiter((len(p) for p in points), dtype=np.intp, count=len(points))
+        ends = np.cumsum(counts)
+        segments = np.append(np.hypot(*np.diff(np.concatenate(points), axis=0).T), 0.0)
+        # Drop the segments joining the last point of a line with the first point of the next one
+        segments[ends - 1] = 0
+        return np.add.reduceat(segments, ends - counts)
+    
+    def _draw_element_group(self, ax, elements: List[AirportElement], points: List[np.ndarray]):
+        """Draw a group of elements of the same category, points are their projected (n, 2) coordinates.
+        All polygons of the group are one PolyCollection, all lines one LineCollection."""
         if not elements:
             return
         
@@ -444,52 +553,53 @@ class AirportDiagramGenerator:
         color = self.colors.get(category, self.colors['default'])
         line_width = self.line_widths.get(category, self.line_widths['default'])
         
-        for element in elements:
-            if len(element.coordinates) < 2:
-                # Single point (node)
-                x, y = self.lat_lon_to_meters(element.coordinates[0][0], element.coordinates[0][1], 
-                                            center_lat, center_lon)
-                ax.plot(x, y, 'o', color=color, markersize=4)
+        nodes, polygons, lines = [], [], []
+        for element, element_points in zip(elements, points):
+            if len(element_points) < 2:
+                nodes.append(element_points[0])
+                continue
+            
+            # Check if it's a closed polygon (building, area, etc.)
+            is_closed = element.coordinates[0] == element.coordinates[-1] or category in self.area_categories
+            if is_closed and len(element_points) > 2:
+                polygons.append(element_points)
             else:
-                # Line or polygon (way)
-                coords_m = [self.lat_lon_to_meters(lat, lon, center_lat, center_lon) 
-                           for lat, lon in element.coordinates]
-                xs, ys = zip(*coords_m)
-                
-                # Check if it's a closed polygon (building, area, etc.)
-                is_closed = (element.coordinates[0] == element.coordinates[-1] or 
-                           category in ['building', 'terminal', 'hangar', 'apron', 'parking', 'grass', 'water'])
-                
-                if is_closed and len(element.coordinates) > 2:
-                    # Draw as filled polygon
-                    polygon = patches.Polygon(list(zip(xs, ys)), closed=True, 
-                                            facecolor=color, alpha=0.7, 
-                                            edgecolor='black', linewidth=0.5)
-                    ax.add_patch(polygon)
-                else:
-                    # Draw as line
-                    ax.plot(xs, ys, color=color, linewidth=line_width, solid_capstyle='round')
-                
-                # Add labels for runways
-                if category == 'runway' and 'ref' in element.tags:
-                    center_x, center_y = sum(xs) / len(xs), sum(ys) / len(ys)
+                lines.append(element_points)
+        
+        if nodes:
+            nodes = np.array(nodes)
+            ax.plot(nodes[:, 0], nodes[:, 1], 'o', linestyle='none', color=color, markersize=4)
+        # Same layering as single patches (zorder 1) and lines (zorder 2)
+        if polygons:
+            ax.add_collection(PolyCollection(polygons, closed=True, facecolors=color, alpha=0.7,
+                                             edgecolors='black', linewidths=0.5, zorder=1))
+        if lines:
+            ax.add_collection(LineCollection(lines, colors=color, linewidths=line_width,
+                                             capstyle='round', joinstyle='round', zorder=2))
+        
+        # Add labels for runways
+        if category == 'runway':
+            for element, element_points in zip(elements, points):
+                if len(element_points) >= 2 and 'ref' in element.tags:
+                    center_x, center_y = element_points.mean(axis=0)
                     ax.text(center_x, center_y, element.tags['ref'], 
                            ha='center', va='center', fontweight='bold', fontsize=10,
                            bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8))
-                
-                # Add labels for taxiways (only for longer segments)
-                if category == 'taxiway' and 'ref' in element.tags:
-                    # Calculate taxiway length
-                    length = self._calculate_line_length(element.coordinates, center_lat, center_lon)
-                    
-                    # Only label taxiways longer than 150 meters
-                    if length > 100:
-                        center_x, center_y = sum(xs) / len(xs), sum(ys) / len(ys)
-                        ref_text = element.tags['ref']
-                        # Keep taxiway labels shorter and less prominent
-                        ax.text(center_x, center_y, ref_text, 
-                               ha='center', va='center', fontweight='normal', fontsize=8,
-                               bbox=dict(boxstyle='round,pad=0.2', facecolor='lightgray', alpha=0.7))
+        
+        # Add labels for taxiways, once per ref on its longest segment
+        if category == 'taxiway':
+            lengths = self._line_lengths(points)
+            longest = {}
+            for index, element in enumerate(elements):
+                ref = element.tags.get('ref')
+                if ref and lengths[index] > self.min_taxiway_label_length and (ref not in longest or lengths[index] > lengths[longest[ref]]):
+                    longest[ref] = index
+            for ref, index in longest.items():
+                center_x, center_y = points[index].mean(axis=0)
+                # Keep taxiway labels shorter and less prominent
+                ax.text(center_x, center_y, ref, 
+                       ha='center', va='center', fontweight='normal', fontsize=8,
+                       bbox=dict(boxstyle='round,pad=0.2', facecolor='lightgray', alpha=0.7))
     
     def _add_legend(self, ax, stats: Dict[str, int]):
         """Add legend to the plot"""
@@ -562,7 +672,7 @@ class AirportDiagramGenerator:
         """Complete workflow to create airport diagram"""
         # Fetch OSM data
         fetcher = AirportOSMFetcher()
-        osm_data = fetcher.fetch_airport_osm_data(icao_code, save_to_file=True)
+        osm_data = fetcher.fetch_airport_osm_data(icao_code)
         
         if not osm_data:
             print(f"Failed to fetch OSM data for {icao_code}")
@@ -572,21 +682,25 @@ class AirportDiagramGenerator:
         return self.create_diagram(icao_code, osm_data)
 
 
-def generateAirportDiagram(icao_code: str):
+def diagram_path(icao_code: str) -> str:
+    return os.path.join("AirportDiagrams", f"{icao_code.lower()}_airport_diagram.pdf")
+
+
+def generateAirportDiagram(icao_code: str, offline: Optional[bool] = None):
     print(f"Creating airport diagram for {icao_code}")
 
-    filename = os.path.join("AirportDiagrams", f"{icao_code.lower()}_airport_diagram.pdf")
+    filename = diagram_path(icao_code)
     if os.path.exists(filename):
         print("Airport diagram " + filename + " already exists, not generating new one.")
         return filename
     
     diagram_gen = AirportDiagramGenerator()
-    fetcher = AirportOSMFetcher()
+    fetcher = AirportOSMFetcher(offline=offline)
     
     # Fetch specific airport features
     specific_data = fetcher.get_specific_features(
         icao_code, 
-        ['aeroway']
+        osm_cache.DIAGRAM_FEATURES
     )
     
     if specific_data:
@@ -607,7 +721,11 @@ def main():
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2 and sys.argv[1] == "--import":
+        # Fill the OSM cache from local extracts, for offline diagrams
+        for extract in sys.argv[2:]:
+            osm_cache.import_extract(extract)
+    elif len(sys.argv) > 1:
         icao = sys.argv[1].upper()
         diagram_gen = AirportDiagramGenerator()
         result = diagram_gen.create_airport_diagram(icao)
@@ -0,0 +1,108 @@
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+import geodesy
+from geofence import LocalProjection, METERS_PER_NM
+
+
+FEET_IN_METER = 3.28084
+APPROACH_START_DISTANCE_KM = 10.0	# approach start point on the extended centerline, before the threshold
+GLIDE_SLOPE_DEGREES = 3.0
+THRESHOLD_CROSSING_HEIGHT_FT = 50.0
+INTERCEPT_ANGLE = 30.0	# degrees between intercept heading and final approach course
+INTERCEPT_ZONE_NM = 25.0	# aircraft in front of the runway closer than this are vectored onto the final directly
+ESTABLISHED_CROSS_TRACK_NM = 0.3	# closer to the centerline than this: fly the final approach course
+VECTORING_RANGE_NM = 60.0	# approach vectors are added to the telemetry sent to AI within this distance of the approach start point
+
+
+@dataclass(frozen=True, slots=True)
+class ApproachVector:
+	"""Vector to the final approach for the current position, from ApproachGeometry.vector."""
+	heading: float	# degrees true
+	instruction: str	# "proceed to approach start point", "intercept final", "established on final"
+	distance_to_threshold_nm: float	# along the extended centerline, negative past the threshold
+	cross_track_nm: float	# from the extended centerline, positive right of the final approach course
+	glide_path_altitude_ft: float	# MSL altitude on the glide path at the current distance
+	distance_to_approach_start_nm: float
+
+
+class ApproachGeometry:
+	"""Final approach of the destination runway, from the DESTINATION_RUNWAY position and direction in main.mcf.
+
+	The final approach course, the approach start point and the glide path are computed once per flight plan.
+	vector() gives the heading ATC would assign from the current position, so the AI does not have to
+	calculate headings from coordinates or call a tool for it."""
+
+	def __init__(self, runway: str, position, direction, elevation_m: Optional[float] = None):
+		self.runway = runway
+		position = np.asarray(position, dtype=float)
+		direction = np.asarray(direction, dtype=float)
+		direction = direction / np.linalg.norm(direction)	# landing direction
+
+		self.threshold_latitude, self.threshold_longitude, altitude = geodesy.ecef_to_lla(*position)
+		self.elevation_ft = (altitude if elevation_m is None else elevation_m) * FEET_IN_METER
+
+		# Landing direction in the runway's east/north/up frame
+		lat, lon = math.radians(self.threshold_latitude), math.radians(self.threshold_longitude)
+		east = -math.sin(lon) * direction[0] + math.cos(lon) * direction[1]
+		north = -math.sin(lat) * math.cos(lon) * direction[0] - math.sin(lat) * math.sin(lon) * direction[1] + math.cos(lat) * direction[2]
+		self.final_course = (math.degrees(math.atan2(east, north)) + 360) % 360
+		course = math.radians(self.final_course)
+		self._course_east, self._course_north = math.sin(course), math.cos(course)
+
+		start = geodesy.offset_ecef(position, direction, APPROACH_START_DISTANCE_KM)
+		self.approach_start_latitude, self.approach_start_longitude, _ = geodesy.ecef_to_lla(*start)
+		self._projection = LocalProjection(self.threshold_latitude, self.threshold_longitude)
+		self._approach_start = geodesy.reference(self.approach_start_latitude, self.approach_start_longitude)
+
+	@classmethod
+	def from_waypoint(cls, waypoint) -> "ApproachGeometry":
+		"""From a mcfparser.MainMcfWaypoint of type DESTINATION_RUNWAY."""
+		return cls(waypoint.Identifier, waypoint.Position[:3], waypoint.Direction[:3], waypoint.Elevation or None)
+
+	def glide_path_altitude_ft(self, distance_nm: float) -> float:
+		"""MSL altitude on the glide path at distance_nm before the threshold."""
+		return self.elevation_ft + THRESHOLD_CROSSING_HEIGHT_FT + max(distance_nm, 0.0) * METERS_PER_NM * FEET_IN_METER * math.tan(math.radians(GLIDE_SLOPE_DEGREES))
+
+	def vector(self, latitude: float, longitude: float) -> ApproachVector:
+		east, north = self._projection.to_enu(latitude, longitude)
+		# Along the landing direction (negative before the threshold) and to the right of it
+		along = (east * self._course_east + north * self._course_north) / METERS_PER_NM
+		cross = (east * self._course_north - north * self._course_east) / METERS_PER_NM
+		distanceToThreshold = -along
+		distanceToStart = self._approach_start.distance_nm(latitude, longitude)
+
+		if 0.0 < distanceToThreshold < INTERCEPT_ZONE_NM and abs(cross) < distanceToThreshold:
+			if abs(cross) < ESTABLISHED_CROSS_TRACK_NM:
+				heading, instruction = self.final_course, "established on final"
+			else:
+				# Turn towards the centerline, at most INTERCEPT_ANGLE off the final approach course
+				heading = self.final_course + (-INTERCEPT_ANGLE if cross > 0 else INTERCEPT_ANGLE)
+				instruction = "intercept final"
+		else:
+			heading = self._approach_start.bearing_from(latitude, longitude)
+			instruction = "proceed to approach start point"
+
+		return ApproachVector(
+			heading=heading % 360,
+			instruction=instruction,
+			distance_to_threshold_nm=distanceToThreshold,
+			cross_track_nm=cross,
+			glide_path_altitude_ft=self.glide_path_altitude_ft(distanceToThreshold),
+			distance_to_approach_start_nm=distanceToStart,
+		)
+
+	def describe(self, latitude: float, longitude: float) -> str:
+		"""Precomputed approach values for the telemetry message, empty when far from the destination."""
+		vector = self.vector(latitude, longitude)
+		if vector.distance_to_approach_start_nm > VECTORING_RANGE_NM:
+			return ""
+		description = (f"Approach runway {self.runway}: final approach course {int(round(self.final_course)) % 360:03d}, "
+			f"{vector.distance_to_approach_start_nm:.1f} nm to approach start point, "
+			f"vector heading {int(round(vector.heading)) % 360:03d} ({vector.instruction})")
+		if 0.0 < vector.distance_to_threshold_nm < INTERCEPT_ZONE_NM:
+			description += f", glide path altitude {int(round(vector.glide_path_altitude_ft, -2))} feet at {vector.distance_to_threshold_nm:.1f} nm from threshold"
+		return description + "."
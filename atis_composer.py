@@ -0,0 +1,165 @@
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+from pydub import AudioSegment
+from pydub.generators import WhiteNoise
+from pydub.silence import detect_leading_silence
+
+
+FRAGMENTS_FOLDER = "ATISFragments"	# radio-processed fragments, kept between runs (Temp is cleared at start)
+ATIS_VOICE = "en-US-ChristopherNeural"
+FRAME_RATE = 8000	# radio audio is mono 8 kHz
+CROSSFADE_MS = 15	# between adjacent fragments
+WORD_GAP_MS = 60	# silence between the words of a phrase
+COMMA_PAUSE_MS = 250
+SENTENCE_PAUSE_MS = 450
+SILENCE_THRESHOLD = -45.0	# dBFS, leading and trailing silence of synthesized fragments is trimmed
+NOISE_GAIN = -50.0	# static under the whole broadcast, same level as radio messages
+CLICK_GAIN = -30.0	# squelch click at start and end
+CLICK_MS = 30
+NOISE_BED_MS = 10000	# generated once and looped
+SYNTHESIS_WORKERS = 4
+
+FRAGMENT_SSML = """<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-US'>
+	<voice name='{voice}' style="calm"><prosody rate='+10%'>{text}</prosody></voice>
+</speak>"""
+
+DIGITS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "niner"]
+RUNWAY_SIDES = {"L": "left", "R": "right", "C": "center"}
+BOILERPLATE = "No significant weather. Temperature one eight, dewpoint one zero. QNH one zero one three. On first radio contact, advise you have"
+
+# Script items: fragment text, or a pause in milliseconds
+ScriptItem = Union[str, int]
+
+
+def digits(number: str) -> List[str]:
+	return [DIGITS[int(c)] for c in number if c.isdigit()]
+
+
+def runway_words(runway: str) -> List[str]:
+	"""'08L' -> ['zero', 'eight', 'left'], other designators are spoken as they are."""
+	match = re.fullmatch(r"\s*(\d{1,2})\s*([LRC]?)\s*", runway or "", re.IGNORECASE)
+	if not match:
+		return [runway] if runway else []
+	words = digits(match.group(1).zfill(2))
+	if match.group(2):
+		words.append(RUNWAY_SIDES[match.group(2).upper()])
+	return words
+
+
+def atis_script(airportName: str, letter: str, time: str, runway: str, windDirection: float, windStrength: float, visibility: str) -> List[ScriptItem]:
+	"""Words and pauses of the broadcast, same wording as the single-request ATIS it replaces,
+	with numbers spoken digit by digit so that every number is made of cached digit fragments."""
+	return ([airportName, "Information", letter, COMMA_PAUSE_MS, "time", *digits(time), "Zulu", SENTENCE_PAUSE_MS,
+		"Runway in use", *runway_words(runway), SENTENCE_PAUSE_MS,
+		"Wind", *digits(f"{int(windDirection) % 360:03d}"), "degrees at", *digits(str(int(windStrength))), "knots", SENTENCE_PAUSE_MS,
+		"Visibility", visibility, SENTENCE_PAUSE_MS,
+		BOILERPLATE, "Information", letter, SENTENCE_PAUSE_MS])
+
+
+class ATISComposer:
+	"""Builds ATIS broadcasts from cached, radio-processed fragments: airport names, phonetic letters, digits,
+	runway sides, wind and visibility phrases and the fixed boilerplate.
+
+	Each fragment is synthesized once (synthesize(ssml, path) -> bool, an Azure call in ai_atc), filtered with
+	process(AudioSegment) (bandpass and compression of the radio effect), trimmed and kept in FRAGMENTS_FOLDER and in memory.
+	A new broadcast for a changed wind, runway or letter is then joined locally with crossfades in milliseconds."""
+
+	def __init__(self, synthesize: Callable[[str, str], bool], process: Callable[[AudioSegment], AudioSegment], folder: str = FRAGMENTS_FOLDER, voice: str = ATIS_VOICE):
+		self.synthesize = synthesize
+		self.process = process
+		self.folder = folder
+		self.voice = voice
+		self.synthesized = 0	# fragments synthesized (not found in cache) by this composer
+		self._fragments: Dict[str, Future] = {}
+		self._lock = threading.Lock()
+		self._noise: Optional[AudioSegment] = None
+
+	def _path(self, text: str) -> str:
+		digest = hashlib.sha1(f"{self.voice}\n{FRAGMENT_SSML}\n{text}".encode("utf-8")).hexdigest()[:16]
+		slug = re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_")[:32]
+		return os.path.join(self.folder, f"{slug}_{digest}.wav")
+
+	def fragment(self, text: str) -> AudioSegment:
+		"""Processed audio of one fragment, synthesized on first use. Threads asking for the same fragment share one synthesis."""
+		with self._lock:
+			future = self._fragments.get(text)
+			owner = future is None
+			if owner:
+				future = self._fragments[text] = Future()
+		if owner:
+			try:
+				future.set_result(self._load(text))
+			except Exception as e:
+				with self._lock:
+					del self._fragments[text]	# try again next time
+				future.set_exception(e)
+		return future.result()
+
+	def _load(self, text: str) -> AudioSegment:
+		path = self._path(text)
+		if not os.path.exists(path):
+			os.makedirs(self.folder, exist_ok=True)
+			rawPath = path + ".tts.wav"
+			ssml = FRAGMENT_SSML.format(voice=self.voice, text=text)
+			if not self.synthesize(ssml, rawPath):
+				raise RuntimeError(f"Speech synthesis of ATIS fragment '{text}' failed")
+			audio = self.process(AudioSegment.from_wav(rawPath).set_channels(1).set_frame_rate(FRAME_RATE))
+			os.remove(rawPath)
+			audio = self._trim(audio)
+			audio.export(path + ".part", format="wav")
+			os.replace(path + ".part", path)	# other processes never see a half-written fragment
+			with self._lock:
+				self.synthesized += 1
+			return audio
+		return AudioSegment.from_wav(path)
+
+	@staticmethod
+	def _trim(audio: AudioSegment) -> AudioSegment:
+		start = detect_leading_silence(audio, SILENCE_THRESHOLD)
+		end = len(audio) - detect_leading_silence(audio.reverse(), SILENCE_THRESHOLD)
+		return audio[start:end] if end > start else audio
+
+	def prefetch(self, texts):
+		"""Make sure fragments are cached, synthesizing missing ones in parallel."""
+		texts = list(dict.fromkeys(t for t in texts if isinstance(t, str) and t))
+		with ThreadPoolExecutor(SYNTHESIS_WORKERS) as executor:
+			list(executor.map(self.fragment, texts))
+
+	def _noise_bed(self, duration: int) -> AudioSegment:
+		if self._noise is None:
+			self._noise = WhiteNoise(sample_rate=FRAME_RATE).to_audio_segment(duration=NOISE_BED_MS).set_channels(1).set_sample_width(2).apply_gain(NOISE_GAIN)
+		noise = self._noise * (duration // len(self._noise) + 1)
+		return noise[:duration]
+
+	def compose(self, script: List[ScriptItem]) -> AudioSegment:
+		"""Join the fragments and pauses of the script, add static under it and squelch clicks around it."""
+		self.prefetch(script)
+		audio: Optional[AudioSegment] = None
+		gap = 0
+		for item in script:
+			if isinstance(item, int):
+				gap = max(gap, item)
+				continue
+			fragment = self.fragment(item).set_sample_width(2)
+			if audio is None:
+				audio = fragment
+			else:
+				silence = AudioSegment.silent(max(gap, WORD_GAP_MS) + 2 * CROSSFADE_MS, frame_rate=FRAME_RATE)
+				audio = audio.append(silence, crossfade=CROSSFADE_MS).append(fragment, crossfade=min(CROSSFADE_MS, len(fragment)))
+			gap = 0
+		if audio is None:
+			audio = AudioSegment.silent(0, frame_rate=FRAME_RATE)
+		if gap:
+			audio += AudioSegment.silent(gap, frame_rate=FRAME_RATE)
+
+		audio = audio.overlay(self._noise_bed(len(audio)))
+		click = WhiteNoise(sample_rate=FRAME_RATE).to_audio_segment(duration=CLICK_MS).set_channels(1).set_sample_width(2).apply_gain(CLICK_GAIN)
+		return click + audio + click
+
+	def compose_atis(self, airportName: str, letter: str, time: str, runway: str, windDirection: float, windStrength: float, visibility: str) -> AudioSegment:
+		return self.compose(atis_script(airportName, letter, time, runway, windDirection, windStrength, visibility))
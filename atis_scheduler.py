@@ -0,0 +1,169 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import pygame
+
+
+ATIS_UPDATE_INTERVAL = 3600.0	# seconds between new ATIS information for an airport, like the hourly METAR
+QUEUE_CHECK_INTERVAL = 0.25	# seconds, how often a playing ATIS loop checks that its next repetition is queued
+
+
+@dataclass(frozen=True)
+class ATISBroadcast:
+	"""One ATIS information of an airport, with its audio already loaded for playback."""
+	airport: str
+	letter: str
+	issued: float	# time.time() when generated
+	path: str
+	sound: object	# pygame.mixer.Sound
+
+
+class ATISScheduler:
+	"""Keeps the ATIS of the flight's airports up to date, double buffered.
+
+	refresh() generates a new information with the next letter (generate(airportCode, letter) -> wav path, None if
+	there is no ATIS to generate) and loads its audio, then swaps it in as the airport's current broadcast in one
+	assignment. Playing loops (ATISLoop) pick the new broadcast up at their next loop boundary. The background thread
+	started with start() refreshes every broadcast older than interval; changed weather or runway are refreshed by the caller."""
+
+	def __init__(self, generate: Callable[[str, str], Optional[str]], letters: Sequence[str], interval: float = ATIS_UPDATE_INTERVAL):
+		self.generate = generate
+		self.letters = list(letters)
+		self.interval = interval
+		self._airports: List[str] = []
+		self._broadcasts: Dict[str, ATISBroadcast] = {}
+		self._letterIndex: Dict[str, int] = {}
+		self._generating = defaultdict(threading.Lock)	# one generation per airport at a time, they write the same file
+		self._lock = threading.Lock()
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def set_airports(self, airports: Iterable[str]):
+		"""Airports of the current flight plan. Broadcasts of other airports are dropped."""
+		with self._lock:
+			self._airports = list(dict.fromkeys(a for a in airports if a))
+			self._broadcasts = {a: b for a, b in self._broadcasts.items() if a in self._airports}
+		self._wake.set()
+
+	def broadcast(self, airport: str) -> Optional[ATISBroadcast]:
+		return self._broadcasts.get(airport)
+
+	def next_letter(self, airport: str) -> str:
+		with self._lock:
+			index = self._letterIndex.get(airport)
+			index = random.randrange(len(self.letters)) if index is None else (index + 1) % len(self.letters)
+			self._letterIndex[airport] = index
+		return self.letters[index]
+
+	def refresh(self, airport: str) -> Optional[ATISBroadcast]:
+		"""Generate the next information of an airport on the calling thread and make it current."""
+		with self._generating[airport]:
+			letter = self.next_letter(airport)
+			path = self.generate(airport, letter)
+			if not path:
+				return None
+			broadcast = ATISBroadcast(airport, letter, time.time(), path, pygame.mixer.Sound(path))
+			with self._lock:
+				if airport not in self._airports:
+					self._airports.append(airport)
+				self._broadcasts[airport] = broadcast
+		print(f"ATIS {airport} information {letter} is current")
+		return broadcast
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self):
+		if self.running:
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="ATISScheduler", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		self._wake.set()
+		if self._thread:
+			self._thread.join(timeout=2)
+			self._thread = None
+
+	def _run(self):
+		while not self._stop.is_set():
+			now = time.time()
+			with self._lock:
+				broadcasts = [self._broadcasts[a] for a in self._airports if a in self._broadcasts]
+			due = [b.airport for b in broadcasts if now - b.issued >= self.interval]
+			for airport in due:
+				try:
+					self.refresh(airport)
+				except Exception as e:
+					print(f"Error updating ATIS of {airport}: {e}")
+			waits = [b.issued + self.interval - now for b in broadcasts if b.airport not in due]
+			self._wake.wait(max(min(waits, default=self.interval), 1.0))
+			self._wake.clear()
+
+
+class ATISLoop:
+	"""Plays the current broadcast of an airport in a loop, switching to a new information without a gap.
+
+	Instead of play(loops=-1), every repetition is queued on the channel (Channel.queue) while the previous one plays,
+	taking the scheduler's current broadcast at that moment. A new information therefore starts exactly at the loop
+	boundary. The feeder thread only queues sounds that are already loaded, it never generates audio."""
+
+	def __init__(self, scheduler: ATISScheduler, airport: str, volume: float):
+		self.scheduler = scheduler
+		self.airport = airport
+		self.volume = volume
+		self.channel = None
+		self.broadcast: Optional[ATISBroadcast] = None	# playing or queued last
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def start(self) -> bool:
+		"""Start playing, False if the airport has no broadcast yet."""
+		broadcast = self.scheduler.broadcast(self.airport)
+		if broadcast is None:
+			return False
+		broadcast.sound.set_volume(self.volume)
+		self.channel = broadcast.sound.play()
+		if self.channel is None:
+			return False
+		self.broadcast = broadcast
+		self._thread = threading.Thread(target=self._run, name=f"ATISLoop-{self.airport}", daemon=True)
+		self._thread.start()
+		return True
+
+	def _run(self):
+		while not self._stop.wait(QUEUE_CHECK_INTERVAL):
+			if not self.channel.get_busy():
+				break	# stopped from outside
+			broadcast = self.scheduler.broadcast(self.airport) or self.broadcast
+			# Queue the next repetition, or replace a queued repetition of an older information (queue() replaces)
+			if self.channel.get_queue() is not None and broadcast is self.broadcast:
+				continue
+			broadcast.sound.set_volume(self.volume)
+			self.channel.queue(broadcast.sound)
+			if broadcast is not self.broadcast:
+				print(f"ATIS {self.airport} information {broadcast.letter} queued after the current loop")
+			self.broadcast = broadcast
+
+	def set_volume(self, volume: float):
+		self.volume = volume
+		if self.broadcast:
+			self.broadcast.sound.set_volume(volume)
+		current = self.channel.get_sound() if self.channel else None
+		if current is not None:
+			current.set_volume(volume)
+
+	def stop(self):
+		self._stop.set()
+		if self.channel:
+			self.channel.stop()	# also clears the queued repetition
+		if self._thread and self._thread is not threading.current_thread():
+			self._thread.join(timeout=1)
@@ -0,0 +1,136 @@
+"""
+Accuracy checks and benchmarks for the geodesy module (pytest-benchmark).
+
+The reference functions below are the scalar math-module implementations geodesy replaced,
+the vectorized functions and the wrappers in ai_atc and mcfparser must match them.
+	python -m pytest benchmarks/bench_geodesy.py
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+import ai_atc
+import geodesy
+import mcfparser
+
+
+# --- Reference implementations ---
+
+def reference_distance_nm(lat1, lon1, lat2, lon2):
+	lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+	a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+	return 6371.0 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)) * 0.539957
+
+
+def reference_bearing(lat1, lon1, lat2, lon2):
+	lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+	dlon = lon2 - lon1
+	y = math.sin(dlon) * math.cos(lat2)
+	x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+	return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+
+def reference_bearing_to_direction(heading):
+	reciprocal = (heading + 180) % 360
+	sectors = [("N", 337.5, 360.0), ("N", 0.0, 22.5), ("NE", 22.5, 67.5), ("E", 67.5, 112.5), ("SE", 112.5, 157.5),
+		("S", 157.5, 202.5), ("SW", 202.5, 247.5), ("W", 247.5, 292.5), ("NW", 292.5, 337.5)]
+	for name, start, end in sectors:
+		if start <= reciprocal < end:
+			return name
+	return "Unknown"
+
+
+def reference_ecef_to_lla(x, y, z):
+	a = 6378137.0
+	f = 1 / 298.257223563
+	e2 = f * (2 - f)
+	b = a * (1 - f)
+	ep2 = (a ** 2 - b ** 2) / b ** 2
+	lon = math.atan2(y, x)
+	p = math.sqrt(x ** 2 + y ** 2)
+	theta = math.atan2(z * a, p * b)
+	lat = math.atan2(z + ep2 * b * math.sin(theta) ** 3, p - e2 * a * math.cos(theta) ** 3)
+	n = a / math.sqrt(1 - e2 * math.sin(lat) ** 2)
+	return math.degrees(lat), math.degrees(lon), p / math.cos(lat) - n
+
+
+RUNWAY_ECEF = (4265530.3, 847458.0, 4665910.2)
+APPROACH_DIRECTION = (0.5975, 0.5175, -0.6124)
+
+
+@pytest.fixture(scope="module")
+def positions():
+	rng = np.random.default_rng(1)
+	return rng.uniform(-80, 80, 1000), rng.uniform(-180, 180, 1000)
+
+
+# --- Accuracy ---
+
+def test_distance_matches_reference(positions):
+	lat, lon = positions
+	expected = [reference_distance_nm(a, b, 47.2602, 11.3439) for a, b in zip(lat, lon)]
+	np.testing.assert_allclose(geodesy.distance_nm(lat, lon, 47.2602, 11.3439), expected, rtol=1e-9, atol=1e-9)
+	np.testing.assert_allclose(geodesy.reference(47.2602, 11.3439).distance_nm(lat, lon), expected, rtol=1e-9, atol=1e-9)
+	for a, b, e in zip(lat[:50], lon[:50], expected):
+		assert ai_atc.getDistanceToLocation(float(a), float(b), 47.2602, 11.3439) == pytest.approx(e, rel=1e-9, abs=1e-9)
+
+
+def test_bearing_matches_reference(positions):
+	lat, lon = positions
+	expected = np.array([reference_bearing(a, b, 47.2602, 11.3439) for a, b in zip(lat, lon)])
+	for actual in (geodesy.bearing(lat, lon, 47.2602, 11.3439), geodesy.reference(47.2602, 11.3439).bearing_from(lat, lon)):
+		difference = (actual - expected + 180) % 360 - 180
+		assert np.abs(difference).max() < 1e-9
+	for a, b, e in zip(lat[:50], lon[:50], expected):
+		assert ai_atc.getHeadingToLocation(float(a), float(b), 47.2602, 11.3439) == pytest.approx(e, abs=1e-9)
+
+
+def test_bearing_to_direction_matches_reference():
+	headings = np.arange(0.0, 360.0, 0.25)
+	assert list(geodesy.bearing_to_direction(headings)) == [reference_bearing_to_direction(h) for h in headings]
+	assert all(ai_atc.bearingToDirection(h) == reference_bearing_to_direction(h) for h in headings[::7])
+
+
+def test_ecef_to_lla_matches_reference(positions):
+	lat, lon = positions
+	alt = np.linspace(-100, 12000, len(lat))
+	x, y, z = geodesy.lla_to_ecef(lat, lon, alt)
+	expected = np.array([reference_ecef_to_lla(*p) for p in zip(x, y, z)]).T
+	np.testing.assert_allclose(np.array(geodesy.ecef_to_lla(x, y, z)), expected, rtol=1e-12, atol=1e-6)
+	# Round trip
+	np.testing.assert_allclose(expected[0], lat, atol=1e-7)
+	np.testing.assert_allclose(expected[2], alt, atol=1e-3)
+	assert mcfparser.ecef_to_lla(*RUNWAY_ECEF) == pytest.approx(reference_ecef_to_lla(*RUNWAY_ECEF), rel=1e-12)
+
+
+def test_offset_position_matches_reference():
+	norm = math.sqrt(sum(c * c for c in APPROACH_DIRECTION))
+	expected = tuple(p - c / norm * 10000.0 for p, c in zip(RUNWAY_ECEF, APPROACH_DIRECTION))
+	result = mcfparser.offset_position(RUNWAY_ECEF, APPROACH_DIRECTION, 10)
+	assert result["ecef"] == pytest.approx(expected, abs=1e-6)
+	assert result["lla"] == pytest.approx(reference_ecef_to_lla(*expected), rel=1e-12)
+	batch = geodesy.offset_ecef(RUNWAY_ECEF, APPROACH_DIRECTION, [0, 10])
+	assert batch[1] == pytest.approx(expected, abs=1e-6)
+
+
+# --- Speed: scalar reference vs cached reference point vs batch ---
+
+def test_distance_reference_scalar(benchmark):
+	benchmark(reference_distance_nm, 47.4647, 8.5492, 47.2602, 11.3439)
+
+
+def test_distance_cached_reference_point(benchmark):
+	point = geodesy.reference(47.2602, 11.3439)
+	benchmark(point.distance_nm, 47.4647, 8.5492)
+
+
+def test_distance_batch_1000(benchmark, positions):
+	lat, lon = positions
+	benchmark(geodesy.reference(47.2602, 11.3439).distance_nm, lat, lon)
+
+
+def test_ecef_to_lla_batch_1000(benchmark, positions):
+	x, y, z = geodesy.lla_to_ecef(*positions)
+	benchmark(geodesy.ecef_to_lla, x, y, z)
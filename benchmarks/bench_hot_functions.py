@@ -0,0 +1,167 @@
+"""
+Microbenchmarks for the project's hot functions (pytest-benchmark).
+
+Run from the repository root:
+	python -m pytest benchmarks
+Every run is saved under benchmarks/.benchmarks (one file per run, named after the commit).
+Compare against earlier runs, failing on regressions:
+	python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+import ai_atc
+import atis_composer
+import mcfparser
+import airport_diagrams_generator
+from conftest import panel_frame, write_wav
+
+
+# --- Airport data lookups (linear scans over all_airports.json) ---
+
+@pytest.mark.parametrize("icao", ["LSZH", "ZZZZ"])
+def test_get_airport_name(benchmark, airports, icao):
+	benchmark(ai_atc.get_airport_name, icao)
+
+
+def test_get_airport_size(benchmark, airports):
+	benchmark(ai_atc.get_airport_size, "LOWI")
+
+
+def test_get_airport_country(benchmark, airports):
+	benchmark(ai_atc.get_airport_country, "LOWI")
+
+
+def test_get_airport_frequencies(benchmark, airports):
+	benchmark(ai_atc.get_airport_frequencies, "LSZH")
+
+
+def test_get_runway_ils_frequency(benchmark, airports):
+	benchmark(ai_atc.get_runway_ils_frequency, "LSZH", "28")
+
+
+def test_get_reachable_frequencies(benchmark, aerofly_settings, radio_panel, monkeypatch):
+	monkeypatch.setattr(ai_atc, "radioPanel", radio_panel)
+	monkeypatch.setattr(ai_atc, "print", lambda *args, **kwargs: None, raising=False)
+	result = benchmark(ai_atc.getReachableFrequencies)
+	assert result
+
+
+# --- Geodesy ---
+
+def test_get_distance_to_location(benchmark):
+	benchmark(ai_atc.getDistanceToLocation, 47.4647, 8.5492, 47.2602, 11.3439)
+
+
+def test_get_heading_to_location(benchmark):
+	benchmark(ai_atc.getHeadingToLocation, 47.4647, 8.5492, 47.2602, 11.3439)
+
+
+RUNWAY_ECEF = (4265530.3, 847458.0, 4665910.2)
+APPROACH_DIRECTION = (0.5975, 0.5175, -0.6124)
+
+
+def test_ecef_to_lla(benchmark):
+	benchmark(mcfparser.ecef_to_lla, *RUNWAY_ECEF)
+
+
+def test_offset_position(benchmark):
+	benchmark(mcfparser.offset_position, RUNWAY_ECEF, APPROACH_DIRECTION, 10)
+
+
+# --- main.mcf parsing ---
+
+def test_main_mcf_factory_create(benchmark, main_mcf_content):
+	result = benchmark(mcfparser.MainMcfFactory().create, main_mcf_content)
+	assert len(result.navigation["Route"]["Ways"]) == 7
+
+
+# --- Audio and PDF output ---
+
+@pytest.mark.parametrize("seconds", [5, 60])
+def test_add_radio_effect_to_recording(benchmark, tts_clips, tmp_path, seconds):
+	output = str(tmp_path / "radio.wav")
+	benchmark.pedantic(ai_atc.addRadioEffectToRecording, args=(tts_clips[seconds], output), rounds=5 if seconds < 60 else 3, warmup_rounds=1)
+
+
+def test_compose_atis_from_cached_fragments(benchmark, tmp_path):
+	# Fragments are "synthesized" once as short speech-like clips, the benchmark measures assembly only
+	composer = atis_composer.ATISComposer(lambda ssml, path: bool(write_wav(path, 0.5)), ai_atc.radioFilter, str(tmp_path))
+	composer.compose_atis("Zurich Airport", "Bravo", "0900", "28", 250, 6, "ten miles or more")
+	letters = itertools.cycle(["Bravo", "Charlie"])
+	benchmark(lambda: composer.compose_atis("Zurich Airport", next(letters), "0900", "28", 250, 6, "ten miles or more"))
+
+
+@pytest.mark.parametrize("messages", [10, 500])
+def test_write_lines_with_paragraph(benchmark, tmp_path, messages):
+	lines = ["LSZH (Zurich Airport) -> LOWI (Innsbruck Airport), RWY 28 -> 26, cruise 3500 ft",
+		"TWR 118.100, GND 121.800, ATIS 128.525 | TWR 120.100, ATIS 126.025", ""]
+	lines += [f"09:{i // 60 % 60:02d}:{i % 60:02d} Zurich Tower: Hotel Bravo Charlie Delta Echo, climb and maintain {3000 + i % 10 * 500} feet, contact Zurich Approach one one eight decimal one."
+		for i in range(messages)]
+	output = str(tmp_path / "RadioLog.pdf")
+	benchmark.pedantic(ai_atc.write_lines_with_paragraph, args=(output, lines, True, True), rounds=5 if messages < 500 else 3, warmup_rounds=1)
+
+
+# --- RadioPanel ---
+
+def test_radio_panel_frame_decode(benchmark, radio_panel):
+	# Alternate between two frames with new timestamps, so every call is a full decode (no frame skipping).
+	# The first one differs from the fixture's frame too
+	frames = itertools.cycle([panel_frame(t / 10.0, heading=1.41 - (t % 2) * 0.01) for t in range(2, 1002)])
+	calls = itertools.count()
+	decodedBefore = radio_panel.framesDecoded
+
+	def decode():
+		next(calls)
+		radio_panel._process_frame(next(frames))
+
+	benchmark(decode)
+	# One decode per call, however many rounds ran (a single one with --benchmark-disable)
+	assert radio_panel.framesDecoded - decodedBefore == next(calls)
+
+
+# --- Airport diagrams ---
+
+def test_create_diagram_large_osm(benchmark, large_osm_data, tmp_path):
+	generator = airport_diagrams_generator.AirportDiagramGenerator()
+	output = str(tmp_path / "kjfk_diagram.pdf")
+	benchmark.pedantic(generator.create_diagram, args=("KJFK", large_osm_data, output), rounds=3)
+
+
+def test_create_diagram_very_large_osm(benchmark, very_large_osm_data, tmp_path):
+	generator = airport_diagrams_generator.AirportDiagramGenerator()
+	output = str(tmp_path / "eham_diagram.pdf")
+	benchmark.pedantic(generator.create_diagram, args=("EHAM", very_large_osm_data, output), rounds=3)
+
+
+@pytest.mark.parametrize("tolerance_pt", [0.0, 0.25], ids=["full", "simplified"])
+def test_create_diagram_simplification(benchmark, large_osm_data, tmp_path, tolerance_pt):
+	# Vertex count and PDF size are reported with the render time (extra_info in --benchmark-json / saved runs)
+	generator = airport_diagrams_generator.AirportDiagramGenerator()
+	generator.simplify_tolerance_pt = tolerance_pt
+	elements = generator.parse_osm_data(large_osm_data)
+	points = generator.project_elements(elements)
+	simplified = generator.simplify_geometry(elements, points, generator.simplify_tolerance(points))
+	output = str(tmp_path / "kjfk_diagram.pdf")
+	benchmark.pedantic(generator.create_diagram, args=("KJFK", large_osm_data, output), rounds=3)
+	benchmark.extra_info["vertices"] = sum(len(p) for p in simplified)
+	benchmark.extra_info["pdf_bytes"] = os.path.getsize(output)
+
+
+def test_project_and_measure_large_osm(benchmark, very_large_osm_data):
+	# Projection and taxiway lengths of every element without drawing
+	generator = airport_diagrams_generator.AirportDiagramGenerator()
+	elements = generator.parse_osm_data(very_large_osm_data)
+	coordinates = np.array([coord for element in elements for coord in element.coordinates])
+	counts = np.cumsum([len(element.coordinates) for element in elements])[:-1]
+
+	def project_and_measure():
+		points = np.split(generator.project_to_meters(coordinates, *coordinates.mean(axis=0)), counts)
+		return generator._line_lengths(points)
+
+	lengths = benchmark(project_and_measure)
+	assert len(lengths) == len(elements)
@@ -0,0 +1,97 @@
+"""
+MainMcfFactory against the regex parser it replaced (FileParser.get_group at fixed indents), on the sample main.mcf
+as the simulator writes it, with the route nested properly, re-indented with tabs, and grown to a long route
+with padded settings sections (make_large_main_mcf).
+"""
+
+import re
+
+import pytest
+
+import mcfparser
+
+
+def legacy_create(content):
+	"""The get_group-based MainMcfFactory.create, kept as the reference for the tree parser."""
+	parser = mcfparser.FileParser()
+	aircraft = parser.get_group(content, "tmsettings_aircraft")
+	flight = parser.get_group(content, "tmsettings_flight")
+	time_utc = parser.get_group(content, "tm_time_utc")
+	wind = parser.get_group(content, "tmsettings_wind")
+	clouds = parser.get_group(content, "tmsettings_clouds")
+	route = parser.get_group(content, "tmnav_route", 3)
+	ways = parser.get_group(content, "pointer_list_tmnav_route_way", 4)
+
+	waypoints = []
+	for wp in ways.split("<[tmnav_route_")[1:] if ways else []:
+		try:
+			checkpoint_type = mcfparser.MissionCheckpointType(wp[:wp.find("]")])
+		except ValueError:
+			checkpoint_type = mcfparser.MissionCheckpointType.WAYPOINT
+		waypoints.append(mcfparser.MainMcfWaypoint(
+			type=checkpoint_type,
+			Identifier=parser.get_value(wp, "Identifier", ""),
+			Position=parser.get_number_array(wp, "Position"),
+			Direction=parser.get_number_array(wp, "Direction"),
+			NavaidFrequency=parser.get_number(wp, "NavaidFrequency", 0),
+			Elevation=parser.get_number(wp, "Elevation", 0),
+			Altitude=parser.get_number_array(wp, "Altitude"),
+			Length=parser.get_number(wp, "RunwayLength", 0),
+			FlyOver=parser.get_value(wp, "FlyOver", "false").lower() != "false"))
+
+	return mcfparser.MainMcf(
+		aircraft={"name": parser.get_value(aircraft, "name", "c172")},
+		flight_setting={
+			"position": parser.get_number_array(flight, "position") or [0, 0, 0],
+			"orientation": parser.get_number_array(flight, "orientation") or [0, 0, 0],
+			"configuration": parser.get_value(flight, "configuration", ""),
+			"on_ground": parser.get_value(flight, "on_ground", "true").lower() == "true"},
+		time_utc={key: parser.get_number(time_utc, key, 0) for key in ("time_year", "time_month", "time_day", "time_hours")},
+		visibility=parser.get_number(content, "visibility", 0),
+		wind={key: parser.get_number(wind, key, 0) for key in ("strength", "direction_in_degree", "turbulence", "thermal_activity")},
+		clouds={key: parser.get_number(clouds, key, 0) for key in ("cumulus_density", "cumulus_height", "cumulus_mediocris_density",
+			"cumulus_mediocris_height", "cirrus_height", "cirrus_density")},
+		navigation={"Route": {"CruiseAltitude": parser.get_number(route, "CruiseAltitude", -1), "Ways": waypoints}})
+
+
+def nest_navigation(content):
+	"""The sample has tmnav_settings one level shallower than its children, move it inside tmsimulator_settings."""
+	content = content.replace("\n    >\n    <[tmnav_settings][navigation][]\n", "\n        <[tmnav_settings][navigation][]\n", 1)
+	return content[:content.rindex("\n    >\n>")] + "\n        >\n    >\n>" + content[content.rindex("\n    >\n>") + len("\n    >\n>"):]
+
+
+def tab_indented(content):
+	return re.sub(r"(?m)^((?:    )+)", lambda match: "\t" * (len(match.group(1)) // 4), content)
+
+
+@pytest.mark.parametrize("variant", [lambda c: c, nest_navigation], ids=["sample", "nested"])
+def test_matches_get_group_parser(main_mcf_content, variant):
+	content = variant(main_mcf_content)
+	expected = legacy_create(content)
+	assert len(expected.navigation["Route"]["Ways"]) == 7
+	assert mcfparser.MainMcfFactory().create(content) == expected
+
+
+def test_independent_of_indentation(main_mcf_content):
+	# get_group only finds groups at its fixed indents, the tree parser follows the brackets
+	assert mcfparser.MainMcfFactory().create(tab_indented(main_mcf_content)) == legacy_create(main_mcf_content)
+
+
+def test_parse_main_mcf_legacy(benchmark, main_mcf_content):
+	benchmark(legacy_create, main_mcf_content)
+
+
+# --- Large configs with long routes, where the single pass pays off ---
+
+def test_large_matches_get_group_parser(large_main_mcf_content):
+	result = mcfparser.MainMcfFactory().create(large_main_mcf_content)
+	assert len(result.navigation["Route"]["Ways"]) == 507
+	assert result == legacy_create(large_main_mcf_content)
+
+
+def test_parse_large_main_mcf(benchmark, large_main_mcf_content):
+	benchmark(mcfparser.MainMcfFactory().create, large_main_mcf_content)
+
+
+def test_parse_large_main_mcf_legacy(benchmark, large_main_mcf_content):
+	benchmark(legacy_create, large_main_mcf_content)
@@ -0,0 +1,176 @@
+"""
+Fixtures for the microbenchmark suite (bench_*.py), built from all_airports.json and fixtures/main.mcf.
+"""
+
+import json
+import math
+import os
+import random
+import re
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, REPO_ROOT)
+
+# No sound card in CI
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import ai_atc
+import RadioPanel
+from telemetry_source import GeneratorSource, encode_frame
+
+
+@pytest.fixture(scope="session")
+def airports():
+	with open(os.path.join(REPO_ROOT, "all_airports.json"), "r", encoding="utf-8") as f:
+		data = json.load(f)
+	ai_atc.airports = data
+	return data
+
+
+@pytest.fixture(scope="session")
+def main_mcf_path():
+	return os.path.join(FIXTURES, "main.mcf")
+
+
+@pytest.fixture(scope="session")
+def main_mcf_content(main_mcf_path):
+	with open(main_mcf_path, "r", encoding="utf-8") as f:
+		return f.read()
+
+
+def make_large_main_mcf(content, waypoints=500, padding=200):
+	"""The sample main.mcf with a long route (copies of its first waypoint before the destination runway) and
+	padding entries at the start of the settings sections, like a long airway route and a heavily customized install."""
+	waypoint = re.search(r"(?ms)^( *)<\[tmnav_route_waypoint\]\[waypoint\]\[\]\n.*?^\1>\n", content).group(0)
+	route = "".join(waypoint.replace("[Identifier][TRA]", f"[Identifier][W{i:04d}]") for i in range(waypoints))
+	destination = re.search(r"(?m)^ *<\[tmnav_route_destination_runway\]", content).start()
+	content = content[:destination] + route + content[destination:]
+
+	for section in ("tmsettings_aircraft", "tmsettings_flight", "tmsettings_wind", "tmsettings_clouds"):
+		header = re.search(rf"(?m)^( *)<\[{section}\].*\n", content)
+		entries = "".join(f"{header.group(1)}    <[float64][unused_{i}][0]>\n" for i in range(padding))
+		content = content[:header.end()] + entries + content[header.end():]
+	return content
+
+
+@pytest.fixture(scope="session")
+def large_main_mcf_content(main_mcf_content):
+	return make_large_main_mcf(main_mcf_content)
+
+
+@pytest.fixture(scope="session")
+def aerofly_settings(airports, main_mcf_path):
+	"""ai_atc.aeroflySettings loaded from the sample main.mcf (LSZH -> LOWI)."""
+	ai_atc.mcf_path = main_mcf_path
+	ai_atc.CREATE_AIRPORT_DIAGRAMS = False
+	ai_atc.loadAeroflySettings(generateATIS=False)
+	return ai_atc.aeroflySettings
+
+
+def panel_frame(timestamp, heading=1.4):
+	"""Frame in the DLL's format for a C172 near Zurich, tuned to Zurich Tower."""
+	return encode_frame({
+		"Communication.COM1Volume": 0.8,
+		"Communication.COM2Volume": 0.6,
+		"Communication.MicrophoneSelect": 1.0,
+		"Communication.COM1Frequency": 118100000.0,
+		"Communication.COM2Frequency": 121800000.0,
+		"Communication.COM1AudioSelect": 1.0,
+		"Communication.COM2AudioSelect": 0.0,
+		"Communication.AUXAudioSelect": 0.0,
+		"Communication.TransponderCode": 7000.0,
+		"Communication.TransponderIdent": 0.0,
+		"Communication.TransponderMode": 4.0,
+		"Aircraft.OnGround": 0.0,
+		"Aircraft.OnRunway": 0.0,
+		"Aircraft.Longitude": math.radians(8.62),
+		"Aircraft.Latitude": math.radians(47.48),
+		"Aircraft.TrueHeading": heading,
+		"Aircraft.GroundSpeed": 55.0,
+		"Aircraft.Altitude": 900.0,
+		"Aircraft.Name": "c172",
+		"Aircraft.Height": 470.0,
+	}, timestamp)
+
+
+@pytest.fixture
+def radio_panel():
+	panel = RadioPanel.RadioPanel(True, GeneratorSource([panel_frame(1.0)]))
+	panel.poll_once()
+	return panel
+
+
+def write_wav(path, seconds, sample_rate=16000):
+	"""Speech-like test clip: a few harmonics with a syllable-rate envelope, 16 bit mono PCM like the Azure TTS output."""
+	t = np.arange(int(seconds * sample_rate)) / sample_rate
+	signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180.0, 360.0, 720.0, 1440.0)))
+	envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4.0 * t)
+	pcm = (signal * envelope * 6000).astype("<i2")
+	with wave.open(path, "wb") as w:
+		w.setnchannels(1)
+		w.setsampwidth(2)
+		w.setframerate(sample_rate)
+		w.writeframes(pcm.tobytes())
+	return path
+
+
+@pytest.fixture(scope="session")
+def tts_clips(tmp_path_factory):
+	folder = tmp_path_factory.mktemp("clips")
+	return {seconds: write_wav(str(folder / f"clip_{seconds}s.wav"), seconds) for seconds in (5, 60)}
+
+
+def make_large_osm(elements=3000, seed=42, center=(40.6413, -73.7781)):
+	"""Deterministic Overpass-style response the size of a large airport (KJFK has a few thousand aeroway/building ways)."""
+	rng = random.Random(seed)
+	lat0, lon0 = center
+	data = []
+
+	def way(tags, points, closed):
+		geometry = [{"lat": lat, "lon": lon} for lat, lon in points]
+		if closed:
+			geometry.append(geometry[0])
+		data.append({"type": "way", "id": len(data) + 1, "tags": tags, "geometry": geometry})
+
+	def line(length_deg, nodes):
+		lat, lon = lat0 + rng.uniform(-0.02, 0.02), lon0 + rng.uniform(-0.03, 0.03)
+		angle = rng.uniform(0, math.pi)
+		return [(lat + math.sin(angle) * length_deg * i / nodes, lon + math.cos(angle) * length_deg * i / nodes) for i in range(nodes + 1)]
+
+	def polygon(radius_deg, nodes):
+		lat, lon = lat0 + rng.uniform(-0.02, 0.02), lon0 + rng.uniform(-0.03, 0.03)
+		return [(lat + math.sin(2 * math.pi * i / nodes) * radius_deg * rng.uniform(0.7, 1.0),
+				lon + math.cos(2 * math.pi * i / nodes) * radius_deg * rng.uniform(0.7, 1.0)) for i in range(nodes)]
+
+	for i in range(8):
+		way({"aeroway": "runway", "ref": f"{4 + i}L/{22 + i}R"}, line(0.03, 40), False)
+	for i in range(elements // 4):
+		way({"aeroway": "taxiway", "ref": f"{chr(65 + i % 26)}{i % 9}"}, line(rng.uniform(0.001, 0.01), rng.randint(5, 60)), False)
+	for i in range(elements // 10):
+		way({"aeroway": "apron"}, polygon(rng.uniform(0.0005, 0.003), rng.randint(8, 80)), True)
+	for i in range(elements // 2):
+		way({"building": "yes"}, polygon(rng.uniform(0.00005, 0.0004), rng.randint(4, 24)), True)
+	for i in range(elements // 20):
+		way({"aeroway": rng.choice(["terminal", "hangar"]), "building": "yes"}, polygon(rng.uniform(0.0003, 0.001), rng.randint(10, 120)), True)
+	for i in range(elements // 10):
+		way({"landuse": "grass"}, polygon(rng.uniform(0.0005, 0.004), rng.randint(6, 40)), True)
+	for i in range(elements // 10):
+		way({"highway": "service"}, line(0.004, 10), False)	# skipped by the generator
+	return {"elements": data}
+
+
+@pytest.fixture(scope="session")
+def large_osm_data():
+	return make_large_osm()
+
+
+@pytest.fixture(scope="session")
+def very_large_osm_data():
+	"""A hub with full building and taxiway-segment coverage in OSM (EHAM, KDFW), four times the large airport."""
+	return make_large_osm(elements=12000, seed=7)
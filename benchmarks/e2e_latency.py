@@ -0,0 +1,384 @@
+"""
+End-to-end latency benchmark: from PTT release to the first ATC audio.
+
+Runs the real pipeline from ai_atc (recognized_handler -> trySendingMessage -> sendMessageToAI ->
+ChatSession.get_response -> ATCResponse -> sayWithRadioEffect -> addRadioEffectToRecording ->
+playRadioMessageFromQueue) against local stand-ins, so it works offline and without API keys:
+- an OpenAI-compatible HTTP server with scripted delays (time to first token, tokens per second),
+  answering both normal and streamed chat completions,
+- a fake Azure speech synthesizer writing PCM wav files after a scripted delay,
+- scripted recognizer events, fired after a scripted end-of-speech delay.
+
+Usage (from the repository root):
+	python benchmarks/e2e_latency.py [--runs 10] [--ttft 0.35] [--tokens-per-second 80]
+		[--tts-latency 0.25] [--stt-latency 0.5] [--json results.json]
+"""
+
+import argparse
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+import wave
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+
+# No sound card in CI
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import ai_atc
+
+
+PILOT_MESSAGES = [
+	"Zurich Tower, Hotel Bravo Charlie Delta Echo, holding short runway two eight, ready for departure.",
+	"Zurich Ground, Hotel Bravo Charlie Delta Echo, at the apron, request taxi for VFR flight to Innsbruck.",
+	"Zurich Tower, Hotel Bravo Charlie Delta Echo, climbing through three thousand feet, request frequency change.",
+]
+
+ATC_REPLIES = [
+	{"ATC_VOICE": "Hotel Bravo Charlie Delta Echo, wind two seven zero degrees eight knots, runway two eight, cleared for takeoff.", "COMMENTS": "", "ENTITY": "Zurich Tower", "FREQUENCY": "0", "READBACK": "NO"},
+	{"ATC_VOICE": "Hotel Bravo Charlie Delta Echo, taxi to holding point runway two eight via Alpha, QNH one zero one three.", "COMMENTS": "", "ENTITY": "Zurich Ground", "FREQUENCY": "0", "READBACK": "NO"},
+	{"ATC_VOICE": "Hotel Bravo Charlie Delta Echo, frequency change approved, good day.", "COMMENTS": "", "ENTITY": "Zurich Tower", "FREQUENCY": "0", "READBACK": "NO"},
+]
+
+STAGES = ["stt", "dispatch", "llm", "tts", "radio_effect", "queue_wait"]	# in pipeline order, they add up to END_TO_END
+END_TO_END = "end_to_end"	# PTT release to first audio
+
+
+def percentile(values, p):
+	return float(np.percentile(values, p)) if values else math.nan
+
+
+class StageTimer:
+	"""Collects durations (in seconds) per pipeline stage. The stages run one after another and each one is
+	timed from the end of the previous one (from start() for the first), so per run they add up to the total."""
+
+	def __init__(self):
+		self.samples = defaultdict(list)
+		self._lock = threading.Lock()
+		self._last = None
+
+	def add(self, stage, seconds):
+		with self._lock:
+			self.samples[stage].append(seconds)
+
+	def start(self):
+		with self._lock:
+			self._last = time.perf_counter()
+			return self._last
+
+	def mark(self, stage):
+		"""End of a stage: record the time since the end of the previous one."""
+		with self._lock:
+			now = time.perf_counter()
+			self.samples[stage].append(now - self._last)
+			self._last = now
+			return now
+
+	def wrap(self, stage, func, previous=None):
+		"""func ends stage when it returns. With previous, calling it ends that stage (getting to the call)."""
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if previous:
+				self.mark(previous)
+			try:
+				return func(*args, **kwargs)
+			finally:
+				self.mark(stage)
+		return wrapper
+
+	def _summary(self, stage):
+		return {
+			"n": len(self.samples[stage]),
+			"p50_ms": percentile(self.samples[stage], 50) * 1000,
+			"p95_ms": percentile(self.samples[stage], 95) * 1000,
+			"p99_ms": percentile(self.samples[stage], 99) * 1000,
+		}
+
+	def report(self):
+		return {"stages": {stage: self._summary(stage) for stage in STAGES}, END_TO_END: self._summary(END_TO_END)}
+
+
+# --- OpenAI-compatible LLM stand-in ---
+
+class ScriptedLLMServer(ThreadingHTTPServer):
+	"""Answers /chat/completions with scripted ATC replies, simulating time to first token and generation speed."""
+	daemon_threads = True
+
+	def __init__(self, ttft, tokensPerSecond, replies):
+		super().__init__(("127.0.0.1", 0), ScriptedLLMHandler)
+		self.ttft = ttft
+		self.tokensPerSecond = tokensPerSecond
+		self.replies = replies
+		self.requests = 0
+		self._lock = threading.Lock()
+
+	@property
+	def url(self):
+		return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+	def next_reply(self):
+		with self._lock:
+			reply = self.replies[self.requests % len(self.replies)]
+			self.requests += 1
+		return json.dumps(reply)
+
+
+def tokenize(text):
+	# Roughly 4 characters per token, like typical BPE tokenizers on English text
+	return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class ScriptedLLMHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def do_POST(self):
+		request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+		content = self.server.next_reply()
+		tokens = tokenize(content)
+		promptTokens = sum(len(str(m.get("content") or "")) for m in request.get("messages", [])) // 4
+		usage = {"prompt_tokens": promptTokens, "completion_tokens": len(tokens), "total_tokens": promptTokens + len(tokens)}
+		base = {"id": "chatcmpl-benchmark", "created": int(time.time()), "model": request.get("model", "local-model")}
+
+		time.sleep(self.server.ttft)
+		if request.get("stream"):
+			self.send_response(200)
+			self.send_header("Content-Type", "text/event-stream")
+			self.send_header("Transfer-Encoding", "chunked")
+			self.end_headers()
+			for i, token in enumerate(tokens):
+				delta = {"content": token} if i else {"role": "assistant", "content": token}
+				self._send_chunk(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+				time.sleep(1.0 / self.server.tokensPerSecond)
+			self._send_chunk(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=usage))
+			self._write_chunk(b"data: [DONE]\n\n")
+			self._write_chunk(b"")
+			return
+
+		time.sleep(len(tokens) / self.server.tokensPerSecond)
+		body = json.dumps(dict(base, object="chat.completion", usage=usage, choices=[
+			{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+		])).encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _send_chunk(self, payload):
+		self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+	def _write_chunk(self, data):
+		self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+		self.wfile.flush()
+
+	def log_message(self, format, *args):
+		pass
+
+
+# --- Azure speech SDK stand-in ---
+
+class FakeSpeechSDK:
+	"""Replaces the parts of azure.cognitiveservices.speech used by ai_atc with a synthesizer writing PCM files."""
+
+	ResultReason = SimpleNamespace(SynthesizingAudioCompleted="SynthesizingAudioCompleted", Canceled="Canceled")
+
+	def __init__(self, latency, secondsPerWord=0.05, sampleRate=16000):
+		sdk = self
+
+		class AudioOutputConfig:
+			def __init__(self, filename=None, use_default_speaker=False):
+				self.filename = filename
+
+		class SpeechSynthesizer:
+			def __init__(self, speech_config=None, audio_config=None):
+				self.filename = audio_config.filename if audio_config else None
+
+			def speak_text_async(self, text):
+				return SimpleNamespace(get=lambda: sdk.synthesize(text, self.filename))
+
+			speak_ssml_async = speak_text_async
+
+		self.latency = latency
+		self.secondsPerWord = secondsPerWord
+		self.sampleRate = sampleRate
+		self.audio = SimpleNamespace(AudioOutputConfig=AudioOutputConfig)
+		self.SpeechSynthesizer = SpeechSynthesizer
+
+	def synthesize(self, text, filename):
+		time.sleep(self.latency)
+		if filename:
+			samples = int(self.sampleRate * max(0.5, len(text.split()) * self.secondsPerWord))
+			t = np.arange(samples) / self.sampleRate
+			pcm = (np.sin(2 * np.pi * 220.0 * t) * 8000).astype("<i2")
+			with wave.open(filename, "wb") as w:
+				w.setnchannels(1)
+				w.setsampwidth(2)
+				w.setframerate(self.sampleRate)
+				w.writeframes(pcm.tobytes())
+		return SimpleNamespace(reason=self.ResultReason.SynthesizingAudioCompleted, cancellation_details=None)
+
+
+# --- Recognizer and UI stand-ins ---
+
+class ScriptedRecognizer:
+	"""Fires ai_atc.recognized_handler the way the Azure recognizer does after PTT release."""
+
+	def __init__(self, latency, timer):
+		self.latency = latency
+		self.timer = timer
+
+	def release_ptt(self, text):
+		ai_atc.tracing.start_transmission()
+		def recognized():
+			time.sleep(self.latency)
+			self.timer.mark("stt")
+			ai_atc.recognized_handler(SimpleNamespace(result=SimpleNamespace(text=text)))
+
+		released = self.timer.start()
+		ai_atc.sttSpan = ai_atc.tracing.start_span("stt_finalize")
+		threading.Thread(target=recognized, daemon=True).start()
+		return released
+
+
+class TextBoxStandIn:
+	def delete(self, *args):
+		pass
+
+	def insert(self, *args):
+		pass
+
+	def see(self, *args):
+		pass
+
+
+class LatencyBenchmark:
+	def __init__(self, args):
+		self.args = args
+		self.timer = StageTimer()
+		self.server = ScriptedLLMServer(args.ttft, args.tokens_per_second, ATC_REPLIES)
+		self.recognizer = ScriptedRecognizer(args.stt_latency, self.timer)
+		self.enqueued = set()	# radio effect files put into the playback queue
+		self.firstAudio = None
+		self.firstAudioEvent = threading.Event()
+
+	def install(self):
+		timer = self.timer
+		benchmark = self
+		os.makedirs("Temp", exist_ok=True)
+		with open("all_airports.json", "r", encoding="utf-8") as f:
+			ai_atc.airports = json.load(f)
+		ai_atc.aeroflySettings = ai_atc.AeroflySettings(origin_name="LSZH", destination_name="LOWI")
+
+		ai_atc.AI_TYPE = "LOCAL"
+		ai_atc.LOCAL_AI_BASE_URL = self.server.url
+		ai_atc.speechsdk = FakeSpeechSDK(self.args.tts_latency)
+		ai_atc.speech_config = SimpleNamespace(speech_synthesis_voice_name=None)
+		ai_atc.atc_text_box = TextBoxStandIn()
+		ai_atc.writeRadioLogToFile = lambda: None	# PDF writing is covered by the microbenchmarks
+		ai_atc.radioPanel = None
+		ai_atc.atcSessionStarted = True
+		ai_atc.chatSession = ai_atc.ChatSession(ai_atc.ATC_RESPONSE_FORMAT, ai_atc.ATC_INIT_INSTRUCTIONS, None)
+
+		# Stage timings: dispatch ends when the request is sent, each later stage when its step returns
+		ai_atc.ChatSession.get_response = timer.wrap("llm", ai_atc.ChatSession.get_response, previous="dispatch")
+		ai_atc.addRadioEffectToRecording = timer.wrap("radio_effect", ai_atc.addRadioEffectToRecording)
+
+		originalSynthesize = ai_atc.speechsdk.synthesize
+		ai_atc.speechsdk.synthesize = timer.wrap("tts", originalSynthesize)
+
+		originalSay = ai_atc.sayWithRadioEffect
+		def sayWithRadioEffect(*args, **kwargs):
+			result = originalSay(*args, **kwargs)
+			benchmark.enqueued.add(ai_atc.radioPlaybackQueue[-1][0])
+			return result
+		ai_atc.sayWithRadioEffect = sayWithRadioEffect
+
+		class TimedSound(pygame.mixer.Sound):
+			def __init__(self, file, *args, **kwargs):
+				super().__init__(file, *args, **kwargs)
+				self.file = file
+
+			def play(self, *args, **kwargs):
+				if self.file in benchmark.enqueued and not benchmark.firstAudioEvent.is_set():
+					benchmark.enqueued.discard(self.file)
+					benchmark.firstAudio = timer.mark("queue_wait")
+					benchmark.firstAudioEvent.set()
+				return super().play(*args, **kwargs)
+		pygame.mixer.Sound = TimedSound
+
+		pygame.mixer.init()
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		threading.Thread(target=ai_atc.playRadioMessageFromQueue, daemon=True).start()
+
+	def run(self):
+		self.install()
+		for i in range(self.args.warmup + self.args.runs):
+			measured = i >= self.args.warmup
+			self.firstAudioEvent.clear()
+			self.released = self.recognizer.release_ptt(PILOT_MESSAGES[i % len(PILOT_MESSAGES)])
+			if not self.firstAudioEvent.wait(self.args.timeout):
+				print(f"Run {i}: no audio within {self.args.timeout} s")
+				continue
+			endToEnd = self.firstAudio - self.released
+			if measured:
+				self.timer.add(END_TO_END, endToEnd)
+			else:
+				# Drop warm-up samples
+				for samples in self.timer.samples.values():
+					samples.clear()
+			print(f"Run {i}{'' if measured else ' (warm-up)'}: first audio after {endToEnd * 1000:.0f} ms")
+			self.wait_for_idle_player()
+		self.server.shutdown()
+		return self.timer.report()
+
+	def wait_for_idle_player(self):
+		# Let the player finish the message and its pause, so every run starts with an idle queue
+		while ai_atc.radioPlaybackQueue or ai_atc.communicationWithAIInProgress:
+			time.sleep(0.05)
+		time.sleep(3.1)
+
+
+def print_report(report):
+	print()
+	print(f"{'stage':<14}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+	def printRow(stage, row):
+		print(f"{stage:<14}{row['n']:>5}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+	for stage, row in report["stages"].items():
+		printRow(stage, row)
+	print("-" * 49)
+	printRow(END_TO_END, report[END_TO_END])
+
+
+def main():
+	parser = argparse.ArgumentParser(description="PTT release to first audio latency of the ATC pipeline, with local stand-ins.")
+	parser.add_argument("--runs", type=int, default=10)
+	parser.add_argument("--warmup", type=int, default=1)
+	parser.add_argument("--ttft", type=float, default=0.35, help="LLM time to first token, seconds")
+	parser.add_argument("--tokens-per-second", type=float, default=80.0, help="LLM generation speed")
+	parser.add_argument("--tts-latency", type=float, default=0.25, help="Synthesizer latency, seconds")
+	parser.add_argument("--stt-latency", type=float, default=0.5, help="Recognizer end-of-speech latency, seconds")
+	parser.add_argument("--timeout", type=float, default=30.0)
+	parser.add_argument("--json", help="Write the report to this file")
+	args = parser.parse_args()
+
+	report = LatencyBenchmark(args).run()
+	print_report(report)
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump({"settings": vars(args), **report}, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import airport_diagrams_generator
+import osm_cache
+
+
+AIRPORTS_FILE = "all_airports.json"
+OVERPASS_INTERVAL = 2.0	# seconds between Overpass requests, the public instance allows a couple of slots per IP
+OVERPASS_MAX_INTERVAL = 60.0	# backoff limit after failed requests
+WORKERS = max(1, (os.cpu_count() or 2) - 1)	# rendering processes, one core is left for fetching
+
+
+def load_airports(path: str = AIRPORTS_FILE) -> List[Dict]:
+	with open(path, "r", encoding="utf-8") as file:
+		return json.load(file)
+
+
+def select_airports(airports: Sequence[Dict], icao_codes: Sequence[str] = (), country: Optional[str] = None, airport_type: Optional[str] = None) -> List[str]:
+	"""ICAO codes to generate: the listed ones, plus the airports matching country and type (both filters apply)."""
+	selected = [code.upper() for code in icao_codes]
+	if country or airport_type:
+		selected += [airport["icao"].upper() for airport in airports if airport.get("icao")
+			and (not country or (airport.get("iso_country") or "").upper() == country.upper())
+			and (not airport_type or airport.get("type") == airport_type)]
+	return list(dict.fromkeys(selected))
+
+
+def render_diagram(icao_code: str, force: bool = False) -> Tuple[str, Optional[str], float]:
+	"""Render one diagram from cached OSM data, in a pool process. Returns (icao, pdf path or None, seconds)."""
+	start = time.perf_counter()
+	filename = airport_diagrams_generator.diagram_path(icao_code)
+	if os.path.exists(filename) and not force:
+		return icao_code, filename, 0.0
+	fetcher = airport_diagrams_generator.AirportOSMFetcher(offline=True)
+	osm_data = fetcher.get_specific_features(icao_code, osm_cache.DIAGRAM_FEATURES)
+	if not osm_data:
+		return icao_code, None, time.perf_counter() - start
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+	result = airport_diagrams_generator.AirportDiagramGenerator().create_diagram(icao_code, osm_data, filename)
+	return icao_code, result or None, time.perf_counter() - start
+
+
+class DiagramBatch:
+	"""Generates diagrams for many airports: OSM data is fetched in this process, one Overpass request at a time
+	with at least interval seconds between them (cached airports need no request), and every airport whose data
+	is cached is rendered right away in a process pool, so fetching and rendering overlap."""
+
+	def __init__(self, workers: int = WORKERS, interval: float = OVERPASS_INTERVAL, offline: bool = False, force: bool = False):
+		self.workers = workers
+		self.interval = interval
+		self.offline = offline
+		self.force = force
+		self.fetcher = airport_diagrams_generator.AirportOSMFetcher(offline=offline)
+		self._delay = interval
+		self._lastRequest = 0.0
+
+	def _fetch(self, icao_code: str) -> bool:
+		"""Make sure the airport's OSM data is cached, False if it is not available."""
+		query = osm_cache.airport_query(icao_code, osm_cache.DIAGRAM_FEATURES)
+		if self.fetcher.cache.get(icao_code, query, allow_stale=self.offline) is not None:
+			return True
+		if self.offline:
+			print(f"No cached OSM data for {icao_code} (offline)")
+			return False
+
+		wait = self._lastRequest + self._delay - time.monotonic()
+		if wait > 0:
+			time.sleep(wait)
+		self._lastRequest = time.monotonic()
+		if self.fetcher.get_specific_features(icao_code, osm_cache.DIAGRAM_FEATURES) is not None:
+			self._delay = self.interval
+		elif self.fetcher.cache.age(icao_code, query) is None:
+			# Unknown airport, or Overpass refused the request (rate limit, timeout): slow down until a request succeeds
+			self._delay = min(self._delay * 2, OVERPASS_MAX_INTERVAL)
+			return False
+		return True
+
+	def run(self, icao_codes: Sequence[str]) -> Dict[str, List[str]]:
+		"""Generate the diagrams, returns the ICAO codes per outcome: generated, existing, failed."""
+		results = {"generated": [], "existing": [], "failed": []}
+		started = time.perf_counter()
+		with ProcessPoolExecutor(self.workers) as pool:
+			futures = []
+			for index, icao_code in enumerate(icao_codes, 1):
+				if not self.force and os.path.exists(airport_diagrams_generator.diagram_path(icao_code)):
+					results["existing"].append(icao_code)
+					continue
+				print(f"[{index}/{len(icao_codes)}] {icao_code}")
+				if self._fetch(icao_code):
+					futures.append(pool.submit(render_diagram, icao_code, self.force))
+				else:
+					results["failed"].append(icao_code)
+
+			for future in as_completed(futures):
+				try:
+					icao_code, path, seconds = future.result()
+				except Exception as e:
+					print(f"Rendering failed: {e}")
+					continue
+				results["generated" if path else "failed"].append(icao_code)
+				if path:
+					print(f"{icao_code}: {path} ({seconds:.1f} s)")
+
+		print(f"{len(results['generated'])} generated, {len(results['existing'])} already existed, {len(results['failed'])} failed "
+			f"in {time.perf_counter() - started:.0f} s")
+		return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Pre-generate airport diagrams into AirportDiagrams, e.g. a whole region overnight.")
+	parser.add_argument("icao", nargs="*", help="ICAO codes of airports")
+	parser.add_argument("--country", help="All airports of this ISO country code in all_airports.json (with --type: only that type)")
+	parser.add_argument("--type", dest="airport_type", help="All airports of this type in all_airports.json, e.g. large_airport")
+	parser.add_argument("--workers", type=int, default=WORKERS, help="Rendering processes")
+	parser.add_argument("--interval", type=float, default=OVERPASS_INTERVAL, help="Seconds between Overpass requests")
+	parser.add_argument("--offline", action="store_true", default=osm_cache.offline, help="Only use cached or imported OSM data")
+	parser.add_argument("--force", action="store_true", help="Regenerate existing diagrams")
+	parser.add_argument("--airports", default=AIRPORTS_FILE, help="Airport list")
+	args = parser.parse_args()
+
+	icao_codes = select_airports(load_airports(args.airports), args.icao, args.country, args.airport_type)
+	if not icao_codes:
+		parser.print_usage()
+		print("No airports selected")
+		sys.exit(1)
+
+	print(f"{len(icao_codes)} airports, {args.workers} rendering processes")
+	DiagramBatch(args.workers, args.interval, args.offline, args.force).run(icao_codes)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,189 @@
+import threading
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Tuple
+
+import geodesy
+import geofence
+
+
+class FlightPhase(Enum):
+	ON_GROUND	= 1
+	IN_FLIGHT   = 2
+	DESCENDING  = 3
+	APPROACH    = 4
+	LANDING     = 5
+
+
+AIRBORNE_PHASES = frozenset([FlightPhase.IN_FLIGHT, FlightPhase.DESCENDING, FlightPhase.APPROACH, FlightPhase.LANDING])
+
+# Phase detection thresholds. Speeds in m/s, heights in meters above ground, distances in nautical miles.
+TAKEOFF_GROUND_SPEED = 40.0
+TAKEOFF_HEIGHT = 50.0
+LANDED_GROUND_SPEED = 30.0
+LANDED_HEIGHT = 10.0
+DESCENT_VERTICAL_SPEED = -2.5	# about -500 ft/min
+CLIMB_VERTICAL_SPEED = 2.5	# DESCENDING/LANDING are only left with a clear climb (step climb, go-around)
+APPROACH_DISTANCE = 15.0	# distance to go to the destination runway
+APPROACH_EXIT_DISTANCE = 20.0	# hysteresis: APPROACH is left only when this far away again
+APPROACH_HEIGHT = 1500.0
+LANDING_DISTANCE = 4.0
+LANDING_HEIGHT = 300.0
+VERTICAL_SPEED_WINDOW = 5.0	# seconds of telemetry history used for vertical speed
+VERTICAL_SPEED_INTERVAL = 0.5	# sim time in seconds between vertical speed fits, frames in between reuse the last one
+
+# Sim time in seconds a new phase has to be detected continuously before it is entered
+DEBOUNCE_TIME: Dict[FlightPhase, float] = {
+	FlightPhase.ON_GROUND: 0.5,
+	FlightPhase.IN_FLIGHT: 0.5,
+	FlightPhase.DESCENDING: 5.0,
+	FlightPhase.APPROACH: 2.0,
+	FlightPhase.LANDING: 1.0,
+}
+
+# Frequency handoffs (geofence.handoff_fences), only on flights where the destination runway is further than this from the origin
+HANDOFF_MIN_FLIGHT_DISTANCE = 40.0
+
+# Event names
+PHASE_CHANGED = "phase_changed"
+CENTER_HANDOFF = "center_handoff"
+APPROACH_HANDOFF = "approach_handoff"
+TOWER_HANDOFF = "tower_handoff"
+
+
+@dataclass(frozen=True)
+class FlightPhaseEvent:
+	name: str	# PHASE_CHANGED or one of the handoff events
+	phase: FlightPhase	# phase after the event
+	previous: Optional[FlightPhase]	# phase before a PHASE_CHANGED event, None for handoffs
+	snapshot: object	# RadioPanel.TelemetrySnapshot of the frame that triggered the event
+	distance_to_go: float	# nautical miles to the destination runway
+	time: float	# sim time of the phase change or of the fence crossing (interpolated between frames)
+
+
+class FlightPhaseEngine:
+	"""Flight phase state machine evaluated on every new RadioPanel frame (RadioPanel.add_frame_listener).
+
+	Phases go ON_GROUND -> IN_FLIGHT -> DESCENDING -> APPROACH -> LANDING -> ON_GROUND, from ground speed, height,
+	vertical speed (least-squares over telemetry history) and distance to go. A phase is entered only after it has been
+	detected for DEBOUNCE_TIME of sim time, and leaving a phase needs a stronger condition than entering it (hysteresis),
+	so noise around a threshold does not make the phase flicker.
+	Listeners get FlightPhaseEvents on the polling thread and must not block it."""
+
+	def __init__(self):
+		self._listeners: List[Tuple[Callable[[FlightPhaseEvent], None], Optional[frozenset]]] = []
+		self._lock = threading.Lock()
+		self.reset()
+
+	def subscribe(self, func: Callable[[FlightPhaseEvent], None], events=None):
+		"""Call func(event) for the given event names, or for all events if None."""
+		self._listeners.append((func, frozenset(events) if events else None))
+
+	def reset(self, origin: Tuple[float, float] = (0.0, 0.0), destinationRunway: Tuple[float, float] = (0.0, 0.0), approachStart: Tuple[float, float] = (0.0, 0.0), route=None):
+		"""Start a new flight on ground at the origin. Positions are (latitude, longitude) in degrees,
+		route is the flight plan's RouteGeometry (optional), projected on every frame into routePosition."""
+		with self._lock:
+			self.phase = FlightPhase.ON_GROUND
+			self._set_flight_plan(origin, destinationRunway, approachStart, route)
+			self._candidate: Optional[FlightPhase] = None
+			self._candidateSince = 0.0
+			self._verticalSpeed = 0.0
+			self._verticalSpeedTime: Optional[float] = None
+
+	def set_flight_plan(self, origin: Tuple[float, float], destinationRunway: Tuple[float, float], approachStart: Tuple[float, float], route=None):
+		"""Change the flight plan during the flight (main.mcf edited), keeping the current phase.
+		Handoff fences are rebuilt, handoffs already done to unchanged places are not repeated."""
+		with self._lock:
+			previousFences = self.handoffFences
+			self._set_flight_plan(origin, destinationRunway, approachStart, route)
+			self.handoffFences.keep_fired(previousFences)
+
+	def _set_flight_plan(self, origin, destinationRunway, approachStart, route):
+		self.origin = origin
+		self.destinationRunway = destinationRunway
+		self._destination = geodesy.reference(*destinationRunway)
+		self.approachStart = approachStart
+		# Route length does not change during the flight, compute it once
+		self.handoffsEnabled = geodesy.distance_nm(*origin, *destinationRunway) > HANDOFF_MIN_FLIGHT_DISTANCE
+		self.handoffFences = geofence.handoff_fences(origin, destinationRunway, approachStart, TOWER_HANDOFF, APPROACH_HANDOFF, CENTER_HANDOFF)
+		self.distanceToGo = float("inf")
+		self.route = route
+		self.routePosition = None	# RoutePosition of the latest frame
+
+	def on_frame(self, snapshot, history):
+		"""Evaluate a new frame. snapshot is a TelemetrySnapshot, history the panel's TelemetryHistory."""
+		if not snapshot.has_position:
+			return
+		events = []
+		with self._lock:
+			self.distanceToGo = self._destination.distance_nm(snapshot.latitude, snapshot.longitude)
+			if self.route is not None:
+				self.routePosition = self.route.project(snapshot.latitude, snapshot.longitude)
+			target = self._detect(snapshot, history)
+			if target == self.phase:
+				self._candidate = None
+			else:
+				if target != self._candidate:
+					self._candidate = target
+					self._candidateSince = snapshot.sim_time
+				if snapshot.sim_time - self._candidateSince >= DEBOUNCE_TIME[target]:
+					events.append(FlightPhaseEvent(PHASE_CHANGED, target, self.phase, snapshot, self.distanceToGo, snapshot.sim_time))
+					self.phase = target
+					self._candidate = None
+			if self.phase in AIRBORNE_PHASES and self.handoffsEnabled:
+				for fence, crossingTime in self.handoffFences.update(snapshot.sim_time, snapshot.latitude, snapshot.longitude, snapshot.height):
+					events.append(FlightPhaseEvent(fence.name, self.phase, None, snapshot, self.distanceToGo, crossingTime))
+
+		for event in events:
+			self._emit(event)
+
+	def _detect(self, snapshot, history) -> FlightPhase:
+		"""Phase the current frame points to, before debouncing."""
+		phase = self.phase
+		if phase == FlightPhase.ON_GROUND:
+			if snapshot.ground_speed > TAKEOFF_GROUND_SPEED and snapshot.height > TAKEOFF_HEIGHT:
+				return FlightPhase.IN_FLIGHT
+			return phase
+
+		if snapshot.ground_speed < LANDED_GROUND_SPEED and snapshot.height < LANDED_HEIGHT:
+			return FlightPhase.ON_GROUND
+
+		verticalSpeed = self._vertical_speed(snapshot, history)
+		distanceToGo = self.distanceToGo
+		inApproachArea = distanceToGo < APPROACH_DISTANCE and snapshot.height < APPROACH_HEIGHT
+
+		if phase == FlightPhase.IN_FLIGHT:
+			if inApproachArea and verticalSpeed < CLIMB_VERTICAL_SPEED:
+				return FlightPhase.APPROACH
+			if verticalSpeed < DESCENT_VERTICAL_SPEED:
+				return FlightPhase.DESCENDING
+		elif phase == FlightPhase.DESCENDING:
+			if inApproachArea:
+				return FlightPhase.APPROACH
+			if verticalSpeed > CLIMB_VERTICAL_SPEED:
+				return FlightPhase.IN_FLIGHT
+		elif phase == FlightPhase.APPROACH:
+			if distanceToGo < LANDING_DISTANCE and snapshot.height < LANDING_HEIGHT:
+				return FlightPhase.LANDING
+			if distanceToGo > APPROACH_EXIT_DISTANCE:
+				return FlightPhase.DESCENDING if verticalSpeed < DESCENT_VERTICAL_SPEED else FlightPhase.IN_FLIGHT
+		elif phase == FlightPhase.LANDING:
+			if verticalSpeed > CLIMB_VERTICAL_SPEED and snapshot.height > LANDED_HEIGHT:
+				return FlightPhase.APPROACH	# go-around
+		return phase
+
+	def _vertical_speed(self, snapshot, history) -> float:
+		"""Vertical speed over VERTICAL_SPEED_WINDOW, fitted again only every VERTICAL_SPEED_INTERVAL of sim time
+		(or when sim time went back) since the debounce times are much longer than that."""
+		if self._verticalSpeedTime is None or not 0 <= snapshot.sim_time - self._verticalSpeedTime < VERTICAL_SPEED_INTERVAL:
+			self._verticalSpeed = history.vertical_speed(VERTICAL_SPEED_WINDOW) or 0.0
+			self._verticalSpeedTime = snapshot.sim_time
+		return self._verticalSpeed
+
+	def _emit(self, event: FlightPhaseEvent):
+		for func, names in self._listeners:
+			if names is None or event.name in names:
+				try:
+					func(event)
+				except Exception as e:
+					print(f"Error in flight phase listener: {e}")
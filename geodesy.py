@@ -0,0 +1,135 @@
+import functools
+import math
+from typing import Tuple, Union
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0	# mean radius, used for haversine distances
+KM_TO_NM = 0.539957
+
+# WGS84 ellipsoid, used for ECEF conversions (main.mcf positions are ECEF)
+WGS84_A = 6378137.0	# semi-major axis (m)
+WGS84_F = 1 / 298.257223563	# flattening
+WGS84_E2 = WGS84_F * (2 - WGS84_F)	# eccentricity squared
+WGS84_B = WGS84_A * (1 - WGS84_F)	# semi-minor axis
+WGS84_EP2 = (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2	# second eccentricity squared
+
+COMPASS_DIRECTIONS = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+ArrayLike = Union[float, np.ndarray]
+
+
+def _scalar(value):
+	"""Return plain floats for scalar inputs, so wrappers behave like the old math-module functions."""
+	return float(value) if np.ndim(value) == 0 else value
+
+
+# --- Great-circle distance and bearing (arrays broadcast against each other) ---
+
+def distance_nm(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> ArrayLike:
+	"""Haversine distance in nautical miles between points in degrees."""
+	lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+	a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+	return _scalar(EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) * KM_TO_NM)
+
+
+def bearing(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> ArrayLike:
+	"""Initial bearing in degrees (0-360) from point 1 to point 2."""
+	lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+	dlon = lon2 - lon1
+	y = np.sin(dlon) * np.cos(lat2)
+	x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+	return _scalar((np.degrees(np.arctan2(y, x)) + 360) % 360)
+
+
+def bearing_to_direction(heading: ArrayLike):
+	"""Cardinal direction (N, NE...) of the reciprocal of heading: where you are seen from the place you head to."""
+	sector = np.floor(((np.asarray(heading) + 180) % 360 + 22.5) / 45).astype(int) % 8
+	if sector.ndim == 0:
+		return COMPASS_DIRECTIONS[int(sector)]
+	return np.array(COMPASS_DIRECTIONS)[sector]
+
+
+class ReferencePoint:
+	"""Fixed point (airport, runway, waypoint) with its trig terms computed once.
+	Distance and bearing from the current position take the fast math-module path for scalars
+	and the NumPy path for arrays of positions."""
+	__slots__ = ("latitude", "longitude", "lat", "lon", "sin_lat", "cos_lat")
+
+	def __init__(self, latitude: float, longitude: float):
+		self.latitude = latitude
+		self.longitude = longitude
+		self.lat = math.radians(latitude)
+		self.lon = math.radians(longitude)
+		self.sin_lat = math.sin(self.lat)
+		self.cos_lat = math.cos(self.lat)
+
+	def distance_nm(self, latitude: ArrayLike, longitude: ArrayLike) -> ArrayLike:
+		"""Distance in nautical miles from (latitude, longitude) to this point."""
+		if isinstance(latitude, (float, int)) and isinstance(longitude, (float, int)):
+			lat = math.radians(latitude)
+			a = math.sin((self.lat - lat) / 2) ** 2 + math.cos(lat) * self.cos_lat * math.sin((self.lon - math.radians(longitude)) / 2) ** 2
+			return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)) * KM_TO_NM
+		lat = np.radians(latitude)
+		a = np.sin((self.lat - lat) / 2) ** 2 + np.cos(lat) * self.cos_lat * np.sin((self.lon - np.radians(longitude)) / 2) ** 2
+		return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) * KM_TO_NM
+
+	def bearing_from(self, latitude: ArrayLike, longitude: ArrayLike) -> ArrayLike:
+		"""Initial bearing in degrees (0-360) from (latitude, longitude) to this point."""
+		if isinstance(latitude, (float, int)) and isinstance(longitude, (float, int)):
+			lat = math.radians(latitude)
+			dlon = self.lon - math.radians(longitude)
+			y = math.sin(dlon) * self.cos_lat
+			x = math.cos(lat) * self.sin_lat - math.sin(lat) * self.cos_lat * math.cos(dlon)
+			return (math.degrees(math.atan2(y, x)) + 360) % 360
+		lat = np.radians(latitude)
+		dlon = self.lon - np.radians(longitude)
+		y = np.sin(dlon) * self.cos_lat
+		x = np.cos(lat) * self.sin_lat - np.sin(lat) * self.cos_lat * np.cos(dlon)
+		return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+
+@functools.lru_cache(maxsize=256)
+def reference(latitude: float, longitude: float) -> ReferencePoint:
+	"""Cached ReferencePoint, so repeated calls for the same airport or runway reuse its trig terms."""
+	return ReferencePoint(latitude, longitude)
+
+
+# --- ECEF <-> LLA (WGS84) ---
+
+def ecef_to_lla(x: ArrayLike, y: ArrayLike, z: ArrayLike) -> Tuple[ArrayLike, ArrayLike, ArrayLike]:
+	"""Convert ECEF coordinates in meters to (latitude deg, longitude deg, altitude m), Bowring's method."""
+	if isinstance(x, (float, int)) and isinstance(y, (float, int)) and isinstance(z, (float, int)):
+		lon = math.atan2(y, x)
+		p = math.hypot(x, y)
+		theta = math.atan2(z * WGS84_A, p * WGS84_B)
+		lat = math.atan2(z + WGS84_EP2 * WGS84_B * math.sin(theta) ** 3, p - WGS84_E2 * WGS84_A * math.cos(theta) ** 3)
+		n = WGS84_A / math.sqrt(1 - WGS84_E2 * math.sin(lat) ** 2)
+		return math.degrees(lat), math.degrees(lon), p / math.cos(lat) - n
+	x, y, z = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(z, dtype=float)
+	lon = np.arctan2(y, x)
+	p = np.hypot(x, y)
+	theta = np.arctan2(z * WGS84_A, p * WGS84_B)
+	lat = np.arctan2(z + WGS84_EP2 * WGS84_B * np.sin(theta) ** 3, p - WGS84_E2 * WGS84_A * np.cos(theta) ** 3)
+	n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+	alt = p / np.cos(lat) - n
+	return _scalar(np.degrees(lat)), _scalar(np.degrees(lon)), _scalar(alt)
+
+
+def lla_to_ecef(latitude: ArrayLike, longitude: ArrayLike, altitude: ArrayLike = 0.0) -> Tuple[ArrayLike, ArrayLike, ArrayLike]:
+	"""Convert (latitude deg, longitude deg, altitude m) to ECEF coordinates in meters."""
+	lat, lon = np.radians(latitude), np.radians(longitude)
+	n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+	x = (n + altitude) * np.cos(lat) * np.cos(lon)
+	y = (n + altitude) * np.cos(lat) * np.sin(lon)
+	z = (n * (1 - WGS84_E2) + altitude) * np.sin(lat)
+	return _scalar(x), _scalar(y), _scalar(z)
+
+
+def offset_ecef(position, direction, distance_km: ArrayLike) -> np.ndarray:
+	"""ECEF positions distance_km against direction from position, shape (3,) or (n, 3) for an array of distances."""
+	position = np.asarray(position, dtype=float)
+	unit = np.asarray(direction, dtype=float)
+	unit = unit / np.linalg.norm(unit)
+	return position - np.multiply.outer(np.asarray(distance_km, dtype=float) * 1000.0, unit)
@@ -0,0 +1,114 @@
+import math
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple
+
+import geodesy
+
+
+METERS_PER_NM = 1852.0
+
+# Handoff fences built from the flight plan. Distances in nautical miles, heights in meters above ground.
+CENTER_HANDOFF_DISTANCE = 15.0	# leaving this circle around the origin airport
+APPROACH_HANDOFF_DISTANCE = 15.0	# entering this circle around the approach start waypoint
+TOWER_HANDOFF_DISTANCE = 8.0	# entering this circle around the destination runway...
+TOWER_HANDOFF_HEIGHT = 1000.0	# ...below this height
+
+
+class LocalProjection:
+	"""East/north tangent plane around a reference point. The trig terms are computed once, projecting a position
+	is two subtractions and two multiplications. Accurate to a fraction of a percent within a few tens of nm."""
+	__slots__ = ("latitude", "longitude", "east_scale", "north_scale")
+
+	def __init__(self, latitude: float, longitude: float):
+		self.latitude = latitude
+		self.longitude = longitude
+		self.north_scale = math.radians(1.0) * geodesy.EARTH_RADIUS_KM * 1000.0	# meters per degree of latitude
+		self.east_scale = self.north_scale * math.cos(math.radians(latitude))	# meters per degree of longitude here
+
+	def to_enu(self, latitude: float, longitude: float) -> Tuple[float, float]:
+		"""(east, north) in meters from the reference point."""
+		dlon = (longitude - self.longitude + 180.0) % 360.0 - 180.0
+		return dlon * self.east_scale, (latitude - self.latitude) * self.north_scale
+
+
+@dataclass
+class Fence:
+	"""Ring (inner to outer radius) around a point, with an optional height band. inner_radius 0 makes it a circle,
+	an infinite outer_radius makes it "further than inner_radius". Fires once when the aircraft gets inside."""
+	name: str
+	latitude: float
+	longitude: float
+	inner_radius: float = 0.0	# meters
+	outer_radius: float = math.inf	# meters
+	min_height: float = -math.inf	# meters above ground
+	max_height: float = math.inf
+	disarms: Tuple[str, ...] = ()	# fences that must not fire anymore once this one has fired
+	projection: LocalProjection = field(init=False, repr=False)
+
+	def __post_init__(self):
+		self.projection = LocalProjection(self.latitude, self.longitude)
+
+	def margin(self, latitude: float, longitude: float, height: float) -> float:
+		"""Smallest distance to a fence boundary, positive inside (meters for the radii, meters of height for the band)."""
+		east, north = self.projection.to_enu(latitude, longitude)
+		distance = math.sqrt(east * east + north * north)
+		return min(distance - self.inner_radius, self.outer_radius - distance, height - self.min_height, self.max_height - height)
+
+
+class GeofenceSet:
+	"""Fences of one flight, evaluated on every telemetry frame. Each fence fires exactly once (until reset);
+	the crossing time is interpolated between the frames before and after the crossing."""
+
+	def __init__(self, fences: Iterable[Fence] = ()):
+		self.fences: List[Fence] = list(fences)
+		self.reset()
+
+	def reset(self):
+		self.fired: Dict[str, float] = {}	# fence name -> crossing time
+		self._disarmed = set()
+		self._previous: Dict[str, Tuple[float, float]] = {}	# fence name -> (time, margin) of the last evaluated frame
+
+	def keep_fired(self, previous: "GeofenceSet"):
+		"""Keep fences that already fired in previous (same name and position) fired, after the flight plan changed in flight."""
+		old = {fence.name: fence for fence in previous.fences}
+		for fence in self.fences:
+			before = old.get(fence.name)
+			if before is not None and fence.name in previous.fired and (before.latitude, before.longitude) == (fence.latitude, fence.longitude):
+				self.fired[fence.name] = previous.fired[fence.name]
+				self._disarmed.update(fence.disarms)
+
+	def armed(self, name: str) -> bool:
+		return name not in self.fired and name not in self._disarmed
+
+	def update(self, time: float, latitude: float, longitude: float, height: float) -> List[Tuple[Fence, float]]:
+		"""Evaluate a frame, return (fence, crossing time) of fences entered since the previous frame."""
+		crossed = []
+		for fence in self.fences:
+			if not self.armed(fence.name):
+				continue
+			margin = fence.margin(latitude, longitude, height)
+			previous = self._previous.get(fence.name)
+			self._previous[fence.name] = (time, margin)
+			if margin < 0.0:
+				continue
+
+			crossingTime = time
+			if previous is not None and previous[1] < 0.0 and margin > previous[1]:
+				previousTime, previousMargin = previous
+				crossingTime = previousTime + (time - previousTime) * -previousMargin / (margin - previousMargin)
+			self.fired[fence.name] = crossingTime
+			self._disarmed.update(fence.disarms)
+			crossed.append((fence, crossingTime))
+		return crossed
+
+
+def handoff_fences(origin: Tuple[float, float], destinationRunway: Tuple[float, float], approachStart: Tuple[float, float],
+		towerHandoff: str = "tower_handoff", approachHandoff: str = "approach_handoff", centerHandoff: str = "center_handoff") -> GeofenceSet:
+	"""Frequency handoff fences from the flight plan positions, (latitude, longitude) in degrees.
+	Tower is checked before approach and approach before center, a later handoff disarms the earlier ones."""
+	return GeofenceSet([
+		Fence(towerHandoff, *destinationRunway, outer_radius=TOWER_HANDOFF_DISTANCE * METERS_PER_NM, max_height=TOWER_HANDOFF_HEIGHT,
+			disarms=(approachHandoff,)),
+		Fence(approachHandoff, *approachStart, outer_radius=APPROACH_HANDOFF_DISTANCE * METERS_PER_NM, disarms=(centerHandoff,)),
+		Fence(centerHandoff, *origin, inner_radius=CENTER_HANDOFF_DISTANCE * METERS_PER_NM),
+	])
@@ -0,0 +1,212 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, FrozenSet, Optional
+
+import mcfparser
+
+
+POLL_INTERVAL = 1.0	# seconds between stat() calls when inotify is not available (Windows, macOS)
+SETTLE_TIME = 0.5	# seconds without further writes before main.mcf is parsed, Aerofly writes it in several chunks
+
+# Sections of main.mcf compared after every change
+ROUTE = "route"	# waypoints (origin, runways, destination) and cruise altitude
+WIND = "wind"
+VISIBILITY = "visibility"
+AIRCRAFT = "aircraft"
+
+# inotify (Linux), see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")	# wd, mask, cookie, len, followed by the name
+
+
+@dataclass(frozen=True)
+class McfChange:
+	"""A new version of main.mcf and the sections that differ from the previous one."""
+	sections: FrozenSet[str]
+	old: Optional[mcfparser.MainMcf]
+	new: mcfparser.MainMcf
+
+
+def _route_key(mcf: mcfparser.MainMcf):
+	route = mcf.navigation["Route"]
+	return route["CruiseAltitude"], [(w.type, w.Identifier, w.Position, w.Direction, w.Elevation) for w in route["Ways"]]
+
+
+def diff(old: Optional[mcfparser.MainMcf], new: mcfparser.MainMcf) -> FrozenSet[str]:
+	"""Sections of main.mcf that differ between two parsed versions, all of them if there is no old version."""
+	if old is None:
+		return frozenset([ROUTE, WIND, VISIBILITY, AIRCRAFT])
+	sections = set()
+	if _route_key(old) != _route_key(new):
+		sections.add(ROUTE)
+	if old.wind != new.wind:
+		sections.add(WIND)
+	if old.visibility != new.visibility:
+		sections.add(VISIBILITY)
+	if old.aircraft != new.aircraft:
+		sections.add(AIRCRAFT)
+	return frozenset(sections)
+
+
+class _Inotify:
+	"""Close-write and rename events for one directory, through libc (no extra dependency)."""
+
+	def __init__(self, directory: str):
+		self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+		self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		# Watch the directory, not the file: editors and the sim may replace main.mcf instead of rewriting it
+		if self._libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY) < 0:
+			error = ctypes.get_errno()
+			os.close(self.fd)
+			raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+	def wait(self, name: str, timeout: float) -> bool:
+		"""True if the file called name in the directory was written within timeout seconds."""
+		readable, _, _ = select.select([self.fd], [], [], timeout)
+		if not readable:
+			return False
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return False
+		offset, changed = 0, False
+		while offset + INOTIFY_EVENT.size <= len(data):
+			_, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+			offset += INOTIFY_EVENT.size
+			if data[offset:offset + length].rstrip(b"\0") == os.fsencode(name):
+				changed = True
+			offset += length
+		return changed
+
+	def close(self):
+		os.close(self.fd)
+
+
+class McfWatcher:
+	"""Watches main.mcf and parses new versions in a background thread.
+
+	Uses inotify on Linux and polls the file's modification time and size elsewhere. After a change has settled
+	the file is parsed and compared with the previous version (diff), and on_change(McfChange) is called
+	from the watcher thread when a compared section differs."""
+
+	def __init__(self, path: str, on_change: Callable[[McfChange], None], poll_interval: float = POLL_INTERVAL):
+		self.path = path
+		self.on_change = on_change
+		self.poll_interval = poll_interval
+		self.mode = None	# "inotify" or "polling" once started
+		self._current: Optional[mcfparser.MainMcf] = None
+		self._signature = None
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+
+	def set_baseline(self, parsed: mcfparser.MainMcf):
+		"""Version the next change is compared with, after main.mcf was parsed elsewhere (session start or reset)."""
+		with self._lock:
+			self._current = parsed
+			self._signature = self._stat()
+
+	def start(self, baseline: Optional[mcfparser.MainMcf] = None):
+		if self.running:
+			return
+		if baseline is not None:
+			self.set_baseline(baseline)
+		elif self._signature is None:
+			self._signature = self._stat()
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="McfWatcher", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread:
+			self._thread.join(timeout=2)
+			self._thread = None
+
+	def _stat(self):
+		try:
+			st = os.stat(self.path)
+			return st.st_mtime_ns, st.st_size
+		except OSError:
+			return None
+
+	def _run(self):
+		inotify = None
+		if sys.platform.startswith("linux"):
+			try:
+				inotify = _Inotify(os.path.dirname(os.path.abspath(self.path)))
+			except (OSError, AttributeError) as e:
+				print(f"inotify not available ({e}), polling {self.path}")
+		self.mode = "inotify" if inotify else "polling"
+		name = os.path.basename(self.path)
+		try:
+			while not self._stop.is_set():
+				if inotify:
+					# Timeout so that stop() is noticed, the stat check below filters events that changed nothing
+					if not inotify.wait(name, self.poll_interval):
+						continue
+				elif self._stop.wait(self.poll_interval):
+					break
+				if self._stat() != self._signature:
+					self._settle(inotify, name)
+					self._reload()
+		finally:
+			if inotify:
+				inotify.close()
+
+	def _settle(self, inotify: Optional[_Inotify], name: str):
+		"""Wait until main.mcf has not been written for SETTLE_TIME."""
+		signature = self._stat()
+		while not self._stop.is_set():
+			if inotify:
+				if inotify.wait(name, SETTLE_TIME):
+					signature = self._stat()
+					continue
+			else:
+				time.sleep(SETTLE_TIME)
+			current = self._stat()
+			if current == signature:
+				return
+			signature = current
+
+	def _reload(self):
+		signature = self._stat()
+		try:
+			with open(self.path, "r", encoding="utf-8") as file:
+				parsed = mcfparser.MainMcfFactory().create(file.read())
+		except OSError as e:
+			print(f"Could not read {self.path}: {e}")
+			return
+		except Exception as e:
+			print(f"Error parsing {self.path}: {e}")
+			return
+
+		with self._lock:
+			old = self._current
+			self._current = parsed
+			self._signature = signature
+		sections = diff(old, parsed)
+		if not sections:
+			return
+		try:
+			self.on_change(McfChange(sections, old, parsed))
+		except Exception as e:
+			print(f"Error handling main.mcf change: {e}")
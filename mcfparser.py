@@ -1,8 +1,11 @@
 import re
-from typing import List, Optional, Callable, Dict, Any
+import bisect
+from collections import defaultdict
+from typing import List, Optional, Callable, Dict, Any, Tuple
 from enum import Enum
 from dataclasses import dataclass
-import math
+
+import geodesy
 
 class MissionCheckpointType(Enum):
 	ORIGIN = "origin"
@@ -105,6 +108,148 @@ class FileParser:
 		pattern = rf"(\n{re.escape(indent_string)}<\[{re.escape(group)}\]\S*)([\s\S]+?)(\n{re.escape(indent_string)}>)"
 		return re.sub(pattern, replacer, subject)
 
+# One token per line: a value '<[type][name][value]>', a group header '<[type][name][]' or a group's closing '>'
+MCF_TOKEN = re.compile(r"^[ \t]*(?:<\[([^\]]*)\]\[([^\]]*)\]\[([^\]]*)\](>?)|>)", re.M)
+
+# Start of a value or group header line: indent, type, name
+MCF_HEADER = re.compile(r"([ \t]*)<\[([^\]\n]*)\]\[([^\]\n]*)\]\[")
+
+class McfNode:
+	__slots__ = ("type", "name", "value", "depth", "start", "end", "children")
+
+	def __init__(self, type: str, name: str, value: str, depth: int, start: int, group: bool = True):
+		self.type = type
+		self.name = name
+		self.value = value
+		self.depth = depth	# nesting level, 0 for the top-level <[file]...> group (for sections: the header's indent level)
+		self.start = start	# ordinal of this node in the file
+		self.end = start	# ordinal of its last descendant
+		self.children: List["McfNode"] = [] if group else ()	# values share an empty tuple
+
+class McfTree:
+	"""main.mcf tokenized in a single pass into a tree of <[type][name][value] ...> nodes, nested by brackets.
+	Groups are indexed by type and all nodes by name in file order, so lookups do not scan the file again:
+	a node inside a group is found by bisecting the index with the group's ordinal range.
+
+	With `sections`, only the first group or value whose type or name is each listed section is tokenized,
+	with everything inside it, wherever it is in the file. Most of main.mcf is controls and graphics settings that are
+	never read, they are skipped by the regex engine instead of being turned into nodes."""
+
+	def __init__(self, content: str, sections: Optional[List[str]] = None):
+		self.root = McfNode("", "", "", -1, 0)
+		self._by_type: Dict[str, List[McfNode]] = defaultdict(list)
+		self._type_starts: Dict[str, List[int]] = defaultdict(list)
+		self._by_name: Dict[str, List[McfNode]] = defaultdict(list)
+		self._name_starts: Dict[str, List[int]] = defaultdict(list)
+		self._ordinal = 0
+
+		if sections is None:
+			self._tokenize(content, 0, 0)
+		else:
+			position = 0
+			for start, depth in sorted(self._find_sections(content, sections)):
+				if start < position:
+					continue	# inside a section tokenized already
+				position = self._tokenize(content, start, depth, single=True)
+		self.root.end = self._ordinal
+
+	@staticmethod
+	def _find_sections(content: str, sections: List[str]) -> List[Tuple[int, int]]:
+		"""Line start and indent level of the first header whose type or name is each listed section.
+		Found by substring search (memchr speed) and checked against the line, at any indent: nesting is taken
+		from the brackets, files edited by hand or by tools are not always indented consistently."""
+		found = []
+		for section in sections:
+			needle = "[" + section + "]["
+			i = content.find(needle)
+			while i != -1:
+				line_start = content.rfind("\n", 0, i) + 1
+				match = MCF_HEADER.match(content, line_start)
+				if match and section in (match.group(2), match.group(3)):
+					found.append((line_start, len(match.group(1).expandtabs(4)) // 4))
+					break
+				i = content.find(needle, i + 1)
+		return found
+
+	def _tokenize(self, content: str, start: int, depth: int, single: bool = False) -> int:
+		"""Tokenize from start, the whole rest of the file or (single) only the value or group starting there.
+		Returns the position after the last token."""
+		stack = [self.root]
+		ordinal = self._ordinal
+		position = start
+		by_type, type_starts, by_name, name_starts = self._by_type, self._type_starts, self._by_name, self._name_starts
+		for match in MCF_TOKEN.finditer(content, start):
+			type, name, value, closed = match.groups()
+			if type is None:
+				if len(stack) > 1:
+					stack.pop().end = ordinal
+			else:
+				ordinal += 1
+				node = McfNode(type, name, value.strip(), depth + len(stack) - 1, ordinal, not closed)
+				stack[-1].children.append(node)
+				by_name[name].append(node)
+				name_starts[name].append(ordinal)
+				if not closed:
+					by_type[type].append(node)
+					type_starts[type].append(ordinal)
+					stack.append(node)
+			if single and len(stack) == 1:
+				position = match.end()
+				break
+		else:
+			position = len(content)
+		for node in stack[1:]:	# unclosed groups of a truncated file
+			node.end = ordinal
+		self._ordinal = ordinal
+		return position
+
+	@staticmethod
+	def _first_within(nodes: List[McfNode], starts: List[int], within: McfNode) -> Optional[McfNode]:
+		i = bisect.bisect_right(starts, within.start)
+		if i < len(starts) and starts[i] <= within.end:
+			return nodes[i]
+		return None
+
+	def group(self, type: str, within: Optional[McfNode] = None) -> Optional[McfNode]:
+		"""First group of the given type, inside `within` if given (at any depth)."""
+		nodes = self._by_type.get(type)
+		if not nodes:
+			return None
+		if within is None:
+			return nodes[0]
+		return self._first_within(nodes, self._type_starts[type], within)
+
+	def find(self, within: Optional[McfNode], key: str) -> Optional[McfNode]:
+		"""First node named key inside `within` (the whole file if within is the root)."""
+		if within is None:
+			return None
+		starts = self._name_starts.get(key)
+		if not starts:
+			return None
+		return self._first_within(self._by_name[key], starts, within)
+
+	def get_value(self, within: Optional[McfNode], key: str, default_value: str = "") -> str:
+		node = self.find(within, key)
+		return node.value if node is not None else default_value
+
+	def get_number(self, within: Optional[McfNode], key: str, default_value: float = 0) -> float:
+		try:
+			return float(self.get_value(within, key, str(default_value)))
+		except (ValueError, TypeError):
+			return default_value
+
+	def get_number_array(self, within: Optional[McfNode], key: str) -> List[float]:
+		value = self.get_value(within, key)
+		if not value:
+			return []
+		try:
+			return [float(i) for i in value.split()]
+		except (ValueError, TypeError):
+			return []
+
+# Sections of main.mcf read by MainMcfFactory (inside tmsimulator_settings)
+MAIN_MCF_SECTIONS = ["tmsettings_aircraft", "tmsettings_flight", "tm_time_utc", "visibility", "tmsettings_wind", "tmsettings_clouds", "navigation"]
+
 class MainMcfFactory(FileParser):
 	def create(self, config_file_content: str) -> MainMcf:
 		m = MainMcf(
@@ -144,112 +289,74 @@ class MainMcfFactory(FileParser):
 			}
 		)
 		
-		tmsettings_aircraft = self.get_group(config_file_content, "tmsettings_aircraft")
-		tmsettings_flight = self.get_group(config_file_content, "tmsettings_flight")
-		tm_time_utc = self.get_group(config_file_content, "tm_time_utc")
-		tmsettings_wind = self.get_group(config_file_content, "tmsettings_wind")
-		tmsettings_clouds = self.get_group(config_file_content, "tmsettings_clouds")
-		tmnav_route = self.get_group(config_file_content, "tmnav_route", 3)
-		list_tmmission_checkpoint = self.get_group(config_file_content, "pointer_list_tmnav_route_way", 4)
+		tree = McfTree(config_file_content, MAIN_MCF_SECTIONS)
+		tmsettings_aircraft = tree.group("tmsettings_aircraft")
+		tmsettings_flight = tree.group("tmsettings_flight")
+		tm_time_utc = tree.group("tm_time_utc")
+		tmsettings_wind = tree.group("tmsettings_wind")
+		tmsettings_clouds = tree.group("tmsettings_clouds")
+		tmnav_route = tree.group("tmnav_route")
+		list_tmmission_checkpoint = tree.group("pointer_list_tmnav_route_way", tmnav_route) if tmnav_route else None
 		
 		waypoints = []
 		if list_tmmission_checkpoint:
-			waypoint_sections = list_tmmission_checkpoint.split("<[tmnav_route_")[1:]
-			
-			for wp in waypoint_sections:
-				type_match = None
-				if wp:
-					bracket_pos = wp.find(']')
-					if bracket_pos != -1:
-						type_match = wp[:bracket_pos]
-				
+			for wp in list_tmmission_checkpoint.children:
+				if not wp.type.startswith("tmnav_route_"):
+					continue
 				try:
-					checkpoint_type = MissionCheckpointType(type_match) if type_match else MissionCheckpointType.WAYPOINT
+					checkpoint_type = MissionCheckpointType(wp.type[len("tmnav_route_"):])
 				except ValueError:
 					checkpoint_type = MissionCheckpointType.WAYPOINT
 				
 				waypoint = MainMcfWaypoint(
 					type=checkpoint_type,
-					Identifier=self.get_value(wp, "Identifier", ""),
-					Position=self.get_number_array(wp, "Position"),
-					Direction=self.get_number_array(wp, "Direction"),
-					NavaidFrequency=self.get_number(wp, "NavaidFrequency", 0),
-					Elevation=self.get_number(wp, "Elevation", 0),
-					Altitude=self.get_number_array(wp, "Altitude"),
-					Length=self.get_number(wp, "RunwayLength", 0),
-					FlyOver=self.get_value(wp, "FlyOver", "false").lower() != "false"
+					Identifier=tree.get_value(wp, "Identifier", ""),
+					Position=tree.get_number_array(wp, "Position"),
+					Direction=tree.get_number_array(wp, "Direction"),
+					NavaidFrequency=tree.get_number(wp, "NavaidFrequency", 0),
+					Elevation=tree.get_number(wp, "Elevation", 0),
+					Altitude=tree.get_number_array(wp, "Altitude"),
+					Length=tree.get_number(wp, "RunwayLength", 0),
+					FlyOver=tree.get_value(wp, "FlyOver", "false").lower() != "false"
 				)
 				waypoints.append(waypoint)
 		
 		# Set all the parsed values
-		m.aircraft["name"] = self.get_value(tmsettings_aircraft, "name", "c172")
+		m.aircraft["name"] = tree.get_value(tmsettings_aircraft, "name", "c172")
 		
-		m.flight_setting["position"] = self.get_number_array(tmsettings_flight, "position") or [0, 0, 0]
-		m.flight_setting["orientation"] = self.get_number_array(tmsettings_flight, "orientation") or [0, 0, 0]
-		m.flight_setting["configuration"] = self.get_value(tmsettings_flight, "configuration", "")
-		m.flight_setting["on_ground"] = self.get_value(tmsettings_flight, "on_ground", "true").lower() == "true"
+		m.flight_setting["position"] = tree.get_number_array(tmsettings_flight, "position") or [0, 0, 0]
+		m.flight_setting["orientation"] = tree.get_number_array(tmsettings_flight, "orientation") or [0, 0, 0]
+		m.flight_setting["configuration"] = tree.get_value(tmsettings_flight, "configuration", "")
+		m.flight_setting["on_ground"] = tree.get_value(tmsettings_flight, "on_ground", "true").lower() == "true"
 		
-		m.time_utc["time_year"] = self.get_number(tm_time_utc, "time_year", 0)
-		m.time_utc["time_month"] = self.get_number(tm_time_utc, "time_month", 0)
-		m.time_utc["time_day"] = self.get_number(tm_time_utc, "time_day", 0)
-		m.time_utc["time_hours"] = self.get_number(tm_time_utc, "time_hours", 0)
+		m.time_utc["time_year"] = tree.get_number(tm_time_utc, "time_year", 0)
+		m.time_utc["time_month"] = tree.get_number(tm_time_utc, "time_month", 0)
+		m.time_utc["time_day"] = tree.get_number(tm_time_utc, "time_day", 0)
+		m.time_utc["time_hours"] = tree.get_number(tm_time_utc, "time_hours", 0)
 		
-		m.visibility = self.get_number(config_file_content, "visibility", 0)
+		m.visibility = tree.get_number(tree.root, "visibility", 0)
 		
-		m.wind["strength"] = self.get_number(tmsettings_wind, "strength", 0)
-		m.wind["direction_in_degree"] = self.get_number(tmsettings_wind, "direction_in_degree", 0)
-		m.wind["turbulence"] = self.get_number(tmsettings_wind, "turbulence", 0)
-		m.wind["thermal_activity"] = self.get_number(tmsettings_wind, "thermal_activity", 0)
+		m.wind["strength"] = tree.get_number(tmsettings_wind, "strength", 0)
+		m.wind["direction_in_degree"] = tree.get_number(tmsettings_wind, "direction_in_degree", 0)
+		m.wind["turbulence"] = tree.get_number(tmsettings_wind, "turbulence", 0)
+		m.wind["thermal_activity"] = tree.get_number(tmsettings_wind, "thermal_activity", 0)
 		
-		m.clouds["cumulus_density"] = self.get_number(tmsettings_clouds, "cumulus_density", 0)
-		m.clouds["cumulus_height"] = self.get_number(tmsettings_clouds, "cumulus_height", 0)
-		m.clouds["cumulus_mediocris_density"] = self.get_number(tmsettings_clouds, "cumulus_mediocris_density", 0)
-		m.clouds["cumulus_mediocris_height"] = self.get_number(tmsettings_clouds, "cumulus_mediocris_height", 0)
-		m.clouds["cirrus_height"] = self.get_number(tmsettings_clouds, "cirrus_height", 0)
-		m.clouds["cirrus_density"] = self.get_number(tmsettings_clouds, "cirrus_density", 0)
+		m.clouds["cumulus_density"] = tree.get_number(tmsettings_clouds, "cumulus_density", 0)
+		m.clouds["cumulus_height"] = tree.get_number(tmsettings_clouds, "cumulus_height", 0)
+		m.clouds["cumulus_mediocris_density"] = tree.get_number(tmsettings_clouds, "cumulus_mediocris_density", 0)
+		m.clouds["cumulus_mediocris_height"] = tree.get_number(tmsettings_clouds, "cumulus_mediocris_height", 0)
+		m.clouds["cirrus_height"] = tree.get_number(tmsettings_clouds, "cirrus_height", 0)
+		m.clouds["cirrus_density"] = tree.get_number(tmsettings_clouds, "cirrus_density", 0)
 		
-		m.navigation["Route"]["CruiseAltitude"] = self.get_number(tmnav_route, "CruiseAltitude", -1)
+		m.navigation["Route"]["CruiseAltitude"] = tree.get_number(tmnav_route, "CruiseAltitude", -1)
 		m.navigation["Route"]["Ways"] = waypoints
 		
 		return m
 
 # Convert cartasian coordinates to lat and long
 def ecef_to_lla(x, y, z):
-	# WGS84 constants
-	a = 6378137.0             # semi-major axis (m)
-	f = 1 / 298.257223563     # flattening
-	e2 = f * (2 - f)          # eccentricity squared
-	b = a * (1 - f)           # semi-minor axis
-	ep2 = (a**2 - b**2) / b**2  # second eccentricity squared
-
-	# Longitude
-	lon = math.atan2(y, x)
-
-	# Distance from Z axis
-	p = math.sqrt(x**2 + y**2)
-
-	# Initial parametric latitude
-	theta = math.atan2(z * a, p * b)
-
-	# Latitude
-	sin_theta = math.sin(theta)
-	cos_theta = math.cos(theta)
-	lat = math.atan2(
-		z + ep2 * b * sin_theta**3,
-		p - e2 * a * cos_theta**3
-	)
-
-	# Radius of curvature in the prime vertical
-	N = a / math.sqrt(1 - e2 * math.sin(lat)**2)
-
-	# Altitude
-	alt = p / math.cos(lat) - N
-
-	# Convert to degrees
-	lat_deg = math.degrees(lat)
-	lon_deg = math.degrees(lon)
-
-	return lat_deg, lon_deg, alt
+	# WGS84, Bowring's method. Also works on arrays of coordinates.
+	return geodesy.ecef_to_lla(x, y, z)
 	
 
 
@@ -269,25 +376,7 @@ def offset_position(dest, vec, dist_km):
 		  - 'ecef': (x_new, y_new, z_new)
 		  - 'lla': (lat_deg, lon_deg, alt_m)
 	"""
-	x, y, z = dest
-	dx, dy, dz = vec
-
-	# Normalize vector
-	norm = math.sqrt(dx*dx + dy*dy + dz*dz)
-	dx /= norm
-	dy /= norm
-	dz /= norm
-
-	# Opposite direction
-	dx, dy, dz = -dx, -dy, -dz
-
-	# Distance in meters
-	d = dist_km * 1000.0
-
-	# New ECEF position
-	x_new = x + dx * d
-	y_new = y + dy * d
-	z_new = z + dz * d
+	x_new, y_new, z_new = (float(v) for v in geodesy.offset_ecef(dest, vec, dist_km))
 
 	# Convert to LLA
 	lat_deg, lon_deg, alt_m = ecef_to_lla(x_new, y_new, z_new)
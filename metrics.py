@@ -0,0 +1,230 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+	if not labels:
+		return ""
+	return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+	if value == float("inf"):
+		return "+Inf"
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+	kind = ""
+
+	def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+		self._lock = threading.Lock()
+		self._children: Dict[Tuple[Tuple[str, str], ...], object] = {}
+
+	def _key(self, labels: dict) -> Tuple[Tuple[str, str], ...]:
+		return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+	def render(self) -> List[str]:
+		return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+	"""Monotonically increasing value, optionally per label set."""
+	kind = "counter"
+
+	def inc(self, amount: float = 1.0, **labels):
+		key = self._key(labels)
+		with self._lock:
+			self._children[key] = self._children.get(key, 0) + amount
+
+	def value(self, **labels) -> float:
+		return self._children.get(self._key(labels), 0)
+
+	def render(self) -> List[str]:
+		lines = super().render()
+		with self._lock:
+			items = list(self._children.items())
+		lines += [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+		return lines
+
+
+class Gauge(_Metric):
+	"""Value that goes up and down. With `function` it is read at scrape time (queue depth, thread count...)."""
+	kind = "gauge"
+
+	def __init__(self, name: str, help: str, function: Optional[Callable[[], float]] = None):
+		super().__init__(name, help)
+		self.function = function
+		self._value = 0.0
+
+	def set(self, value: float):
+		self._value = value
+
+	def value(self) -> float:
+		if self.function:
+			try:
+				return self.function()
+			except Exception:
+				return float("nan")
+		return self._value
+
+	def render(self) -> List[str]:
+		return super().render() + [f"{self.name} {_format_value(self.value())}"]
+
+
+class _HistogramValues:
+	__slots__ = ("counts", "sum", "count")
+
+	def __init__(self, buckets: int):
+		self.counts = [0] * buckets
+		self.sum = 0.0
+		self.count = 0
+
+
+class Histogram(_Metric):
+	"""Distribution of observed values (durations in seconds) in fixed buckets."""
+	kind = "histogram"
+
+	def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()):
+		super().__init__(name, help, labelnames)
+		self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+	def observe(self, value: float, **labels):
+		key = self._key(labels)
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			values = self._children.get(key)
+			if values is None:
+				values = self._children[key] = _HistogramValues(len(self.buckets))
+			values.counts[index] += 1
+			values.sum += value
+			values.count += 1
+
+	def quantile(self, q: float, **labels) -> Optional[float]:
+		"""Approximate quantile (upper bound of the bucket containing it)."""
+		values = self._children.get(self._key(labels))
+		if not values or not values.count:
+			return None
+		target = q * values.count
+		cumulative = 0
+		for bound, count in zip(self.buckets, values.counts):
+			cumulative += count
+			if cumulative >= target:
+				return bound
+		return self.buckets[-1]
+
+	def render(self) -> List[str]:
+		lines = super().render()
+		with self._lock:
+			items = [(key, list(v.counts), v.sum, v.count) for key, v in self._children.items()]
+		for key, counts, total, count in items:
+			cumulative = 0
+			for bound, bucketCount in zip(self.buckets, counts):
+				cumulative += bucketCount
+				lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+			lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+			lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+		return lines
+
+
+class Registry:
+	def __init__(self):
+		self.metrics: Dict[str, _Metric] = {}
+
+	def register(self, metric):
+		self.metrics[metric.name] = metric
+		return metric
+
+	def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+		return self.metrics.get(name) or self.register(Counter(name, help, labelnames))
+
+	def gauge(self, name: str, help: str, function: Optional[Callable[[], float]] = None) -> Gauge:
+		gauge = self.metrics.get(name) or self.register(Gauge(name, help))
+		if function:
+			gauge.function = function
+		return gauge
+
+	def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()) -> Histogram:
+		return self.metrics.get(name) or self.register(Histogram(name, help, buckets, labelnames))
+
+	def render_summary(self) -> str:
+		"""Short human-readable overview, for the app's metrics window."""
+		lines = []
+		for metric in list(self.metrics.values()):
+			if isinstance(metric, Histogram):
+				for key, values in list(metric._children.items()):
+					labels = dict(key)
+					if values.count:
+						p50 = metric.quantile(0.5, **labels)
+						p95 = metric.quantile(0.95, **labels)
+						lines.append(f"{metric.name}{_format_labels(key)}: n={values.count} avg={values.sum / values.count * 1000:.1f} ms p50<={p50 * 1000:g} ms p95<={p95 * 1000:g} ms")
+			elif isinstance(metric, Counter):
+				for key, value in list(metric._children.items()):
+					lines.append(f"{metric.name}{_format_labels(key)}: {value:g}")
+			else:
+				value = metric.value()
+				lines.append(f"{metric.name}: {value:,.0f}" if float(value).is_integer() else f"{metric.name}: {value:.4f}")
+		return "\n".join(lines)
+
+	def render_prometheus(self) -> str:
+		"""All metrics in Prometheus text exposition format (version 0.0.4)."""
+		lines = []
+		for metric in list(self.metrics.values()):
+			lines += metric.render()
+		return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Metrics recorded across modules
+RADIO_QUEUE_WAIT = REGISTRY.histogram("atc_radio_queue_wait_seconds", "Time radio messages wait in radioPlaybackQueue before playback", labelnames=("prefix",))
+LLM_LATENCY = REGISTRY.histogram("atc_llm_request_seconds", "AI chat completion latency", labelnames=("call",))
+LLM_PROMPT_TOKENS = REGISTRY.counter("atc_llm_prompt_tokens_total", "Prompt tokens sent to AI", ("call",))
+LLM_COMPLETION_TOKENS = REGISTRY.counter("atc_llm_completion_tokens_total", "Completion tokens received from AI", ("call",))
+TTS_LATENCY = REGISTRY.histogram("atc_tts_seconds", "Speech synthesis time")
+DSP_TIME = REGISTRY.histogram("atc_radio_effect_seconds", "Radio effect processing time")
+FRAME_DECODE = REGISTRY.histogram("atc_radiopanel_frame_decode_seconds", "RadioPanel frame decoding time", FAST_BUCKETS)
+TASK_TIME = REGISTRY.histogram("atc_task_seconds", "Run time of background tasks (session start pipeline)", labelnames=("task",))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path.split("?")[0] not in ("/", "/metrics"):
+			self.send_error(404)
+			return
+		body = REGISTRY.render_prometheus().encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+	"""Serve the registry at http://host:port/metrics from a daemon thread."""
+	try:
+		server = ThreadingHTTPServer((host, port), _MetricsHandler)
+	except OSError as e:
+		print(f"Metrics endpoint could not be started on port {port}: {e}")
+		return None
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+	print(f"Metrics available at http://{host}:{port}/metrics")
+	return server
@@ -0,0 +1,186 @@
+import bz2
+import gzip
+import hashlib
+import json
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Set to 1 to build airport diagrams only from cached or imported OSM data (same as AIRPORT_DIAGRAMS_OFFLINE = True in ai_atc.py)
+OFFLINE_ENV = "FINALCALLATC_OSM_OFFLINE"
+CACHE_FOLDER = os.path.join("AirportDiagrams", "OSMCache")
+CACHE_TTL = 30 * 24 * 3600.0	# seconds, older Overpass results are fetched again when online
+AIRPORT_BUFFER_M = 200	# features this close to the aerodrome outline belong to the airport
+AIRPORT_BUFFER_DEG = 0.002	# the same buffer around the aerodrome bounds, for extract import
+DIAGRAM_FEATURES = ["aeroway"]	# OSM keys drawn on airport diagrams
+
+offline = os.environ.get(OFFLINE_ENV, "") not in ("", "0")
+
+
+def airport_query(icao_code: str, feature_types: Optional[List[str]] = None) -> str:
+	"""One Overpass request for an airport: finds the aerodrome by ICAO code, then the features inside it
+	and near its outline. feature_types limits the result to ways and relations with these keys,
+	None fetches all nodes, ways and relations."""
+	icao = icao_code.upper()
+	if feature_types is None:
+		selectors = ["nwr(area.inside);", f"nwr(around.airport:{AIRPORT_BUFFER_M});"]
+	else:
+		selectors = [f'{kind}["{feature}"]({area});' for feature in feature_types for kind in ("way", "relation")
+			for area in ("area.inside", f"around.airport:{AIRPORT_BUFFER_M}")]
+	return (f'[out:json][timeout:60];\n'
+		f'(way["aeroway"="aerodrome"]["icao"="{icao}"];relation["aeroway"="aerodrome"]["icao"="{icao}"];)->.airport;\n'
+		f'.airport map_to_area->.inside;\n'
+		f'(.airport;{"".join(selectors)});\n'
+		f'out geom meta;')
+
+
+def has_aerodrome(osm_data: Dict[str, Any], icao_code: str) -> bool:
+	icao = icao_code.upper()
+	return any(e.get("tags", {}).get("aeroway") == "aerodrome" and e.get("tags", {}).get("icao", "").upper() == icao
+		for e in osm_data.get("elements", []))
+
+
+class OSMCache:
+	"""Overpass results on disk, gzipped JSON keyed by ICAO code and query.
+
+	Entries older than ttl are stale: get() returns them only with allow_stale (offline mode, or when the
+	Overpass request failed). Imported extracts (import_extract) are stored the same way."""
+
+	def __init__(self, folder: str = CACHE_FOLDER, ttl: float = CACHE_TTL):
+		self.folder = folder
+		self.ttl = ttl
+
+	def path(self, icao_code: str, query: str) -> str:
+		digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+		return os.path.join(self.folder, f"{icao_code.lower()}_{digest}.json.gz")
+
+	def age(self, icao_code: str, query: str) -> Optional[float]:
+		"""Seconds since the entry was stored, None if there is none."""
+		try:
+			return time.time() - os.path.getmtime(self.path(icao_code, query))
+		except OSError:
+			return None
+
+	def get(self, icao_code: str, query: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+		age = self.age(icao_code, query)
+		if age is None or (age > self.ttl and not allow_stale):
+			return None
+		try:
+			with gzip.open(self.path(icao_code, query), "rt", encoding="utf-8") as file:
+				return json.load(file)
+		except (OSError, EOFError, ValueError) as e:
+			print(f"Ignoring damaged OSM cache entry for {icao_code}: {e}")
+			return None
+
+	def put(self, icao_code: str, query: str, osm_data: Dict[str, Any]) -> str:
+		path = self.path(icao_code, query)
+		os.makedirs(self.folder, exist_ok=True)
+		with gzip.open(path + ".part", "wt", encoding="utf-8", compresslevel=6) as file:
+			json.dump(osm_data, file, separators=(",", ":"), ensure_ascii=False)
+		os.replace(path + ".part", path)	# a concurrent reader never sees a half-written entry
+		return path
+
+
+# --- Import from a local OSM extract ---
+
+def _open_extract(path: str):
+	if path.endswith(".gz"):
+		return gzip.open(path, "rb")
+	if path.endswith(".bz2"):
+		return bz2.open(path, "rb")
+	return open(path, "rb")
+
+
+def _iter_elements(path: str, tags: Iterable[str]) -> Iterator[ElementTree.Element]:
+	"""Elements of an OSM XML file with one of the tag names, cleared after use so memory stays flat."""
+	tags = set(tags)
+	with _open_extract(path) as file:
+		context = ElementTree.iterparse(file, events=("start", "end"))
+		_, root = next(context)
+		for event, element in context:
+			if event != "end" or element.tag not in ("node", "way", "relation"):
+				continue
+			if element.tag in tags:
+				yield element
+			root.clear()
+
+
+def _tags(element: ElementTree.Element) -> Dict[str, str]:
+	return {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+
+
+def _bounds(geometry: List[Dict[str, float]]) -> Tuple[float, float, float, float]:
+	lats = [point["lat"] for point in geometry]
+	lons = [point["lon"] for point in geometry]
+	return min(lats), min(lons), max(lats), max(lons)
+
+
+def _overlaps(a: Tuple[float, float, float, float], b: Tuple[float, float, float, float]) -> bool:
+	return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def import_extract(path: str, cache: Optional[OSMCache] = None, feature_types: Optional[List[str]] = None) -> List[str]:
+	"""Fill the cache from a local OSM XML extract (.osm, .osm.gz or .osm.bz2) for every aerodrome with an ICAO code in it,
+	so diagrams can be built offline. Convert .pbf files first, e.g. osmium tags-filter extract.osm.pbf aeroway -o airports.osm
+
+	Stored under the same key as the Overpass request for these features (airport_query), in the same format.
+	The extract is read three times (relations, ways, nodes) to keep only aeroway data in memory."""
+	cache = cache or OSMCache()
+	feature_types = feature_types or DIAGRAM_FEATURES
+	started = time.perf_counter()
+
+	# Relations with the features, and the ways they are made of
+	relations: Dict[int, Dict[str, Any]] = {}
+	memberWays = set()
+	for element in _iter_elements(path, ["relation"]):
+		tags = _tags(element)
+		if any(feature in tags for feature in feature_types):
+			members = [{"type": m.get("type"), "ref": int(m.get("ref")), "role": m.get("role", "")} for m in element.iter("member")]
+			relations[int(element.get("id"))] = {"type": "relation", "id": int(element.get("id")), "tags": tags, "members": members}
+			memberWays.update(m["ref"] for m in members if m["type"] == "way")
+
+	# Ways with the features or in those relations, and the nodes they need
+	ways: Dict[int, Dict[str, Any]] = {}
+	for element in _iter_elements(path, ["way"]):
+		wayId = int(element.get("id"))
+		tags = _tags(element)
+		if wayId in memberWays or any(feature in tags for feature in feature_types):
+			ways[wayId] = {"type": "way", "id": wayId, "tags": tags, "nodes": [int(nd.get("ref")) for nd in element.iter("nd")]}
+	needed = {ref for way in ways.values() for ref in way["nodes"]}
+
+	nodes: Dict[int, Dict[str, float]] = {}
+	for element in _iter_elements(path, ["node"]):
+		nodeId = int(element.get("id"))
+		if nodeId in needed:
+			nodes[nodeId] = {"lat": float(element.get("lat")), "lon": float(element.get("lon"))}
+
+	for way in ways.values():
+		way["geometry"] = [nodes[ref] for ref in way.pop("nodes") if ref in nodes]
+	for relation in relations.values():
+		for member in relation["members"]:
+			if member["type"] == "way" and member["ref"] in ways:
+				member["geometry"] = ways[member["ref"]]["geometry"]
+
+	# Output elements in Overpass "out geom" form, with their bounds
+	elements = []
+	for element in [w for w in ways.values() if any(f in w["tags"] for f in feature_types)] + list(relations.values()):
+		geometry = element.get("geometry") or [p for m in element.get("members", []) for p in m.get("geometry", [])]
+		if geometry:
+			elements.append((element, _bounds(geometry)))
+
+	imported = []
+	for aerodrome, bounds in elements:
+		tags = aerodrome["tags"]
+		if tags.get("aeroway") != "aerodrome" or not tags.get("icao"):
+			continue
+		icao = tags["icao"].upper()
+		area = (bounds[0] - AIRPORT_BUFFER_DEG, bounds[1] - AIRPORT_BUFFER_DEG, bounds[2] + AIRPORT_BUFFER_DEG, bounds[3] + AIRPORT_BUFFER_DEG)
+		osm_data = {"version": 0.6, "generator": f"FinalCallATC import of {os.path.basename(path)}",
+			"elements": [element for element, elementBounds in elements if _overlaps(area, elementBounds)]}
+		cache.put(icao, airport_query(icao, feature_types), osm_data)
+		imported.append(icao)
+
+	print(f"Imported {len(imported)} airports from {path} in {time.perf_counter() - started:.1f} s")
+	return imported
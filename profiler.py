@@ -0,0 +1,159 @@
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+import psutil
+
+
+# Set to 1 to sample all threads from the start (same as PROFILE_THREADS = True in ai_atc.py)
+PROFILE_ENV = "FINALCALLATC_PROFILE"
+PROFILES_FOLDER = "Profiles"
+SAMPLING_INTERVAL = 0.02	# seconds between samples (50 Hz)
+MAX_STACK_DEPTH = 64
+
+
+def _frame_name(frame) -> str:
+	code = frame.f_code
+	# Collapsed stack format: ';' separates frames, the last space separates the count
+	return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class ThreadSampler:
+	"""Samples the Python stacks of every thread (sys._current_frames) from a background thread.
+
+	Two profiles are collected, both in collapsed-stack format (flamegraph.pl, speedscope, inferno):
+	- cpu: each sample weighted by the thread's CPU time since the previous sample (microseconds), idle threads drop out,
+	- wall: one count per sample, including threads waiting in sleep, locks or I/O."""
+
+	def __init__(self, interval: float = SAMPLING_INTERVAL):
+		self.interval = interval
+		self.samples = 0
+		self._cpu = Counter()
+		self._wall = Counter()
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._process = psutil.Process()
+		self._last_cpu: Dict[int, float] = {}	# native thread id -> user + system time
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self):
+		if self.running:
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="ProfilerSampler", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread:
+			self._thread.join(timeout=1)
+			self._thread = None
+
+	def _thread_cpu_times(self) -> Dict[int, float]:
+		try:
+			return {t.id: t.user_time + t.system_time for t in self._process.threads()}
+		except psutil.Error:
+			return {}
+
+	def _run(self):
+		own = threading.get_ident()
+		while not self._stop.wait(self.interval):
+			threads = {t.ident: t for t in threading.enumerate()}
+			cpu = self._thread_cpu_times()
+			frames = sys._current_frames()
+			with self._lock:
+				self.samples += 1
+				for ident, frame in frames.items():
+					if ident == own:
+						continue
+					thread = threads.get(ident)
+					name = thread.name if thread else f"thread-{ident}"
+					stack = []
+					while frame is not None and len(stack) < MAX_STACK_DEPTH:
+						stack.append(_frame_name(frame))
+						frame = frame.f_back
+					stack.append(name.replace(";", ":"))
+					key = ";".join(reversed(stack))
+					self._wall[key] += 1
+
+					native_id = getattr(thread, "native_id", None)
+					if native_id in cpu:
+						used = cpu[native_id] - self._last_cpu.get(native_id, cpu[native_id])
+						if used > 0:
+							self._cpu[key] += int(used * 1e6)
+			self._last_cpu = cpu
+
+	def clear(self):
+		with self._lock:
+			self._cpu.clear()
+			self._wall.clear()
+			self.samples = 0
+
+	def dump(self, prefix: Optional[str] = None, clear: bool = False) -> Optional[str]:
+		"""Write <prefix>.cpu.collapsed and <prefix>.wall.collapsed, return the prefix."""
+		with self._lock:
+			cpu = dict(self._cpu)
+			wall = dict(self._wall)
+			samples = self.samples
+		if not wall:
+			return None
+		if prefix is None:
+			os.makedirs(PROFILES_FOLDER, exist_ok=True)
+			prefix = os.path.join(PROFILES_FOLDER, time.strftime("profile_%Y%m%d_%H%M%S"))
+
+		for suffix, counts in (("cpu", cpu), ("wall", wall)):
+			with open(f"{prefix}.{suffix}.collapsed", "w", encoding="utf-8") as f:
+				for stack, count in sorted(counts.items()):
+					if count > 0:
+						f.write(f"{stack} {count}\n")
+		if clear:
+			self.clear()
+		print(f"Thread profile ({samples} samples) saved to {prefix}.cpu.collapsed and {prefix}.wall.collapsed")
+		return prefix
+
+
+_sampler: Optional[ThreadSampler] = None
+
+
+def start(interval: float = SAMPLING_INTERVAL) -> ThreadSampler:
+	"""Start sampling all threads. Profiles are dumped at exit, on dump() and on SIGUSR1 (Ctrl+Break on Windows)."""
+	global _sampler
+	if _sampler is None:
+		_sampler = ThreadSampler(interval)
+		atexit.register(dump)
+		_install_dump_signal()
+	_sampler.start()
+	return _sampler
+
+
+def dump(clear: bool = False) -> Optional[str]:
+	if _sampler is None:
+		return None
+	return _sampler.dump(clear=clear)
+
+
+def stop():
+	if _sampler is not None:
+		_sampler.stop()
+
+
+def enabled_by_environment() -> bool:
+	return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def _install_dump_signal():
+	# Signal handlers can only be installed from the main thread
+	if threading.current_thread() is not threading.main_thread():
+		return
+	signum = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+	if signum is not None:
+		signal.signal(signum, lambda *args: dump())
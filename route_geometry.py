@@ -0,0 +1,116 @@
+import math
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+import geodesy
+
+
+@dataclass(frozen=True, slots=True)
+class RoutePosition:
+	"""Current position relative to the route, from RouteGeometry.project."""
+	leg: int	# index of the leg flown, from waypoint leg to leg + 1
+	cross_track_nm: float	# distance from the leg's great circle, positive right of course
+	along_track_nm: float	# distance flown along the route from the first waypoint
+	distance_to_go_nm: float	# along the route to the last waypoint
+	next_waypoint: str
+	distance_to_next_nm: float	# direct distance to the next waypoint
+	bearing_to_next: float	# degrees
+	leg_course: float	# initial course of the leg, degrees
+
+	def describe(self) -> str:
+		side = "right" if self.cross_track_nm >= 0 else "left"
+		return (f"Next waypoint {self.next_waypoint}: {self.distance_to_next_nm:.1f} nm, bearing {int(self.bearing_to_next):03d}. "
+			f"{abs(self.cross_track_nm):.1f} nm {side} of course {int(self.leg_course):03d}, {self.distance_to_go_nm:.0f} nm to go along the route.")
+
+
+class RouteGeometry:
+	"""All waypoints of the navigation plan with their legs, built once per flight plan.
+
+	Waypoints are converted from ECEF to lat/lon in one vectorized pass. Every leg keeps its length, cumulative
+	distance and initial course, and the normal of its great circle as a unit vector, so projecting the aircraft
+	onto the route is a few dot products over all legs at once."""
+
+	def __init__(self, identifiers: Sequence[str], types: Sequence, latitudes: np.ndarray, longitudes: np.ndarray, altitudes: np.ndarray):
+		self.identifiers = list(identifiers)
+		self.types = list(types)
+		self.latitudes = np.asarray(latitudes, dtype=float)
+		self.longitudes = np.asarray(longitudes, dtype=float)
+		self.altitudes = np.asarray(altitudes, dtype=float)
+
+		self._points = self._unit_vectors(self.latitudes, self.longitudes)	# (n, 3) on the unit sphere
+		starts, ends = self._points[:-1], self._points[1:]
+		normals = np.cross(starts, ends)
+		norms = np.linalg.norm(normals, axis=1)
+		self._degenerate = norms < 1e-12	# zero-length legs (origin and departure runway can coincide)
+		self._normals = normals / np.where(self._degenerate, 1.0, norms)[:, None]
+		self._along_axes = np.cross(self._normals, starts)	# in the leg's plane, 90 degrees ahead of the start point
+
+		self.leg_lengths_nm = geodesy.distance_nm(self.latitudes[:-1], self.longitudes[:-1], self.latitudes[1:], self.longitudes[1:])
+		self.leg_courses = geodesy.bearing(self.latitudes[:-1], self.longitudes[:-1], self.latitudes[1:], self.longitudes[1:])
+		self.cumulative_nm = np.concatenate(([0.0], np.cumsum(self.leg_lengths_nm)))	# along-track distance at each waypoint
+		self.total_nm = float(self.cumulative_nm[-1])
+		self._leg_angles = self.leg_lengths_nm / geodesy.KM_TO_NM / geodesy.EARTH_RADIUS_KM	# leg lengths in radians
+
+	@classmethod
+	def from_waypoints(cls, waypoints) -> Optional["RouteGeometry"]:
+		"""Build from mcfparser.MainMcfWaypoint list (navigation["Route"]["Ways"]). None if there are no waypoints."""
+		if not waypoints:
+			return None
+		positions = np.array([w.Position[:3] for w in waypoints], dtype=float)
+		latitudes, longitudes, altitudes = geodesy.ecef_to_lla(positions[:, 0], positions[:, 1], positions[:, 2])
+		return cls([w.Identifier for w in waypoints], [w.type for w in waypoints], latitudes, longitudes, altitudes)
+
+	@staticmethod
+	def _unit_vectors(latitudes, longitudes) -> np.ndarray:
+		lat, lon = np.radians(latitudes), np.radians(longitudes)
+		cos_lat = np.cos(lat)
+		return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+	def __len__(self):
+		return len(self.identifiers)
+
+	def index_of(self, waypointType) -> Optional[int]:
+		"""Index of the first waypoint of the given mcfparser.MissionCheckpointType."""
+		return self.types.index(waypointType) if waypointType in self.types else None
+
+	def project(self, latitude: float, longitude: float) -> Optional[RoutePosition]:
+		"""Project the position onto the nearest leg of the route. None if the route has no legs."""
+		if len(self) < 2:
+			return None
+		lat, lon = math.radians(latitude), math.radians(longitude)
+		cos_lat = math.cos(lat)
+		position = np.array((cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)))
+
+		cross = np.arcsin(np.clip(self._normals @ position, -1.0, 1.0))	# signed angle from each leg's great circle, positive left
+		along = np.arctan2(self._along_axes @ position, self._points[:-1] @ position)	# angle along each leg from its start
+		along = np.where(self._degenerate, 0.0, along)
+		clamped = np.clip(along, 0.0, self._leg_angles)
+		# Angular distance to the nearest point of each leg: beside the leg, or to its nearest end
+		to_start = np.arccos(np.clip(self._points[:-1] @ position, -1.0, 1.0))
+		to_end = np.arccos(np.clip(self._points[1:] @ position, -1.0, 1.0))
+		inside = (along >= 0.0) & (along <= self._leg_angles) & ~self._degenerate
+		distances = np.where(inside, np.abs(cross), np.minimum(to_start, to_end))
+		leg = int(np.argmin(distances))
+
+		radius_nm = geodesy.EARTH_RADIUS_KM * geodesy.KM_TO_NM
+		along_nm = float(self.cumulative_nm[leg] + clamped[leg] * radius_nm)
+		next_index = leg + 1
+		return RoutePosition(
+			leg=leg,
+			cross_track_nm=float(-cross[leg] * radius_nm) if not self._degenerate[leg] else 0.0,
+			along_track_nm=along_nm,
+			distance_to_go_nm=max(self.total_nm - along_nm, 0.0),
+			next_waypoint=self.identifiers[next_index],
+			distance_to_next_nm=float(to_end[leg] * radius_nm),
+			bearing_to_next=geodesy.reference(self.latitudes[next_index], self.longitudes[next_index]).bearing_from(latitude, longitude),
+			leg_course=float(self.leg_courses[leg]),
+		)
+
+	def describe(self) -> str:
+		"""Waypoint list with leg courses and distances, for the flight plan in the AI instructions."""
+		parts = [self.identifiers[0]]
+		for i in range(1, len(self)):
+			parts.append(f"{self.identifiers[i]} ({int(self.leg_courses[i - 1]):03d}, {self.leg_lengths_nm[i - 1]:.0f} nm)")
+		return " - ".join(parts)
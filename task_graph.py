@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+import tracing
+
+
+class TaskGraph:
+	"""Tasks with dependencies, each started on its own thread as soon as the tasks it depends on are done.
+
+	Every task has a Future, so a caller can wait for just the task it needs (wait("prompt")) while the others
+	continue in the background. A task whose dependency failed is not run, its future gets the dependency's exception.
+	Tasks must be added after their dependencies, which also rules out cycles."""
+
+	def __init__(self, name: str):
+		self.name = name
+		self.futures: Dict[str, Future] = {}
+		self._tasks: Dict[str, Tuple[Callable[[], object], Tuple[str, ...]]] = {}
+		self._lock = threading.Lock()
+		self._remaining: Dict[str, int] = {}
+		self._started = False
+		self._transmission = tracing.current_transmission()
+
+	def add(self, name: str, func: Callable[[], object], after: Iterable[str] = ()) -> "TaskGraph":
+		after = tuple(after)
+		if self._started:
+			raise RuntimeError(f"{self.name} already started, cannot add {name}")
+		for dependency in after:
+			if dependency not in self._tasks:
+				raise KeyError(f"Task {name} depends on unknown task {dependency}")
+		self._tasks[name] = (func, after)
+		self.futures[name] = Future()
+		return self
+
+	def start(self) -> "TaskGraph":
+		self._started = True
+		for name, (_, after) in self._tasks.items():
+			self._remaining[name] = len(after)
+		for name, (_, after) in self._tasks.items():
+			if not after:
+				self._run_later(name)
+			for dependency in after:
+				self.futures[dependency].add_done_callback(lambda future, name=name: self._dependency_done(name, future))
+		return self
+
+	def _dependency_done(self, name: str, dependency: Future):
+		error = dependency.exception()
+		if error is not None:
+			with self._lock:
+				future = self.futures[name]
+				if future.done():
+					return # another dependency failed first
+				if future.set_running_or_notify_cancel():
+					future.set_exception(error)
+			return
+		with self._lock:
+			self._remaining[name] -= 1
+			ready = self._remaining[name] == 0
+		if ready:
+			self._run_later(name)
+
+	def _run_later(self, name: str):
+		threading.Thread(target=self._run, args=(name,), name=f"{self.name}-{name}", daemon=True).start()
+
+	def _run(self, name: str):
+		future = self.futures[name]
+		with self._lock:
+			if future.done() or not future.set_running_or_notify_cancel():
+				return
+		tracing.set_transmission(self._transmission)
+		func, _ = self._tasks[name]
+		start = time.perf_counter()
+		try:
+			with tracing.span(name, graph=self.name):
+				result = func()
+		except Exception as e:
+			print(f"{self.name}: task {name} failed: {e}")
+			future.set_exception(e)
+		else:
+			future.set_result(result)
+		finally:
+			metrics.TASK_TIME.observe(time.perf_counter() - start, task=f"{self.name}.{name}")
+
+	def done(self, name: str) -> bool:
+		"""True when the task finished successfully."""
+		future = self.futures[name]
+		return future.done() and not future.cancelled() and future.exception() is None
+
+	def wait(self, name: str, timeout: Optional[float] = None) -> bool:
+		"""Wait for one task, True if it finished successfully within timeout."""
+		wait([self.futures[name]], timeout)
+		return self.done(name)
+
+	def wait_all(self, timeout: Optional[float] = None) -> List[str]:
+		"""Wait for all tasks, return the names of those that did not finish successfully."""
+		wait(list(self.futures.values()), timeout)
+		return [name for name in self.futures if not self.done(name)]
@@ -0,0 +1,210 @@
+import gzip
+import json
+import os
+import struct
+import sys
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import RadioPanel
+from telemetry_source import TelemetrySource, GeneratorSource
+
+
+# Recording file: magic line, then gzip-compressed records of (seconds since start, frame length, raw frame bytes)
+RECORDING_MAGIC = b"FCATCREC1\n"
+_RECORD_HEADER = struct.Struct("<dI")
+
+RECORDINGS_FOLDER = "Recordings"
+
+
+class TelemetryRecorder:
+	"""Writes raw RadioPanel frames with their arrival time into a compressed recording file.
+	Frames identical to the previous one are not stored again."""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.frames = 0
+		self._last = None
+		self._start = time.monotonic()
+		self._file = gzip.open(path, "wb", compresslevel=6)
+		self._file.write(RECORDING_MAGIC)
+
+	def record(self, data: bytes, t: Optional[float] = None):
+		if data == self._last or self._file is None:
+			return
+		if t is None:
+			t = time.monotonic() - self._start
+		self._file.write(_RECORD_HEADER.pack(t, len(data)))
+		self._file.write(data)
+		self._last = data
+		self.frames += 1
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+			print(f"Telemetry recording saved to {self.path} ({self.frames} frames)")
+
+
+class RecordingSource(TelemetrySource):
+	"""Wraps another telemetry source and records every frame read from it."""
+
+	def __init__(self, source: TelemetrySource, path: str):
+		self._source = source
+		self.recorder = TelemetryRecorder(path)
+
+	def open(self) -> bool:
+		return self._source.open()
+
+	def read_frame(self) -> Optional[bytes]:
+		data = self._source.read_frame()
+		if data:
+			self.recorder.record(data)
+		return data
+
+	def close(self):
+		self._source.close()
+		self.recorder.close()
+
+
+def new_recording_path() -> str:
+	os.makedirs(RECORDINGS_FOLDER, exist_ok=True)
+	return os.path.join(RECORDINGS_FOLDER, time.strftime("telemetry_%Y%m%d_%H%M%S.rec.gz"))
+
+
+def read_recording(path: str) -> Iterator[Tuple[float, bytes]]:
+	"""Yield (seconds since recording start, raw frame) from a recording file."""
+	with gzip.open(path, "rb") as f:
+		if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+			raise ValueError(f"{path} is not a telemetry recording")
+		while True:
+			header = f.read(_RECORD_HEADER.size)
+			if len(header) < _RECORD_HEADER.size:
+				return
+			t, length = _RECORD_HEADER.unpack(header)
+			yield t, f.read(length)
+
+
+class VirtualClock:
+	"""Clock driven by the replayed recording instead of wall time."""
+
+	def __init__(self, start: float = 0.0):
+		self.now = start
+
+	def time(self) -> float:
+		return self.now
+
+
+class TelemetryReplayer:
+	"""Feeds a recording through a RadioPanel (change detection, snapshots, history and callbacks).
+
+	speed 1.0 replays in real time, N replays N times faster, 0 replays as fast as possible.
+	Periodic tasks registered with every() run on the virtual clock, in order with the frames."""
+
+	def __init__(self, path: str, speed: float = 1.0):
+		self.path = path
+		self.speed = speed
+		self.clock = VirtualClock()
+		self.source = GeneratorSource(self._frames())
+		self.panel = RadioPanel.RadioPanel(True, self.source)
+		self.panel.clock = self.clock.time
+		self.frames = 0
+		self._timers: List[list] = []	# [interval, next due time, function]
+
+	def every(self, interval: float, func: Callable[[], None]):
+		"""Run func every `interval` seconds of virtual time."""
+		self._timers.append([interval, None, func])
+
+	def _frames(self) -> Iterator[bytes]:
+		first_t = None
+		wall_start = time.perf_counter()
+		for t, data in read_recording(self.path):
+			if first_t is None:
+				first_t = t
+				self.clock.now = t
+				for timer in self._timers:
+					timer[1] = t + timer[0]
+
+			if self.speed > 0:
+				delay = wall_start + (t - first_t) / self.speed - time.perf_counter()
+				if delay > 0:
+					time.sleep(delay)
+
+			# Run periodic tasks that were due before this frame
+			for timer in self._timers:
+				while timer[1] <= t:
+					self.clock.now = timer[1]
+					timer[2]()
+					timer[1] += timer[0]
+
+			self.clock.now = t
+			self.frames += 1
+			yield data
+
+	def run(self) -> dict:
+		"""Replay the whole recording, return statistics."""
+		wall_start = time.perf_counter()
+		start = None
+		while True:
+			self.panel.poll_once()
+			if start is None:
+				start = self.clock.now
+			if self.source.finished:
+				break
+		wall_time = time.perf_counter() - wall_start
+		return {
+			"frames": self.frames,
+			"virtual_seconds": self.clock.now - (start or 0.0),
+			"wall_seconds": wall_time,
+			"frames_decoded": self.panel.framesDecoded,
+			"frames_skipped": self.panel.framesSkipped,
+		}
+
+
+def replay_with_atc_logic(path: str, mcfPath: str, speed: float):
+	"""Replay a recording through ai_atc's flight phase and handoff logic.
+	Messages that would be sent to AI are printed with their virtual time instead."""
+	import ai_atc
+
+	replayer = TelemetryReplayer(path, speed)
+
+	with open("all_airports.json", "r", encoding="utf-8") as f:
+		ai_atc.airports = json.load(f)
+	ai_atc.mcf_path = mcfPath
+	ai_atc.loadAeroflySettings(generateATIS=False)
+
+	ai_atc.radioPanel = replayer.panel
+	ai_atc.sendAutomaticMessage = lambda message: print(f"[{replayer.clock.now:9.1f} s] AI message: {message}")
+	ai_atc.atcSessionActive = True
+	ai_atc.resetFlightPhase()	# attaches the flight phase engine to the replayed panel
+	return replayer.run()
+
+
+def main():
+	if len(sys.argv) < 3 or sys.argv[1] not in ("info", "replay"):
+		print("Usage: python telemetry_recorder.py info <recording>")
+		print("       python telemetry_recorder.py replay <recording> [speed, 0 = as fast as possible] [main.mcf for ATC logic]")
+		return
+
+	path = sys.argv[2]
+	if sys.argv[1] == "info":
+		frames = 0
+		duration = 0.0
+		for t, data in read_recording(path):
+			frames += 1
+			duration = t
+		print(f"{path}: {frames} frames, {duration:.1f} s, {os.path.getsize(path)} bytes")
+		return
+
+	speed = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+	if len(sys.argv) > 4:
+		stats = replay_with_atc_logic(path, sys.argv[4], speed)
+	else:
+		replayer = TelemetryReplayer(path, speed)
+		replayer.panel.add_callback(lambda name, old, new: print(f"[{replayer.clock.now:9.1f} s] {name} changed: {old} to {new}"))
+		stats = replayer.run()
+	print(stats)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,141 @@
+import json
+import mmap
+import os
+import sys
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional, Union
+
+
+# Shared memory written by the FinalCallATC DLL (matches the name and size in C++)
+SHARED_MEMORY_NAME = "Local\\AeroflyFS4Data"
+SHARED_MEMORY_SIZE = 65536
+
+# Environment variable with a path to a file-backed frame buffer (e.g. /dev/shm/AeroflyFS4Data on Linux)
+TELEMETRY_FILE_ENV = "FINALCALLATC_TELEMETRY_FILE"
+POSIX_SHARED_MEMORY_PATH = "/dev/shm/AeroflyFS4Data"
+
+
+def encode_frame(values: dict, timestamp: float) -> bytes:
+	"""Encode game values the same way the DLL does: JSON with the timestamp as the first key."""
+	frame = {"timestamp": timestamp}
+	frame.update(values)
+	return json.dumps(frame, separators=(",", ":")).encode("utf-8")
+
+
+class TelemetrySource(ABC):
+	"""Base class for sources of raw RadioPanel frames.
+	read_frame() returns the JSON bytes of the latest frame (without the null terminator) or None."""
+
+	def open(self) -> bool:
+		return True
+
+	@abstractmethod
+	def read_frame(self) -> Optional[bytes]:
+		pass
+
+	def close(self):
+		pass
+
+
+class _MmapSource(TelemetrySource):
+	_shm = None
+
+	def read_frame(self) -> Optional[bytes]:
+		if self._shm is None:
+			return None
+		null_pos = self._shm.find(b'\x00', 0)
+		if null_pos <= 0:
+			return None
+		return self._shm[:null_pos]
+
+	def close(self):
+		if self._shm is not None:
+			self._shm.close()
+			self._shm = None
+
+
+class WindowsSharedMemorySource(_MmapSource):
+	"""Named file mapping created by the DLL inside Aerofly FS4 (Windows only)."""
+
+	def __init__(self, name: str = SHARED_MEMORY_NAME, size: int = SHARED_MEMORY_SIZE):
+		self.name = name
+		self.size = size
+
+	def open(self) -> bool:
+		try:
+			self._shm = mmap.mmap(-1, self.size, self.name, access=mmap.ACCESS_READ)
+		except FileNotFoundError:
+			print("Shared memory not found. Is the game running with the DLL loaded?")
+			return False
+		return True
+
+
+class MmapFileSource(_MmapSource):
+	"""File-backed frame buffer with the same layout as the DLL's shared memory.
+	Works with POSIX shared memory (/dev/shm) or any regular file, see MmapFileWriter."""
+
+	def __init__(self, path: str = POSIX_SHARED_MEMORY_PATH):
+		self.path = path
+
+	def open(self) -> bool:
+		try:
+			with open(self.path, "rb") as f:
+				self._shm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (FileNotFoundError, ValueError) as e:
+			print(f"Telemetry file {self.path} not available: {e}")
+			return False
+		return True
+
+
+class MmapFileWriter:
+	"""Writes frames into a file-backed buffer read by MmapFileSource. Stand-in for the DLL off Windows."""
+
+	def __init__(self, path: str = POSIX_SHARED_MEMORY_PATH, size: int = SHARED_MEMORY_SIZE):
+		self.path = path
+		self.size = size
+		with open(path, "wb") as f:
+			f.truncate(size)
+		self._file = open(path, "r+b")
+		self._shm = mmap.mmap(self._file.fileno(), size)
+
+	def write_frame(self, frame: Union[bytes, dict], timestamp: float = 0.0):
+		data = frame if isinstance(frame, bytes) else encode_frame(frame, timestamp)
+		if len(data) + 1 > self.size:
+			print(f"Frame of {len(data)} bytes does not fit into the telemetry buffer.")
+			return
+		# Same sequence as the DLL: clear, then copy including the null terminator
+		self._shm[:] = bytes(self.size)
+		self._shm[:len(data) + 1] = data + b'\x00'
+
+	def close(self):
+		self._shm.close()
+		self._file.close()
+
+
+class GeneratorSource(TelemetrySource):
+	"""Feeds frames from an iterable of raw frames (bytes) or (timestamp, values) pairs, one per read.
+	After the iterable is exhausted the last frame is returned again and `finished` is set."""
+
+	def __init__(self, frames: Iterable[Union[bytes, tuple]]):
+		self._frames: Iterator = iter(frames)
+		self._last = None
+		self.finished = False
+
+	def read_frame(self) -> Optional[bytes]:
+		if not self.finished:
+			try:
+				frame = next(self._frames)
+				self._last = frame if isinstance(frame, bytes) else encode_frame(frame[1], frame[0])
+			except StopIteration:
+				self.finished = True
+		return self._last
+
+
+def default_telemetry_source() -> Optional[TelemetrySource]:
+	"""Pick the telemetry source for this platform, or None if there is none."""
+	path = os.environ.get(TELEMETRY_FILE_ENV)
+	if path:
+		return MmapFileSource(path)
+	if sys.platform == "win32":
+		return WindowsSharedMemorySource()
+	return None
@@ -0,0 +1,209 @@
+import atexit
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+# Set to 1 to record spans from the start (same as TRACE_SESSION = True in ai_atc.py)
+TRACE_ENV = "FINALCALLATC_TRACE"
+TRACES_FOLDER = "Traces"
+MAX_TRACE_EVENTS = 500000	# oldest spans are dropped after this, a few hours of a busy session
+
+enabled = os.environ.get(TRACE_ENV, "") not in ("", "0")
+
+_events = deque(maxlen=MAX_TRACE_EVENTS)
+_thread_names = {}
+_local = threading.local()
+_transmission_ids = itertools.count(1)
+_start = time.perf_counter()
+_atexit_registered = False
+
+
+class _NullSpan:
+	"""Returned while tracing is disabled, every operation is a no-op."""
+	transmission = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		return False
+
+	def start(self):
+		return self
+
+	def finish(self, **args):
+		pass
+
+	def set(self, **args):
+		pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+	"""Duration event in Chrome trace-event format. Use as a context manager, or start() and finish() from any thread."""
+	__slots__ = ("name", "args", "begin", "tid", "transmission")
+
+	def __init__(self, name: str, args: dict):
+		self.name = name
+		self.args = args
+		self.begin = 0.0
+		self.tid = 0
+		self.transmission = None
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc, tb):
+		if exc_type is not None:
+			self.args["error"] = exc_type.__name__
+		self.finish()
+		return False
+
+	def start(self):
+		thread = threading.current_thread()
+		self.tid = thread.ident
+		if self.tid not in _thread_names:
+			_thread_names[self.tid] = thread.name
+		self.transmission = current_transmission()
+		self.begin = time.perf_counter()
+		return self
+
+	def finish(self, **args):
+		end = time.perf_counter()
+		self.args.update(args)
+		if self.transmission:
+			self.args["transmission"] = self.transmission
+		_events.append({
+			"name": self.name,
+			"cat": "atc",
+			"ph": "X",
+			"ts": (self.begin - _start) * 1e6,
+			"dur": (end - self.begin) * 1e6,
+			"pid": os.getpid(),
+			"tid": self.tid,
+			"args": self.args,
+		})
+
+	def set(self, **args):
+		self.args.update(args)
+
+
+def span(name: str, **args):
+	"""Context manager timing a block: `with tracing.span("llm", call="atc"):`"""
+	if not enabled:
+		return _NULL_SPAN
+	return Span(name, args)
+
+
+def start_span(name: str, **args):
+	"""Span started now and finished later with finish(), possibly from another thread (e.g. STT finalization, queue wait)."""
+	if not enabled:
+		return _NULL_SPAN
+	return Span(name, args).start()
+
+
+def traced(name: Optional[str] = None):
+	"""Decorator wrapping each call of a function in a span."""
+	def decorator(func: Callable):
+		spanName = name or func.__name__
+
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			with Span(spanName, {}):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def instant(name: str, **args):
+	if not enabled:
+		return
+	thread = threading.current_thread()
+	_thread_names.setdefault(thread.ident, thread.name)
+	transmission = current_transmission()
+	if transmission:
+		args["transmission"] = transmission
+	_events.append({"name": name, "cat": "atc", "ph": "i", "s": "t", "ts": (time.perf_counter() - _start) * 1e6,
+		"pid": os.getpid(), "tid": thread.ident, "args": args})
+
+
+# --- Correlation id per pilot transmission, carried by the thread handling it ---
+
+def start_transmission() -> Optional[int]:
+	"""New correlation id for a pilot transmission (PTT press to ATC reply), set on the calling thread."""
+	if not enabled:
+		return None
+	_local.transmission = next(_transmission_ids)
+	return _local.transmission
+
+
+def set_transmission(transmission: Optional[int]):
+	if enabled:
+		_local.transmission = transmission
+
+
+def current_transmission() -> Optional[int]:
+	return getattr(_local, "transmission", None)
+
+
+def bind(func: Callable) -> Callable:
+	"""Wrap a thread target so it continues the transmission of the thread creating it."""
+	if not enabled:
+		return func
+	transmission = current_transmission()
+
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		_local.transmission = transmission
+		return func(*args, **kwargs)
+	return wrapper
+
+
+# --- Session control and export ---
+
+def enable():
+	global enabled, _atexit_registered
+	enabled = True
+	if not _atexit_registered:
+		atexit.register(dump)
+		_atexit_registered = True
+
+
+def disable():
+	global enabled
+	enabled = False
+
+
+def dump(path: Optional[str] = None, clear: bool = True) -> Optional[str]:
+	"""Write recorded spans as Chrome trace-event JSON (open in ui.perfetto.dev or chrome://tracing)."""
+	if not _events:
+		return None
+	if path is None:
+		os.makedirs(TRACES_FOLDER, exist_ok=True)
+		path = os.path.join(TRACES_FOLDER, time.strftime("trace_%Y%m%d_%H%M%S.json"))
+
+	events = list(_events)
+	if clear:
+		_events.clear()
+	pid = os.getpid()
+	metadata = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "FinalCallATC"}}]
+	metadata += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for tid, name in list(_thread_names.items())]
+
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+	print(f"Trace with {len(events)} events saved to {path}")
+	return path
+
+
+if enabled:
+	enable()